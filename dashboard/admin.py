@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import MinePhase, ProductionRecord, OreSample, PlantDemand, Stockpile, PhaseSchedule, Plant
+from .models import MinePhase, ProductionRecord, OreSample, PlantDemand, Stockpile, PhaseSchedule, Plant, PitDesignFile, SurveySurface, UploadSession, DailyProductionRollup
 
 admin.site.register(MinePhase)
 admin.site.register(ProductionRecord)
@@ -9,5 +9,9 @@ admin.site.register(PlantDemand)
 admin.site.register(Stockpile)
 admin.site.register(PhaseSchedule)
 admin.site.register(Plant)
+admin.site.register(PitDesignFile)
+admin.site.register(SurveySurface)
+admin.site.register(UploadSession)
+admin.site.register(DailyProductionRollup)
 
 # Register your models here.
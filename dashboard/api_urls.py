@@ -4,10 +4,28 @@ from . import views
 urlpatterns = [
     path('minephases/', views.MinePhaseList.as_view(), name='minephase-list'),
     path('production/', views.ProductionRecordList.as_view(), name='production-list'),
+    path('production/daily/', views.daily_production_api, name='production-daily'),
     path('oresamples/', views.OreSampleList.as_view(), name='oresample-list'),
     path('plantdemand/', views.PlantDemandList.as_view(), name='plantdemand-list'),
     path('stockpiles/', views.StockpileList.as_view(), name='stockpile-list'),
     path('phaseschedule/', views.PhaseScheduleList.as_view(), name='phaseschedule-list'),
     path("api/update-expected/<int:phase_id>/", views.update_expected_values, name="update-expected"),
+    path('pit-geometry/', views.pit_geometry_api, name='pit-geometry'),
+    path('pit-geometry/levels/', views.pit_geometry_lod_view, name='pit-geometry-levels'),
+    path('cache-stats/geometry/', views.geometry_cache_stats, name='geometry-cache-stats'),
+    path('grade-tonnage/', views.grade_tonnage_api, name='grade-tonnage'),
+    path('grade-estimate/', views.grade_estimate_api, name='grade-estimate'),
+    path('design-tonnage/', views.design_tonnage_api, name='design-tonnage'),
+    path('survey-volumes/', views.survey_volumes_api, name='survey-volumes'),
+    path('uploads/', views.upload_sessions_api, name='upload-sessions'),
+    path('uploads/<uuid:session_id>/', views.upload_session_api, name='upload-session'),
+    path('uploads/<uuid:session_id>/chunks/<int:index>/', views.upload_chunk_api, name='upload-chunk'),
+    path('uploads/<uuid:session_id>/complete/', views.upload_complete_api, name='upload-complete'),
+    path('sections/vertical/', views.section_api, name='section'),
+    path('sections/bench/', views.bench_plan_api, name='bench-plan'),
+    path('pit-blocks/changes/', views.pit_block_changes_api, name='pit-block-changes'),
+    path('pit-map/progress/', views.pit_progress_figure_api, name='pit-progress-figure'),
+    path('pit-map/design/', views.pit_design_figure_api, name='pit-design-figure'),
+    path('tiles/plan/<int:z>/<int:x>/<int:y>.png', views.plan_tile, name='plan-tile'),
 
 ]
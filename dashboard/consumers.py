@@ -1,19 +1,125 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .utils.live_topics import TOPICS, topic_group
+
+
+class LiveUpdatesConsumer(AsyncWebsocketConsumer):
+    """
+    Live dashboard topics (see utils/live_topics.py). Clients pick topics with
+    ?topics=production,demand or by sending {"subscribe": [...]} / {"unsubscribe": [...]}.
+    Deltas are merged per item key and sent at most once per LIVE_UPDATE_INTERVAL as
+    {"type": "update", "topics": {topic: {"items": [...], "deleted": [...]}}}.
+    """
+    default_topics = ()
+
+    async def connect(self):
+        self.topics = set()
+        self.pending = {}  # topic -> {item key: latest item, or None once deleted}
+        self.flush_task = None
+        self.last_sent = 0.0
+        await self.accept()
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        requested = [t for value in query.get('topics', []) for t in value.split(',') if t]
+        await self.subscribe(requested or self.default_topics)
+
+    async def disconnect(self, close_code):
+        if self.flush_task:
+            self.flush_task.cancel()
+        for topic in self.topics:
+            await self.channel_layer.group_discard(topic_group(topic), self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            msg = json.loads(text_data or '{}')
+            subscribe, unsubscribe = list(msg.get('subscribe', [])), list(msg.get('unsubscribe', []))
+        except (ValueError, AttributeError, TypeError) as e:
+            await self.send(text_data=json.dumps({"type": "error", "error": f"Bad message: {e}"}))
+            return
+        await self.subscribe(subscribe)
+        await self.unsubscribe(unsubscribe)
+
+    async def subscribe(self, topics):
+        known = {t for t in topics if isinstance(t, str) and t in TOPICS}
+        unknown = [str(t) for t in topics if not (isinstance(t, str) and t in TOPICS)]
+        if unknown:
+            await self.send(text_data=json.dumps({"type": "error", "error": f"Unknown topics: {', '.join(unknown)}"}))
+        for topic in known - self.topics:
+            await self.channel_layer.group_add(topic_group(topic), self.channel_name)
+            self.topics.add(topic)
+        if topics:
+            await self.send_subscriptions()
+
+    async def unsubscribe(self, topics):
+        for topic in self.topics & {t for t in topics if isinstance(t, str)}:
+            await self.channel_layer.group_discard(topic_group(topic), self.channel_name)
+            self.topics.discard(topic)
+            self.pending.pop(topic, None)
+        if topics:
+            await self.send_subscriptions()
+
+    async def send_subscriptions(self):
+        await self.send(text_data=json.dumps({"type": "subscribed", "topics": sorted(self.topics)}))
+
+    async def topic_delta(self, event):
+        """Group message from publish(): merge it and make sure a flush is scheduled."""
+        topic = event["topic"]
+        if topic not in self.topics:
+            return
+        key = TOPICS[topic]
+        items = self.pending.setdefault(topic, {})
+        for item in event["items"]:
+            items[item[key]] = item
+        for deleted in event["deleted"]:
+            items[deleted] = None
+
+        if self.flush_task is None:
+            loop = asyncio.get_running_loop()
+            delay = max(0.0, self.last_sent + settings.LIVE_UPDATE_INTERVAL - loop.time())
+            self.flush_task = asyncio.ensure_future(self.flush_after(delay))
+
+    async def flush_after(self, delay):
+        await asyncio.sleep(delay)  # a burst arriving meanwhile lands in the same update
+        self.flush_task = None
+        pending, self.pending = self.pending, {}
+        topics = {
+            topic: {
+                "items": [item for item in items.values() if item is not None],
+                "deleted": [key for key, item in items.items() if item is None],
+            }
+            for topic, items in pending.items() if items
+        }
+        if topics:
+            self.last_sent = asyncio.get_running_loop().time()
+            await self.send(text_data=json.dumps({"type": "update", "topics": topics}))
+
+
+class ProdDemandConsumer(LiveUpdatesConsumer):
+    """ws/prod-demand/: the production and demand topics."""
+    default_topics = ('production', 'demand')
+
 
-class ProdDemandConsumer(AsyncWebsocketConsumer):
+class PitBlockConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes PitBlock deltas (id, status, removed tonnage, version) to map clients.
+    Clients that reconnect catch up with /api/pit-blocks/changes/?since=<last version>.
+    """
     async def connect(self):
-        self.group_name = "prod_demand"
+        self.group_name = "pit_blocks"
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-    # Receive message from group
-    async def broadcast_update(self, event):
-        # event['payload'] expected to be JSON-serializable
+    async def block_change(self, event):
         await self.send(text_data=json.dumps({
-            "type": "update",
-            "payload": event["payload"]
+            "type": "block_change",
+            "blocks": [event["data"]],
+            "version": event["data"]["version"],
         }))
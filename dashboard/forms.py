@@ -119,7 +119,8 @@ class OreSampleForm(forms.ModelForm):
         fields = [
             'mine_phase', 'sample_id',
             'actual_grade_g_t', 'actual_tonnage',
-            'expected_grade', 'expected_tonnage'
+            'expected_grade', 'expected_tonnage',
+            'x', 'y', 'z',
         ]
         widgets = { 
             'timestamp': forms.DateTimeInput(attrs={'type': 'datetime-local'})
@@ -218,6 +219,53 @@ class BlockModelUploadForm(forms.Form):
         required=False
     )
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """FileField that accepts several files from one <input multiple>."""
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput(attrs={'class': 'form-control'}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(d, initial) for d in data]
+        return [single_file_clean(data, initial)]
+
+
+class DesignFilesUploadForm(forms.Form):
+    """Several pushback / pit shell .str files for one pit (and optionally one phase)."""
+    pit = forms.CharField(
+        max_length=100,
+        label="Pit",
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Main Pit'})
+    )
+    mine_phase = forms.ModelChoiceField(
+        queryset=MinePhase.objects.all(),
+        required=False,
+        label="Mine Phase",
+        empty_label="Whole pit (no phase)",
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    design_files = MultipleFileField(
+        label="Design Files (.str)",
+        help_text="Select one or more Surpac string files"
+    )
+
+class SurveyUploadForm(forms.Form):
+    """One end-of-period survey pickup (.str), differenced against the previous survey."""
+    survey_date = forms.DateField(
+        label="Survey Date",
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    survey_file = forms.FileField(
+        label="Survey Strings (.str)",
+        help_text="Surpac string file of the surface as surveyed at the end of the period"
+    )
+
 class PitAliasForm(forms.ModelForm):
     class Meta:
         model = MinePhase
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.models import ProductionRecord
+from dashboard.utils.production_rollup import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the DailyProductionRollup table from the ProductionRecords (all phases, or one)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phase', type=int, help="Only this MinePhase id.")
+
+    def handle(self, *args, **options):
+        records = ProductionRecord.objects.all()
+        if options['phase'] is not None:
+            records = records.filter(mine_phase_id=options['phase'])
+
+        start = time.perf_counter()
+        rows = rebuild_rollup(mine_phase_id=options['phase'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{rows:,} rollup rows from {records.count():,} production records in {time.perf_counter() - start:.1f}s"
+        ))
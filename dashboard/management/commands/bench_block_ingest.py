@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dashboard.utils.block_store import parse_block_csv, parse_block_csv_chunked
+
+
+def write_synthetic_blocks(path, n_rows, seed=0, batch=500_000):
+    """Writes a fake ore block export (Y, X, Z, AU_OK, density) in batches."""
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        f.write("Y,X,Z,AU_OK,density\n")
+        for start in range(0, n_rows, batch):
+            n = min(batch, n_rows - start)
+            table = np.column_stack([
+                8099400.0 + rng.uniform(-500, 500, n),
+                221800.0 + rng.uniform(-500, 500, n),
+                rng.uniform(800, 1000, n),
+                rng.lognormal(0, 1, n),
+                np.full(n, 2.7),
+            ])
+            np.savetxt(f, table, fmt=['%.2f', '%.2f', '%.2f', '%.3f', '%.2f'], delimiter=',')
+
+
+class Command(BaseCommand):
+    help = "Benchmarks block CSV parsing: single process vs chunked process pool, on synthetic files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 5_000_000, 10_000_000])
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-mb', type=int, default=32)
+
+    def handle(self, *args, **options):
+        os.makedirs(settings.DATA_CACHE_DIR, exist_ok=True)
+        self.stdout.write(f"CPUs: {os.cpu_count()} | workers: {options['workers']} | chunk: {options['chunk_mb']} MB")
+
+        for n in options['rows']:
+            with tempfile.TemporaryDirectory(dir=settings.DATA_CACHE_DIR) as tmp:
+                path = os.path.join(tmp, 'blocks.csv')
+                write_synthetic_blocks(path, n)
+                size_mb = os.path.getsize(path) / 1e6
+
+                start = time.perf_counter()
+                parse_block_csv(path)
+                single = time.perf_counter() - start
+
+                scratch = os.path.join(tmp, 'chunks')
+                os.makedirs(scratch)
+                start = time.perf_counter()
+                parse_block_csv_chunked(path, 1, scratch, workers=options['workers'],
+                                        chunk_bytes=options['chunk_mb'] * 1024 * 1024)
+                chunked = time.perf_counter() - start
+                shutil.rmtree(scratch, ignore_errors=True)
+
+                self.stdout.write(
+                    f"{n:>11,} rows ({size_mb:7.1f} MB): "
+                    f"single {single:7.2f}s ({n / single / 1e6:5.2f} M rows/s, {size_mb / single:6.1f} MB/s) | "
+                    f"chunked {chunked:7.2f}s ({n / chunked / 1e6:5.2f} M rows/s, {size_mb / chunked:6.1f} MB/s) | "
+                    f"x{single / chunked:4.1f}"
+                )
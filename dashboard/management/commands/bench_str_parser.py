@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from dashboard.utils.str_parser import parse_str_file, read_str_geometry
+
+
+def write_synthetic_str(path, n_vertices, points_per_string=400, seed=0):
+    """
+    Writes a fake Surpac pit design: stacked elliptical bench contours,
+    one string ID per bench, each closed by a '0' row.
+    """
+    rng = np.random.default_rng(seed)
+    n_strings = max(1, n_vertices // points_per_string)
+    angles = np.linspace(0, 2 * np.pi, points_per_string)
+
+    with open(path, 'w') as f:
+        f.write("synthetic pit,01-Jan-26,,SSI_STYLES:styles.ssi\n")
+        f.write("0,           0.000,           0.000,           0.000,           0.000,           0.000,           0.000\n")
+        for i in range(n_strings):
+            radius = 50.0 + 2.0 * i
+            z = 1000.0 - 5.0 * (i % 60)
+            ys = 8099400.0 + radius * np.sin(angles) + rng.normal(0, 0.2, points_per_string)
+            xs = 221800.0 + 1.4 * radius * np.cos(angles) + rng.normal(0, 0.2, points_per_string)
+            sid = i % 200 + 1
+            f.writelines(f"{sid}, {y:.3f}, {x:.3f}, {z:.3f}, \n" for y, x in zip(ys, xs))
+            f.write("0, 0.000, 0.000, 0.000,\n")
+        f.write("0, 0.000, 0.000, 0.000, END\n")
+
+
+class Command(BaseCommand):
+    help = "Benchmarks read_str_geometry() against the legacy parse_str_file() on synthetic STR files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vertices', type=int, nargs='+', default=[100_000, 500_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        for n in options['vertices']:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.str')
+                write_synthetic_str(path, n)
+                size_mb = os.path.getsize(path) / 1e6
+
+                legacy = min(self._time(parse_str_file, path) for _ in range(options['repeat']))
+                columnar = min(self._time(read_str_geometry, path) for _ in range(options['repeat']))
+
+                self.stdout.write(
+                    f"{n:>10,} vertices ({size_mb:6.1f} MB): "
+                    f"legacy {legacy:7.3f}s | columnar {columnar:7.3f}s | "
+                    f"speed-up x{legacy / columnar:4.1f}"
+                )
+
+    @staticmethod
+    def _time(func, path):
+        start = time.perf_counter()
+        func(path)
+        return time.perf_counter() - start
@@ -0,0 +1,32 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.utils.datasets import data_path
+from dashboard.utils.plan_tiles import clear_plan_tiles, prerender_tiles
+
+
+class Command(BaseCommand):
+    help = "Renders the plan view PNG tile pyramid for the current pit design in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-zoom', type=int, default=settings.PLAN_TILE_PRERENDER_ZOOM)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--clear', action='store_true', help="Drop every cached tile first.")
+
+    def handle(self, *args, **options):
+        str_path = data_path('pit_design.str')
+        if not os.path.exists(str_path):
+            raise CommandError(f"STR file not found at {str_path}")
+        if options['max_zoom'] > settings.PLAN_TILE_MAX_ZOOM:
+            raise CommandError(f"--max-zoom is limited to PLAN_TILE_MAX_ZOOM ({settings.PLAN_TILE_MAX_ZOOM})")
+
+        if options['clear']:
+            clear_plan_tiles()
+        start = time.perf_counter()
+        rendered = prerender_tiles(str_path, options['max_zoom'], options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{rendered} tiles rendered up to zoom {options['max_zoom']} in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.utils.datasets import activate_dataset, list_versions, rollback_dataset
+
+
+class Command(BaseCommand):
+    help = "Lists the uploaded dataset versions (pit design + block model), rolls back to one or rebuilds its caches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rollback', metavar='VERSION', help="Make this version current again.")
+        parser.add_argument('--activate', action='store_true',
+                            help="Rebuild the caches of the current dataset (geometry, plan tiles, block store).")
+
+    def handle(self, *args, **options):
+        if options['activate']:
+            try:
+                store = activate_dataset()
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Block store: {len(store):,} blocks" if store else "No block model files"))
+            return
+
+        if options['rollback']:
+            try:
+                manifest = rollback_dataset(options['rollback'])
+                activate_dataset()
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Current dataset: {manifest['version']}"))
+            return
+
+        versions = list_versions()
+        if not versions:
+            self.stdout.write("No versioned uploads yet (using the files in PIT_DATA_DIR).")
+        for v in versions:
+            marker = '*' if v['current'] else ' '
+            self.stdout.write(f"{marker} {v['version']}  {', '.join(v['files'])}")
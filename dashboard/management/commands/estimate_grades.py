@@ -0,0 +1,34 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.utils.block_store import BlockModelError, load_block_store
+from dashboard.utils.datasets import data_path
+from dashboard.utils.grade_estimation import update_grade_estimate
+
+
+class Command(BaseCommand):
+    help = "Updates the inverse-distance grade estimate of the block model from located OreSamples."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Re-estimate every block, not only those near new samples.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        try:
+            blocks = load_block_store(
+                data_path('ore_blocks.csv'),
+                data_path('waste_blocks.csv'),
+            )
+        except BlockModelError as e:
+            raise CommandError(str(e))
+        if not blocks:
+            raise CommandError("No block model uploaded")
+
+        start = time.perf_counter()
+        result = update_grade_estimate(blocks, full=options['full'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['mode']}: {result['blocks_updated']:,} of {len(blocks):,} blocks from "
+            f"{result['samples']} samples in {time.perf_counter() - start:.1f}s"
+        ))
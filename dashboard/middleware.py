@@ -0,0 +1,12 @@
+from dashboard.utils.datasets import pinned_version
+
+
+class DatasetVersionMiddleware:
+    """Resolves the current dataset version once per request (see datasets.pinned_version)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with pinned_version():
+            return self.get_response(request)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PitDesignFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pit', models.CharField(max_length=100)),
+                ('name', models.CharField(help_text='Original file name', max_length=200)),
+                ('file_path', models.CharField(max_length=500)),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+                ('mine_phase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='design_files', to='dashboard.minephase')),
+            ],
+            options={
+                'ordering': ['pit', 'mine_phase__sequence_order', 'name'],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_pitdesignfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PitBlockChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('removed_tonnage', models.FloatField(default=0)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+                ('block', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='dashboard.pitblock')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
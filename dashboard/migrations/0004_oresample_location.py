@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_pitblockchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oresample',
+            name='x',
+            field=models.FloatField(blank=True, help_text='Easting', null=True),
+        ),
+        migrations.AddField(
+            model_name='oresample',
+            name='y',
+            field=models.FloatField(blank=True, help_text='Northing', null=True),
+        ),
+        migrations.AddField(
+            model_name='oresample',
+            name='z',
+            field=models.FloatField(blank=True, help_text='Elevation', null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_oresample_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SurveySurface',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Original file name', max_length=200)),
+                ('survey_date', models.DateField()),
+                ('file_path', models.CharField(max_length=500)),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['survey_date', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='phaseschedule',
+            name='surveyed_at',
+            field=models.DateField(blank=True, help_text='Date of the latest survey included', null=True),
+        ),
+        migrations.AddField(
+            model_name='phaseschedule',
+            name='surveyed_tonnage',
+            field=models.FloatField(default=0, help_text='Mined tonnes measured from survey surfaces'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:38
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_survey_surfaces'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target', models.CharField(choices=[('pit_design.str', 'Pit design (.str)'), ('ore_blocks.csv', 'Ore blocks (.csv)'), ('waste_blocks.csv', 'Waste blocks (.csv)')], max_length=50)),
+                ('file_name', models.CharField(help_text='Original file name', max_length=255)),
+                ('total_size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('sha256', models.CharField(blank=True, help_text='Expected SHA-256 of the whole file (optional)', max_length=64)),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('queued', 'Queued'), ('ingesting', 'Ingesting'), ('done', 'Done'), ('failed', 'Failed')], default='uploading', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('dataset_version', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:39
+
+from django.db import migrations, models
+
+
+def backfill_phase_totals(apps, schema_editor):
+    """Fills removed / ore / waste tonnage of every schedule from its production records."""
+    PhaseSchedule = apps.get_model('dashboard', 'PhaseSchedule')
+    ProductionRecord = apps.get_model('dashboard', 'ProductionRecord')
+    totals = ProductionRecord.objects.values('mine_phase_id').annotate(
+        removed=models.Sum('tonnage'),
+        ore=models.Sum('tonnage', filter=models.Q(material_type='ore')),
+        waste=models.Sum('tonnage', filter=models.Q(material_type='waste')),
+    )
+    for row in totals:
+        PhaseSchedule.objects.filter(mine_phase_id=row['mine_phase_id']).update(
+            removed_tonnage=row['removed'] or 0, ore_tonnage=row['ore'] or 0, waste_tonnage=row['waste'] or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='phaseschedule',
+            name='ore_tonnage',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='phaseschedule',
+            name='waste_tonnage',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_phase_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_rollup(apps, schema_editor):
+    """One rollup row per (day, phase, plant, material) from the production records."""
+    ProductionRecord = apps.get_model('dashboard', 'ProductionRecord')
+    DailyProductionRollup = apps.get_model('dashboard', 'DailyProductionRollup')
+    gap = Coalesce(models.F('mine_phase__expected_grade'), models.Value(0.0)) - Coalesce(models.F('grade'), models.Value(0.0))
+    groups = (
+        ProductionRecord.objects.annotate(grade_gap=gap)
+        .values('mine_phase_id', 'plant_id', 'material_type', day=TruncDate('timestamp'))
+        .annotate(
+            sum_record_count=models.Count('id'),
+            sum_tonnage=models.Sum('tonnage'),
+            sum_expected_tonnage=models.Sum('expected_tonnage'),
+            sum_metal=models.Sum(models.F('tonnage') * models.F('grade'), output_field=models.FloatField()),
+            sum_graded_tonnage=models.Sum('tonnage', filter=models.Q(grade__isnull=False)),
+            sum_expected_metal=models.Sum(models.F('tonnage') * models.F('mine_phase__expected_grade'), output_field=models.FloatField()),
+            sum_loss_grams=models.Sum(models.Case(
+                models.When(material_type='ore', grade_gap__gt=0, tonnage__gt=0, then=models.F('grade_gap') * models.F('tonnage')),
+                default=models.Value(0.0), output_field=models.FloatField(),
+            )),
+        )
+        .order_by()
+    )
+    fields = ('record_count', 'tonnage', 'expected_tonnage', 'metal', 'graded_tonnage', 'expected_metal', 'loss_grams')
+    DailyProductionRollup.objects.bulk_create([
+        DailyProductionRollup(
+            day=g['day'], mine_phase_id=g['mine_phase_id'], plant_id=g['plant_id'], material_type=g['material_type'],
+            **{name: g[f'sum_{name}'] or 0 for name in fields},
+        )
+        for g in groups
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_phase_material_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProductionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('material_type', models.CharField(max_length=20)),
+                ('record_count', models.IntegerField(default=0)),
+                ('tonnage', models.FloatField(default=0)),
+                ('expected_tonnage', models.FloatField(default=0, help_text="Sum of the records' planned tonnage")),
+                ('metal', models.FloatField(default=0, help_text='Grams in graded tonnes (tonnage x grade)')),
+                ('graded_tonnage', models.FloatField(default=0, help_text='Tonnes that have a grade')),
+                ('expected_metal', models.FloatField(default=0, help_text="Tonnage x the phase's expected grade (g)")),
+                ('loss_grams', models.FloatField(default=0, help_text="Ore grams short of the phase's expected grade")),
+                ('mine_phase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='dashboard.minephase')),
+                ('plant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='dashboard.plant')),
+            ],
+            options={
+                'ordering': ['day', 'mine_phase', 'plant', 'material_type'],
+                'indexes': [models.Index(fields=['material_type', 'day'], name='dashboard_d_materia_c8f8eb_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'mine_phase', 'plant', 'material_type'), name='unique_daily_production_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.conf import settings
 
 # ==========================================
@@ -26,6 +29,16 @@ class MinePhase(models.Model):
     class Meta:
         ordering = ['sequence_order']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stored_values()
+        return instance
+
+    def remember_stored_values(self):
+        """Keeps the expected grade as stored: the daily rollup only needs rebuilding when it changes."""
+        self._stored_expected_grade = self.__dict__.get('expected_grade', models.DEFERRED)
+
     def __str__(self):
         return f"{self.pit} - Phase {self.phase_number}"
 
@@ -61,6 +74,25 @@ class OreSample(models.Model):
     actual_tonnage = models.FloatField(default=0.0, help_text="Tonnage in tons")
     expected_grade = models.FloatField()
     expected_tonnage = models.FloatField()
+    # Optional collar / sample location (same grid as the block model), used for grade estimation
+    x = models.FloatField(null=True, blank=True, help_text="Easting")
+    y = models.FloatField(null=True, blank=True, help_text="Northing")
+    z = models.FloatField(null=True, blank=True, help_text="Elevation")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stored_values()
+        return instance
+
+    def remember_stored_values(self):
+        """Whether the sample is located as stored: editing a located sample changes the grade estimate."""
+        loaded = self.__dict__
+        self._stored_located = self.has_location if all(name in loaded for name in ('x', 'y', 'z')) else None
+
+    @property
+    def has_location(self):
+        return self.x is not None and self.y is not None and self.z is not None
 
     @property
     def variance_grade(self):
@@ -136,6 +168,30 @@ class ProductionRecord(models.Model):
     class Meta:
         ordering = ['-timestamp']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stored_values()
+        return instance
+
+    def remember_stored_values(self):
+        """
+        Keeps the phase and daily rollup key as stored, so a later save also
+        refreshes the phase totals and rollup row the record is moving out of.
+        """
+        loaded = self.__dict__
+        self._stored_phase_id = loaded.get('mine_phase_id')
+        if all(name in loaded for name in ('timestamp', 'mine_phase_id', 'plant_id', 'material_type')):
+            self._stored_rollup_key = self.rollup_key()
+        else:
+            self._stored_rollup_key = None
+
+    def rollup_key(self):
+        """(day, phase id, plant id, material) of the DailyProductionRollup row this record counts in."""
+        timestamp = self._meta.get_field('timestamp').to_python(self.timestamp)  # may still be a string before a refresh
+        day = timezone.localdate(timestamp) if timezone.is_aware(timestamp) else timestamp.date()
+        return (day, self.mine_phase_id, self.plant_id, self.material_type)
+
     def save(self, *args, **kwargs):
         """Auto-calculate variance and status."""
         if self.expected_tonnage is not None:
@@ -226,6 +282,8 @@ class PhaseSchedule(models.Model):
     planned_end = models.DateField(null=True, blank=True)
     planned_tonnage = models.FloatField(default=0)
     removed_tonnage = models.FloatField(default=0)
+    ore_tonnage = models.FloatField(default=0)
+    waste_tonnage = models.FloatField(default=0)
     current_progress = models.FloatField(default=0)
     status = models.CharField(
         max_length=20,
@@ -233,20 +291,35 @@ class PhaseSchedule(models.Model):
         default='planned'
     )
 
+    surveyed_tonnage = models.FloatField(default=0, help_text="Mined tonnes measured from survey surfaces")
+    surveyed_at = models.DateField(null=True, blank=True, help_text="Date of the latest survey included")
+
     def update_removed_tonnage(self):
-        total_removed = (self.mine_phase.production_records.aggregate(models.Sum('tonnage'))['tonnage__sum'] or 0)
-        self.removed_tonnage = total_removed
+        """Full recount of the removed / ore / waste totals from the production records (one query)."""
+        totals = self.mine_phase.production_records.aggregate(
+            removed=models.Sum('tonnage'),
+            ore=models.Sum('tonnage', filter=models.Q(material_type='ore')),
+            waste=models.Sum('tonnage', filter=models.Q(material_type='waste')),
+        )
+        self.removed_tonnage = totals['removed'] or 0
+        self.ore_tonnage = totals['ore'] or 0
+        self.waste_tonnage = totals['waste'] or 0
         self.current_progress = self.progress_percent()
         self.update_status()
         self.save()
 
+    @property
+    def measured_tonnage(self):
+        """Surveyed tonnes once the phase has been surveyed, otherwise the production records total."""
+        return self.surveyed_tonnage if self.surveyed_at else self.removed_tonnage
+
     def progress_percent(self):
         if self.planned_tonnage <= 0: return 0
-        return round(min(100, (self.removed_tonnage / self.planned_tonnage) * 100), 1)
+        return round(min(100, (self.measured_tonnage / self.planned_tonnage) * 100), 1)
 
     def update_status(self):
         # FIX: Check raw tonnage first, not the rounded percentage
-        if self.removed_tonnage > 0 and self.current_progress < 100:
+        if self.measured_tonnage > 0 and self.current_progress < 100:
             self.status = 'active'  # It switches to Active the moment you move 1 tonne
         elif self.current_progress >= 100:
             self.status = 'completed'
@@ -365,6 +438,32 @@ class PitBlock(models.Model):
         return self.block_id
 
 
+class PitBlockChange(models.Model):
+    """
+    Delta feed for map clients: one row per PitBlock save (see signals.py).
+    The auto id doubles as the feed version, so "changes since N" is id > N.
+    """
+    block = models.ForeignKey(PitBlock, on_delete=models.CASCADE, related_name='changes')
+    status = models.CharField(max_length=20)
+    removed_tonnage = models.FloatField(default=0)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"v{self.id}: {self.block.block_id} -> {self.status}"
+
+    def as_delta(self):
+        return {
+            'version': self.id,
+            'id': self.block_id,
+            'block_id': self.block.block_id,
+            'status': self.status,
+            'removed_tonnage': self.removed_tonnage,
+        }
+
+
 class DailyProductionLog(models.Model):
     """History: Keeps a record every time you click 'Add Production'."""
     block = models.ForeignKey(PitBlock, on_delete=models.CASCADE, related_name='logs')
@@ -429,4 +528,113 @@ class StockpileState(models.Model):
     grade = models.FloatField(default=0)
 
     def __str__(self):
-        return f"Stockpile P{self.physical_schedule.period}: {self.mass:.0f}t"
\ No newline at end of file
+        return f"Stockpile P{self.physical_schedule.period}: {self.mass:.0f}t"
+
+class PitDesignFile(models.Model):
+    """
+    One Surpac .str design file (pit shell or pushback) tagged with its pit and phase.
+    Many files per pit / phase are merged into one geometry store for the pit map.
+    """
+    pit = models.CharField(max_length=100)
+    mine_phase = models.ForeignKey(MinePhase, on_delete=models.CASCADE, related_name='design_files', null=True, blank=True)
+    name = models.CharField(max_length=200, help_text="Original file name")
+    file_path = models.CharField(max_length=500)
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['pit', 'mine_phase__sequence_order', 'name']
+
+    def __str__(self):
+        return f"{self.pit} / {self.mine_phase or 'Whole pit'} - {self.name}"
+
+
+class SurveySurface(models.Model):
+    """
+    End-of-period survey pickup (.str). Consecutive surfaces are differenced
+    to measure the volume mined in each period.
+    """
+    name = models.CharField(max_length=200, help_text="Original file name")
+    survey_date = models.DateField()
+    file_path = models.CharField(max_length=500)
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['survey_date', 'id']
+
+    def __str__(self):
+        return f"{self.survey_date} - {self.name}"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable, chunked upload of one dataset file (pit design or block CSV).
+    Chunks land in a staging file; once complete the file is ingested in the background.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('queued', 'Queued'),
+        ('ingesting', 'Ingesting'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    TARGET_CHOICES = [
+        ('pit_design.str', 'Pit design (.str)'),
+        ('ore_blocks.csv', 'Ore blocks (.csv)'),
+        ('waste_blocks.csv', 'Waste blocks (.csv)'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    target = models.CharField(max_length=50, choices=TARGET_CHOICES)
+    file_name = models.CharField(max_length=255, help_text="Original file name")
+    total_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Expected SHA-256 of the whole file (optional)")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    error = models.TextField(blank=True)
+    dataset_version = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def chunk_length(self, index):
+        """Expected byte length of chunk 'index' (the last one may be short)."""
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+    def __str__(self):
+        return f"{self.file_name} -> {self.target} ({self.status})"
+
+
+class DailyProductionRollup(models.Model):
+    """
+    ProductionRecord totals per day, phase, plant and material, kept current on
+    every write (see utils/production_rollup.py). Dashboards read these rows
+    instead of scanning the records.
+    """
+    day = models.DateField()
+    mine_phase = models.ForeignKey('MinePhase', on_delete=models.CASCADE, related_name='daily_rollups')
+    plant = models.ForeignKey('Plant', on_delete=models.CASCADE, related_name='daily_rollups', null=True, blank=True)
+    material_type = models.CharField(max_length=20)
+
+    record_count = models.IntegerField(default=0)
+    tonnage = models.FloatField(default=0)
+    expected_tonnage = models.FloatField(default=0, help_text="Sum of the records' planned tonnage")
+    metal = models.FloatField(default=0, help_text="Grams in graded tonnes (tonnage x grade)")
+    graded_tonnage = models.FloatField(default=0, help_text="Tonnes that have a grade")
+    expected_metal = models.FloatField(default=0, help_text="Tonnage x the phase's expected grade (g)")
+    loss_grams = models.FloatField(default=0, help_text="Ore grams short of the phase's expected grade")
+
+    class Meta:
+        ordering = ['day', 'mine_phase', 'plant', 'material_type']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'mine_phase', 'plant', 'material_type'], name='unique_daily_production_rollup'),
+        ]
+        indexes = [models.Index(fields=['material_type', 'day'])]
+
+    def __str__(self):
+        return f"{self.day} {self.mine_phase_id}/{self.plant_id} {self.material_type}: {self.tonnage}t"
@@ -2,5 +2,7 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    re_path(r'ws/live/$', consumers.LiveUpdatesConsumer.as_asgi()),
     re_path(r'ws/prod-demand/$', consumers.ProdDemandConsumer.as_asgi()),
+    re_path(r'ws/pit-blocks/$', consumers.PitBlockConsumer.as_asgi()),
 ]
@@ -29,7 +29,7 @@ class StockpileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Stockpile
-        fields = ['name', 'current_tonnage', 'timestamp']
+        fields = ['id', 'name', 'current_tonnage', 'timestamp']
 
 class PhaseScheduleSerializer(serializers.ModelSerializer):
     mine_phase = MinePhaseSerializer()  # nested
@@ -1,38 +1,125 @@
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import ProductionRecord, PhaseSchedule
+from .models import ProductionRecord, PhaseSchedule, PitBlock, PitBlockChange, OreSample, MinePhase, PlantDemand, Stockpile, PitDesignFile
+from .utils.design_store import write_design_entries
+from .utils.grade_estimation import schedule_grade_estimate
+from .utils.plan_tiles import invalidate_block_tiles
+from .utils.production_batch import record_production_change
+from .utils.production_rollup import rebuild_rollup
 
-# WebSocket broadcasting
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+# WebSocket broadcasting (sent once the transaction commits)
+from .utils.broadcast import send_to_group
+from .utils.live_topics import publish_instance
 
 @receiver(post_save, sender=ProductionRecord)
-def update_phase_schedule_on_production(sender, instance, created, **kwargs):
-    phase = instance.mine_phase
-
-    # Update schedule if the related PhaseSchedule exists
-    try:
-        schedule = PhaseSchedule.objects.get(mine_phase=phase)
-        schedule.update_removed_tonnage()  #existing method
-    except PhaseSchedule.DoesNotExist:
-        print(f"No schedule found for phase: {phase}")
-    
-    # Broadcast real-time update ONLY if it's a new record
+def update_phase_schedule_on_production(sender, instance, created, using, **kwargs):
+    """
+    Phase totals, rollup rows and the broadcast are batched per transaction
+    and run once on commit (see utils/production_batch.py).
+    """
+    record_production_change(instance, using=using)
+    instance.remember_stored_values()
+
+
+@receiver(post_delete, sender=ProductionRecord)
+def update_phase_schedule_on_production_delete(sender, instance, using, **kwargs):
+    record_production_change(instance, using=using)
+
+
+@receiver(post_save, sender=MinePhase)
+def rebuild_phase_rollup(sender, instance, created, update_fields, **kwargs):
+    """Expected metal and grade loss in the rollup use the phase's expected grade."""
+    saved = 'expected_grade' not in instance.get_deferred_fields() and (update_fields is None or 'expected_grade' in update_fields)
+    stored = getattr(instance, '_stored_expected_grade', models.DEFERRED)  # DEFERRED: not known, rebuild
+    if not created and saved and stored != instance.expected_grade:
+        rebuild_rollup(mine_phase_id=instance.pk)
+    instance.remember_stored_values()
+
+
+@receiver(post_save, sender=PhaseSchedule)
+def count_existing_production(sender, instance, created, **kwargs):
+    """A new schedule starts from the production already recorded against its phase."""
     if created:
-        try:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "production_updates",  # Group name (WebSocket subscribers)
-                {
-                    "type": "production_update",
-                    "data": {
-                        "id": instance.id,
-                        "phase": str(phase),
-                        "timestamp": instance.timestamp.isoformat(),
-                        "tonnage": instance.tonnage,
-                    }
-                }
-            )
-            print("Production update broadcasted 🚀")
-        except Exception as e:
-            print(f"WebSocket broadcast failed: {e}")
+        instance.update_removed_tonnage()
+
+
+# Live dashboard topics (ws/live/): the changed row, as its REST endpoint renders it
+@receiver(post_save, sender=PhaseSchedule)
+def push_phase_progress(sender, instance, **kwargs):
+    publish_instance('phase_progress', instance)
+
+
+@receiver(post_delete, sender=PhaseSchedule)
+def push_phase_progress_delete(sender, instance, **kwargs):
+    publish_instance('phase_progress', instance, deleted=True)
+
+
+@receiver(post_save, sender=PlantDemand)
+def push_demand(sender, instance, **kwargs):
+    publish_instance('demand', instance)
+
+
+@receiver(post_delete, sender=PlantDemand)
+def push_demand_delete(sender, instance, **kwargs):
+    publish_instance('demand', instance, deleted=True)
+
+
+@receiver(post_save, sender=Stockpile)
+def push_stockpile(sender, instance, **kwargs):
+    publish_instance('stockpile', instance)
+
+
+@receiver(post_delete, sender=Stockpile)
+def push_stockpile_delete(sender, instance, **kwargs):
+    publish_instance('stockpile', instance, deleted=True)
+
+
+@receiver(post_save, sender=PitBlock)
+def record_pit_block_change(sender, instance, **kwargs):
+    """Logs the new block state as a versioned delta and pushes it to map clients."""
+    change = PitBlockChange.objects.create(
+        block=instance,
+        status=instance.status,
+        removed_tonnage=instance.removed_tonnage or 0,
+    )
+    # Only the plan tiles under this block, once the change is committed (they re-render from the DB)
+    x, y = instance.x_position, instance.y_position
+    transaction.on_commit(lambda: invalidate_block_tiles(x, y), using=kwargs.get('using'))
+
+    send_to_group(
+        "pit_blocks",  # Map clients (PitBlockConsumer)
+        {
+            "type": "block_change",
+            "data": change.as_delta(),
+        }
+    )
+
+
+@receiver(post_save, sender=OreSample)
+def estimate_grades_on_sample(sender, instance, created, **kwargs):
+    """
+    New located sample -> re-estimate only the blocks within range of it.
+    An edited sample that is or was located may have moved, changed grade or
+    lost its location, so the whole estimate is redone. Runs after commit, in
+    the background (see schedule_grade_estimate).
+    """
+    was_located = False if created else getattr(instance, '_stored_located', None) is not False
+    if instance.has_location or was_located:
+        full = not created
+        transaction.on_commit(lambda: schedule_grade_estimate(full=full))
+    instance.remember_stored_values()
+
+
+@receiver(post_delete, sender=OreSample)
+def estimate_grades_on_sample_delete(sender, instance, **kwargs):
+    if instance.has_location or getattr(instance, '_stored_located', None):
+        transaction.on_commit(lambda: schedule_grade_estimate(full=True))
+
+
+@receiver(post_save, sender=PitDesignFile)
+@receiver(post_delete, sender=PitDesignFile)
+@receiver(post_save, sender=MinePhase)  # phase names and order are part of the design file list
+def refresh_design_entries(sender, **kwargs):
+    """Rewrites the design file list read by load_design_store(), once the change is committed."""
+    transaction.on_commit(write_design_entries, using=kwargs.get('using'))
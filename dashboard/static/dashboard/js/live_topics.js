@@ -0,0 +1,56 @@
+// Live dashboard topics (production, demand, stockpile, phase_progress).
+// Subscribes on ws/live/ and hands each merged update to onUpdate(topic, items, deleted).
+// Items are full rows in the shape of the topic's REST endpoint; apply them by key.
+// After a reconnect onReconnect() runs, so the page can reload its snapshot.
+// Usage: new LiveTopics(["production"], (topic, items, deleted) => ..., reload).connect();
+class LiveTopics {
+    constructor(topics, onUpdate, onReconnect) {
+        this.topics = topics;
+        this.onUpdate = onUpdate;
+        this.onReconnect = onReconnect;
+        this.connected = false;
+    }
+
+    connect() {
+        const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/live/?topics=${this.topics.join(",")}`);
+        socket.onmessage = event => {
+            const msg = JSON.parse(event.data);
+            if (msg.type === "update") {
+                Object.entries(msg.topics).forEach(([topic, delta]) => this.onUpdate(topic, delta.items, delta.deleted));
+            } else if (msg.type === "error") {
+                console.error("Live updates:", msg.error);
+            }
+        };
+        socket.onopen = () => {
+            if (this.connected && this.onReconnect) this.onReconnect();  // anything missed while away
+            this.connected = true;
+        };
+        socket.onclose = () => setTimeout(() => this.connect(), 3000);
+    }
+}
+
+// Rows of one topic by key, for charts that redraw from the current state.
+class KeyedRows {
+    constructor(key, sortBy) {
+        this.key = key;
+        this.sortBy = sortBy;   // optional: row => value to order by
+        this.rows = new Map();
+    }
+
+    load(rows) {
+        this.rows.clear();
+        this.apply(rows, []);
+    }
+
+    apply(items, deleted) {
+        items.forEach(row => this.rows.set(row[this.key], row));
+        deleted.forEach(key => this.rows.delete(key));
+    }
+
+    list() {
+        const rows = [...this.rows.values()];
+        if (this.sortBy) rows.sort((a, b) => (this.sortBy(a) < this.sortBy(b) ? -1 : this.sortBy(a) > this.sortBy(b) ? 1 : 0));
+        return rows;
+    }
+}
@@ -0,0 +1,45 @@
+// Live PitBlock state for map clients.
+// Loads a snapshot from /api/pit-blocks/changes/, then applies pushes from
+// ws/pit-blocks/. After a reconnect it catches up with ?since=<last version>
+// instead of downloading every block again.
+// Usage: const feed = new PitBlockFeed(blocks => redraw(blocks)); feed.start();
+class PitBlockFeed {
+    constructor(onChange) {
+        this.onChange = onChange;   // called with the list of changed blocks
+        this.blocks = new Map();    // id -> {id, block_id, status, removed_tonnage}
+        this.version = 0;
+    }
+
+    apply(blocks, version) {
+        blocks.forEach(b => this.blocks.set(b.id, { ...this.blocks.get(b.id), ...b }));
+        this.version = Math.max(this.version, version);
+        if (blocks.length) this.onChange(blocks, this);
+    }
+
+    async catchUp() {
+        let more = true;
+        while (more) {
+            const resp = await fetch(`/api/pit-blocks/changes/?since=${this.version}`);
+            if (!resp.ok) throw new Error(`Block changes request failed (${resp.status})`);
+            const data = await resp.json();
+            this.apply(data.blocks, data.version);
+            more = data.more;
+        }
+    }
+
+    connect() {
+        const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/pit-blocks/`);
+        socket.onmessage = event => {
+            const msg = JSON.parse(event.data);
+            if (msg.type === "block_change") this.apply(msg.blocks, msg.version);
+        };
+        socket.onopen = () => this.catchUp().catch(console.error);  // anything missed while away
+        socket.onclose = () => setTimeout(() => this.connect(), 3000);
+    }
+
+    async start() {
+        await this.catchUp();
+        this.connect();
+    }
+}
@@ -0,0 +1,18 @@
+// Draws every <div class="pit-figure" data-figure-url="..."> from the cached
+// Plotly figure JSON endpoints (/api/pit-map/progress/, /api/pit-map/design/).
+// plotly.js itself is loaded once from the versioned {% plotly_js_url %} asset.
+async function loadPitFigure(el) {
+    try {
+        const resp = await fetch(el.dataset.figureUrl);
+        if (!resp.ok) throw new Error(`Pit map request failed (${resp.status})`);
+        const fig = await resp.json();
+        Plotly.newPlot(el, fig.data, fig.layout, { responsive: true });
+    } catch (error) {
+        console.error("Error loading pit map:", error);
+        el.innerHTML = '<p class="p-4 text-center text-danger">Pit map could not be loaded.</p>';
+    }
+}
+
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll(".pit-figure[data-figure-url]").forEach(loadPitFigure);
+});
@@ -0,0 +1,46 @@
+// Client for /api/pit-geometry/ (PITG binary format, see dashboard/utils/pit_binary.py)
+// Usage: const pit = await fetchPitGeometry({ ids: [1, 2], zmin: 900, zmax: 960 });
+async function fetchPitGeometry(params = {}) {
+    const query = new URLSearchParams();
+    if (params.ids) query.set("ids", params.ids.join(","));
+    if (params.zmin !== undefined) query.set("zmin", params.zmin);
+    if (params.zmax !== undefined) query.set("zmax", params.zmax);
+    if (params.points !== undefined) query.set("points", params.points);
+
+    const resp = await fetch(`/api/pit-geometry/?${query.toString()}`);
+    if (!resp.ok) throw new Error(`Pit geometry request failed (${resp.status})`);
+    return decodePitGeometry(await resp.arrayBuffer());
+}
+
+function decodePitGeometry(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== "PITG") throw new Error("Not a PITG buffer");
+
+    const nSegments = view.getUint32(8, true);
+    const nVertices = view.getUint32(12, true);
+    const origin = [view.getFloat64(16, true), view.getFloat64(24, true), view.getFloat64(32, true)];
+
+    let offset = 40;
+    const stringIds = new Int32Array(buffer, offset, nSegments);
+    offset += 4 * nSegments;
+    const offsets = new Uint32Array(buffer, offset, nSegments + 1);
+    offset += 4 * (nSegments + 1);
+    const xyz = new Float32Array(buffer, offset, nVertices * 3);
+
+    return { origin, stringIds, offsets, xyz };
+}
+
+// Plotly-ready arrays (absolute coordinates, null between segments)
+function pitGeometryToLines(pit) {
+    const xs = [], ys = [], zs = [];
+    for (let s = 0; s < pit.stringIds.length; s++) {
+        for (let i = pit.offsets[s]; i < pit.offsets[s + 1]; i++) {
+            xs.push(pit.xyz[3 * i] + pit.origin[0]);
+            ys.push(pit.xyz[3 * i + 1] + pit.origin[1]);
+            zs.push(pit.xyz[3 * i + 2] + pit.origin[2]);
+        }
+        xs.push(null); ys.push(null); zs.push(null);
+    }
+    return { x: xs, y: ys, z: zs };
+}
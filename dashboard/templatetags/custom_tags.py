@@ -1,7 +1,18 @@
 from django import template
+from django.urls import reverse
+from plotly.offline import get_plotlyjs_version
 
 register = template.Library()
 
+
+@register.simple_tag
+def plotly_js_url():
+    """
+    Versioned URL of plotly.min.js (served by the plotly_js view).
+    Usage: <script src="{% plotly_js_url %}"></script>
+    """
+    return reverse('plotly-js', kwargs={'version': get_plotlyjs_version()})
+
 @register.filter
 def index(sequence, position):
     """
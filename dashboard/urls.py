@@ -51,6 +51,9 @@ urlpatterns = [
     path('dashboard/add_plantdemand/', views.add_plantdemand, name='add-plantdemand'),
     path('dashboard/add_phaseschedule/', views.add_phaseschedule, name='add-phaseschedule'),
     path('dashboard/upload-blocks/', views.upload_block_model, name='upload_block_model'),
+    path('dashboard/upload-blocks/rollback/', views.rollback_dataset_view, name='dataset_rollback'),
+    path('dashboard/upload-designs/', views.upload_design_files, name='upload_design_files'),
+    path('dashboard/surveys/', views.upload_survey, name='survey_volumes'),
     
     # ==========================
     # 6. API & Utilities
@@ -59,6 +62,8 @@ urlpatterns = [
     path('export-pdf/', views.export_pdf, name='export-pdf'),
     path("pit-data/", views.pit_data, name="pit-data"),
     path('pit-map/', views.pit_map_view, name='pit_map'),
+    path('dashboard/plan-view/', views.plan_view, name='plan_view'),
+    path('assets/plotly-<str:version>.min.js', views.plotly_js, name='plotly-js'),
     path('manage_plants/', views.manage_plants, name='manage_plants'),
 
     # planning tool
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from dashboard.utils.block_store import ORE
+
+# ==========================================
+# BENCH (Z-LEVEL) INDEX
+# ==========================================
+# One row per bench elevation (block centre z, top bench first) with ore
+# tonnes, waste tonnes, metal and block count, plus running totals from the
+# top down. "What is mined above Z" and "which level matches X tonnes" are
+# then a single np.searchsorted instead of a scan over the blocks.
+# Built once per block model version and saved under
+# DATA_CACHE_DIR/benches/<block version>.npz.
+
+_FIELDS = ('levels', 'ore_tonnes', 'waste_tonnes', 'metal', 'blocks')
+
+_memo = {}
+_lock = threading.Lock()
+
+
+class BenchIndex:
+    """Per-bench totals and top-down cumulative sums (see module docstring)."""
+
+    def __init__(self, levels, ore_tonnes, waste_tonnes, metal, blocks):
+        self.levels = levels              # float64, descending bench elevations
+        self.ore_tonnes = ore_tonnes      # float64 per bench
+        self.waste_tonnes = waste_tonnes  # float64 per bench
+        self.metal = metal                # float64 per bench, grams
+        self.blocks = blocks              # int64 per bench
+        self.cum_ore = np.cumsum(ore_tonnes)
+        self.cum_waste = np.cumsum(waste_tonnes)
+        self.cum_metal = np.cumsum(metal)
+        self.cum_blocks = np.cumsum(blocks)
+        self.cum_tonnes = self.cum_ore + self.cum_waste
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    @property
+    def total_tonnes(self):
+        return float(self.cum_tonnes[-1]) if len(self) else 0.0
+
+    @property
+    def bench_height(self):
+        """Typical vertical spacing between benches (default block height if only one)."""
+        if len(self) < 2:
+            return float(settings.BLOCK_MODEL_DEFAULT_SIZE[2])
+        return float(np.median(-np.diff(self.levels)))
+
+    def benches_above(self, z):
+        """Number of benches with elevation >= z."""
+        return int(np.searchsorted(-self.levels, -z, side='right'))
+
+    def mined_above(self, z):
+        """Totals for every bench at or above elevation z."""
+        k = self.benches_above(z)
+        if k == 0:
+            return {'ore_tonnes': 0.0, 'waste_tonnes': 0.0, 'tonnes': 0.0, 'metal': 0.0, 'grade': 0.0, 'blocks': 0}
+        ore, waste, metal = float(self.cum_ore[k - 1]), float(self.cum_waste[k - 1]), float(self.cum_metal[k - 1])
+        return {
+            'ore_tonnes': ore,
+            'waste_tonnes': waste,
+            'tonnes': ore + waste,
+            'metal': metal,
+            'grade': metal / ore if ore > 0 else 0.0,
+            'blocks': int(self.cum_blocks[k - 1]),
+        }
+
+    def level_for_tonnes(self, tonnes):
+        """
+        Cut elevation (bottom of the deepest bench needed) once 'tonnes' have
+        been mined from the top; above the top bench when tonnes <= 0.
+        """
+        if not len(self):
+            return None
+        half = self.bench_height / 2
+        if tonnes <= 0:
+            return float(self.levels[0] + half)
+        k = min(int(np.searchsorted(self.cum_tonnes, tonnes, side='left')), len(self) - 1)
+        return float(self.levels[k] - half)
+
+    def level_for_fraction(self, fraction):
+        """Cut elevation at which 'fraction' (0-1) of the model's tonnes has been mined."""
+        return self.level_for_tonnes(fraction * self.total_tonnes)
+
+
+def build_bench_index(blocks):
+    """Groups the block store by z (to the centimetre) with bincount, top bench first."""
+    if not blocks:
+        return BenchIndex(*(np.empty(0) for _ in range(4)), np.empty(0, dtype=np.int64))
+
+    levels, inverse = np.unique(np.round(np.asarray(blocks.z), 2), return_inverse=True)
+    tonnes = np.asarray(blocks.tonnes, dtype=np.float64)
+    ore_tonnes = np.where(np.asarray(blocks.material) == ORE, tonnes, 0.0)
+    metal = ore_tonnes * np.asarray(blocks.grade, dtype=np.float64)
+
+    n = len(levels)
+    ore = np.bincount(inverse, weights=ore_tonnes, minlength=n)
+    waste = np.bincount(inverse, weights=tonnes, minlength=n) - ore
+    return BenchIndex(
+        levels[::-1].copy(), ore[::-1].copy(), waste[::-1].copy(),
+        np.bincount(inverse, weights=metal, minlength=n)[::-1].copy(),
+        np.bincount(inverse, minlength=n)[::-1].copy(),
+    )
+
+
+def _cache_path(version):
+    return os.path.join(settings.DATA_CACHE_DIR, 'benches', f'{version}.npz')
+
+
+def load_bench_index(blocks):
+    """BenchIndex for a BlockStore, cached per block model version."""
+    version = blocks.version if blocks else None
+    with _lock:
+        if version and version in _memo:
+            return _memo[version]
+
+    index = None
+    path = _cache_path(version) if version else None
+    if path and os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                index = BenchIndex(*(data[name] for name in _FIELDS))
+        except (OSError, ValueError, KeyError):
+            index = None
+
+    if index is None:
+        index = build_bench_index(blocks)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **{name: getattr(index, name) for name in _FIELDS})
+            os.replace(tmp, path)
+
+    if version:
+        with _lock:
+            _memo[version] = index
+    return index
@@ -0,0 +1,127 @@
+import numpy as np
+
+from dashboard.utils.block_store import ORE
+
+# ==========================================
+# GRADE-AWARE BLOCK DOWNSAMPLING
+# ==========================================
+# The 3D map can only draw a few tens of thousands of markers. Instead of
+# keeping every n-th row (which happily drops the few high-grade blocks),
+# blocks are split into grade classes and each class gets a share of the
+# point budget. High grade is rare, so its share usually keeps all of it;
+# whatever a class cannot use flows to the others, and waste is thinned hardest.
+# Inside a class, blocks are spread over a coarse spatial grid and picked
+# round-robin across cells, so thinning never empties one area of the pit.
+
+# (name, lower grade bound g/t, share of the budget) for ore; waste is its own class
+GRADE_CLASSES = (
+    ('high', 3.5, 0.4),
+    ('medium', 1.5, 0.3),
+    ('low', 0.0, 0.2),
+)
+WASTE_SHARE = 0.1
+
+# Big classes are randomly pre-thinned to this many candidates per kept point
+# before the spatial pick, which keeps the per-request cost roughly O(n)
+OVERSAMPLE = 16
+
+
+def grade_class(material, grade):
+    """Class index per block: 0..len(GRADE_CLASSES)-1 for ore (0 = high), last index for waste."""
+    classes = np.full(len(grade), len(GRADE_CLASSES), dtype=np.int8)
+    is_ore = material == ORE
+    for i, (_, lower, _) in reversed(list(enumerate(GRADE_CLASSES))):
+        classes[is_ore & (grade >= lower)] = i
+    classes[is_ore & (classes == len(GRADE_CLASSES))] = len(GRADE_CLASSES) - 1  # negative grades -> low
+    return classes
+
+
+def allocate_budget(counts, shares, budget):
+    """
+    Splits 'budget' over classes by 'shares', capping each class at its size
+    and handing any leftover to the classes still short (water filling).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    quota = np.zeros(len(counts), dtype=np.int64)
+    if counts.sum() <= budget:
+        return counts.copy()
+
+    open_ = counts > 0
+    remaining = budget
+    while remaining > 0 and open_.any():
+        demand = np.where(open_, np.asarray(shares, dtype=np.float64), 0.0)
+        share = np.floor(remaining * demand / demand.sum()).astype(np.int64)
+        share = np.minimum(share, counts - quota)
+        if share.sum() == 0:
+            # Rounding left a few points: give them to the highest priority open class
+            share[np.flatnonzero(open_)[0]] = min(remaining, counts[open_][0] - quota[open_][0])
+        quota += share
+        remaining = budget - int(quota.sum())
+        open_ = quota < counts
+    return quota
+
+
+def _auto_cell_size(xyz, n_cells):
+    extent = np.maximum(xyz.max(axis=0) - xyz.min(axis=0), 1.0)
+    return float(np.cbrt(np.prod(extent) / max(n_cells, 1)))
+
+
+def spatial_pick(xyz, count, cell_size=None, rng=None):
+    """
+    Indices of 'count' rows of xyz spread evenly over grid cells: every
+    occupied cell gives one row before any cell gives a second, and so on.
+    """
+    n = len(xyz)
+    if count >= n:
+        return np.arange(n)
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+    rng = rng or np.random.default_rng(0)
+    cell_size = cell_size or _auto_cell_size(xyz, count)
+
+    ijk = np.floor((xyz - xyz.min(axis=0)) / cell_size).astype(np.int64)
+    dims = ijk.max(axis=0) + 1
+    cell = np.ravel_multi_index(ijk.T, dims, mode='clip')
+
+    # Shuffle, group by cell, then rank each row within its cell
+    perm = rng.permutation(n)
+    order = perm[np.argsort(cell[perm], kind='stable')]
+    sorted_cells = cell[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    rank = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+
+    # Lowest ranks first (round-robin over cells); ties broken by the shuffle
+    picked = order[np.argsort(rank, kind='stable')[:count]]
+    return np.sort(picked)
+
+
+def stratified_sample(blocks, mask=None, budget=30000, cell_size=None, seed=0, rows=None):
+    """
+    Row indices (into the block store) of at most 'budget' blocks chosen by
+    grade class and spatial cell. 'mask' (boolean) or 'rows' (e.g. from a
+    spatial index query) limits the candidates.
+    A fixed seed keeps the selection stable between requests.
+    """
+    if rows is not None:
+        candidates = np.sort(rows)
+    else:
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(blocks))
+    if len(candidates) <= budget:
+        return candidates
+
+    classes = grade_class(blocks.material[candidates], blocks.grade[candidates])
+    shares = [s for _, _, s in GRADE_CLASSES] + [WASTE_SHARE]
+    counts = np.bincount(classes, minlength=len(shares))
+    quota = allocate_budget(counts, shares, budget)
+
+    rng = np.random.default_rng(seed)
+    xyz = blocks.xyz(candidates)
+    picked = []
+    for c, want in enumerate(quota):
+        members = np.flatnonzero(classes == c)
+        if want == 0 or not len(members):
+            continue
+        if len(members) > OVERSAMPLE * want:
+            members = members[rng.random(len(members)) < OVERSAMPLE * want / len(members)]
+        picked.append(members[spatial_pick(xyz[members], int(want), cell_size, rng)])
+    return candidates[np.sort(np.concatenate(picked))]
@@ -0,0 +1,535 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import numpy as np
+from numpy.lib import recfunctions
+from django.apps import apps
+from django.conf import settings
+
+# ==========================================
+# COLUMNAR BLOCK MODEL STORE
+# ==========================================
+# The ore / waste CSV exports are converted once (on upload) into one .npy
+# file per column, then every request opens them with mmap and filters with
+# NumPy. Layout under DATA_CACHE_DIR/blocks/:
+#
+#   <version>/x.npy, y.npy, z.npy          float64 (UTM northings need it)
+#   <version>/grade.npy, density.npy,      float32
+#             tonnes.npy
+#   <version>/material.npy                 uint8 (1 = ore, 0 = waste)
+#   <version>/phase.npy                    int16 index into manifest 'phases' (-1 = none)
+#   <version>/manifest.json                sources, resolved columns, phase labels, row count
+#   current.json                           -> {"version": ...}
+#
+# The version is a hash of the source files, so it doubles as a cache key
+# for anything derived from the block model.
+#
+# Large CSVs are split into byte ranges on line boundaries and parsed in a
+# process pool; each worker writes its chunk's columns to a scratch folder and
+# the parent stitches them into the final memory-mapped files.
+#
+# Conversion only happens on upload / activation (ingest_block_model), never
+# in a request. load_block_store() serves the last good store; when the
+# dataset's CSVs no longer match it, the store comes back with .stale set to
+# the reason. A failed conversion is recorded in failed.json with the source
+# stats it was tried on, so that reason can say why; new source files (or an
+# explicit ingest) try again.
+
+ORE, WASTE = 1, 0
+
+# Accepted header names per column (case-insensitive), first match wins
+COLUMN_ALIASES = {
+    'x': ('x', 'xc', 'x_centre', 'xcentre', 'xcen', 'east', 'easting'),
+    'y': ('y', 'yc', 'y_centre', 'ycentre', 'ycen', 'north', 'northing'),
+    'z': ('z', 'zc', 'z_centre', 'zcentre', 'zcen', 'rl', 'elevation'),
+    'grade': ('au_ok', 'au', 'grade'),
+    'density': ('density', 'sg', 'bd'),
+    'tonnes': ('tonnes', 'tonnage', 'tons'),
+    'volume': ('volume', 'vol'),
+    'dx': ('dx', 'xinc', 'x_size'),
+    'dy': ('dy', 'yinc', 'y_size'),
+    'dz': ('dz', 'zinc', 'z_size'),
+    'phase': ('phase', 'pushback', 'stage', 'cutback'),
+}
+REQUIRED_COLUMNS = ('x', 'y', 'z')
+
+_COLUMNS = {
+    'x': np.float64, 'y': np.float64, 'z': np.float64,
+    'grade': np.float32, 'density': np.float32, 'tonnes': np.float32,
+    'material': np.uint8, 'phase': np.int16,
+}
+
+# Bump when the stored layout changes so existing versions are rebuilt
+STORE_FORMAT = 2
+
+# Files above this size are split into chunks of this size and parsed in parallel
+CHUNK_BYTES = 32 * 1024 * 1024
+
+_memo = {}
+_lock = threading.Lock()
+
+
+class BlockStore:
+    """Memory-mapped block model columns (see module docstring)."""
+
+    def __init__(self, columns, version=None, manifest=None, stale=None):
+        self.columns = columns
+        self.version = version
+        self.manifest = manifest or {}
+        self.stale = stale  # why this is not the model of the current CSVs (None = it is)
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns', {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.columns['x']) if self.columns else 0
+
+    def __bool__(self):
+        return len(self) > 0
+
+    @property
+    def phase_labels(self):
+        """Phase names from the CSV; blocks.phase holds indices into this list."""
+        return self.manifest.get('phases', [])
+
+    def as_stale(self, reason):
+        """The same columns, flagged as no longer matching the dataset's CSVs."""
+        return BlockStore(self.columns, self.version, self.manifest, stale=reason)
+
+    def xyz(self, mask=None):
+        """(n, 3) float64 coordinates, optionally masked."""
+        if mask is None:
+            return np.column_stack([self.x, self.y, self.z])
+        return np.column_stack([self.x[mask], self.y[mask], self.z[mask]])
+
+
+def resolve_columns(header):
+    """
+    Maps the CSV header to our column names using COLUMN_ALIASES.
+    Returns {column: index}; raises ValueError if x / y / z are missing.
+    """
+    names = [h.strip().strip('"').lower() for h in header]
+    resolved = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                resolved[column] = names.index(alias)
+                break
+    missing = [c for c in REQUIRED_COLUMNS if c not in resolved]
+    if missing:
+        raise ValueError(f"Block model is missing column(s): {', '.join(missing)} (header: {header})")
+    return resolved
+
+
+def _read_header(csv_path):
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        return f.readline().rstrip('\r\n').split(',')
+
+
+def coerce_columns(table, resolved):
+    """
+    Turns a raw float table (NaN = empty / unreadable) into typed columns.
+    Rows without valid coordinates are dropped; missing grade -> 0,
+    missing density -> BLOCK_MODEL_DEFAULT_DENSITY; tonnes from the first
+    available of tonnes, volume * density, dx * dy * dz * density or the
+    default block size.
+    """
+    def col(name):
+        return table[:, resolved[name]] if name in resolved else None
+
+    x, y, z = col('x'), col('y'), col('z')
+    valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+
+    n = int(valid.sum())
+    grade = col('grade')
+    grade = np.nan_to_num(grade[valid], nan=0.0) if grade is not None else np.zeros(n)
+
+    density = col('density')
+    density = density[valid] if density is not None else np.full(n, np.nan)
+    density = np.where(np.isfinite(density) & (density > 0), density, settings.BLOCK_MODEL_DEFAULT_DENSITY)
+
+    dx, dy, dz = settings.BLOCK_MODEL_DEFAULT_SIZE
+    volume = np.full(n, dx * dy * dz, dtype=np.float64)
+    if all(c in resolved for c in ('dx', 'dy', 'dz')):
+        sized = col('dx')[valid] * col('dy')[valid] * col('dz')[valid]
+        volume = np.where(np.isfinite(sized) & (sized > 0), sized, volume)
+    if 'volume' in resolved:
+        vol = col('volume')[valid]
+        volume = np.where(np.isfinite(vol) & (vol > 0), vol, volume)
+    tonnes = volume * density
+    if 'tonnes' in resolved:
+        given = col('tonnes')[valid]
+        tonnes = np.where(np.isfinite(given) & (given > 0), given, tonnes)
+
+    # Phase label index (see _parse_table); -1 when the CSV has no phase
+    phase = col('phase')
+    phase = np.nan_to_num(phase[valid], nan=-1) if phase is not None else np.full(n, -1)
+
+    return {
+        'x': x[valid].astype(np.float64),
+        'y': y[valid].astype(np.float64),
+        'z': z[valid].astype(np.float64),
+        'grade': grade.astype(np.float32),
+        'density': density.astype(np.float32),
+        'tonnes': tonnes.astype(np.float32),
+        'phase': phase.astype(np.int16),
+    }
+
+
+def _label_converter(labels):
+    """loadtxt converter: phase text -> running index into 'labels' (NaN when empty)."""
+    lookup = {}
+
+    def convert(value):
+        value = value.strip().strip('"')
+        if not value:
+            return np.nan
+        if value not in lookup:
+            lookup[value] = len(labels)
+            labels.append(value)
+        return float(lookup[value])
+    return convert
+
+
+def _parse_table(text, usecols, phase_col=None):
+    """
+    Fast C parser first; NaN-tolerant genfromtxt only if the chunk has bad cells.
+    The phase column (text) is turned into label indices. Returns (table, labels).
+    """
+    labels = []
+    converters = {phase_col: _label_converter(labels)} if phase_col is not None else None
+    try:
+        table = np.loadtxt(io.StringIO(text), delimiter=',', usecols=usecols, ndmin=2, converters=converters)
+    except ValueError:
+        # Empty cells / text in numeric columns -> NaN, filtered out in coerce_columns
+        del labels[:]
+        converters = {phase_col: _label_converter(labels)} if phase_col is not None else None
+        table = np.genfromtxt(io.StringIO(text), delimiter=',', usecols=usecols,
+                              dtype=np.float64, invalid_raise=False, converters=converters)
+        if table.dtype.names:
+            table = recfunctions.structured_to_unstructured(table, dtype=np.float64)
+        table = np.atleast_2d(table) if table.size else np.empty((0, len(usecols)))
+    return table, labels
+
+
+def parse_block_csv(csv_path):
+    """
+    Reads one block model CSV into typed columns (see coerce_columns), in-process.
+    Returns (columns, resolved, phase labels) where resolved maps column -> CSV index.
+    """
+    resolved = resolve_columns(_read_header(csv_path))
+    usecols = sorted(set(resolved.values()))
+    local = {name: usecols.index(idx) for name, idx in resolved.items()}
+
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        f.readline()
+        table, labels = _parse_table(f.read(), usecols, resolved.get('phase'))
+    return coerce_columns(table, local), resolved, labels
+
+
+def chunk_ranges(csv_path, chunk_bytes=CHUNK_BYTES):
+    """
+    Byte ranges [start, end) covering the data rows, each ending on a newline,
+    so no row is split between two workers.
+    """
+    size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as f:
+        f.readline()  # header
+        start = f.tell()
+        ranges = []
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            if f.tell() < size:
+                f.readline()  # run on to the end of the current row
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_chunk(task):
+    """
+    Worker: parse one byte range, coerce it and save its columns as .npy files.
+    Phase indices are local to the chunk; its labels are returned for remapping.
+    """
+    csv_path, start, end, usecols, local, phase_col, material, out_prefix = task
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8', errors='replace')
+
+    table, labels = _parse_table(text, usecols, phase_col)
+    columns = coerce_columns(table, local)
+    columns['material'] = np.full(len(columns['x']), material, dtype=np.uint8)
+    for name, column in columns.items():
+        np.save(f'{out_prefix}_{name}.npy', column)
+    return out_prefix, len(columns['x']), labels
+
+
+def _init_worker():
+    # Spawned workers (Windows / macOS) start without Django configured
+    if not apps.ready:
+        django.setup()
+
+
+def parse_block_csv_chunked(csv_path, material, scratch_dir, workers=None, chunk_bytes=CHUNK_BYTES, phases=None):
+    """
+    Parses a (large) block CSV across a process pool.
+    Returns (parts, resolved): parts is a list of memory-mapped column dicts,
+    one per chunk, in file order. Phase labels are appended to 'phases' and
+    every part's phase column indexes that shared list.
+    """
+    phases = [] if phases is None else phases
+    resolved = resolve_columns(_read_header(csv_path))
+    usecols = sorted(set(resolved.values()))
+    local = {name: usecols.index(idx) for name, idx in resolved.items()}
+
+    ranges = chunk_ranges(csv_path, chunk_bytes)
+    tasks = [
+        (csv_path, start, end, usecols, local, resolved.get('phase'), material,
+         os.path.join(scratch_dir, f'{material}_{i:05d}'))
+        for i, (start, end) in enumerate(ranges)
+    ]
+
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if len(tasks) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = list(pool.map(_parse_chunk, tasks))
+    else:
+        results = [_parse_chunk(task) for task in tasks]
+
+    parts = []
+    for prefix, rows, labels in results:
+        if not rows:
+            continue
+        part = {name: np.load(f'{prefix}_{name}.npy', mmap_mode='r') for name in _COLUMNS}
+        if labels:
+            # Chunk-local label index -> index into the shared 'phases' list
+            for label in labels:
+                if label not in phases:
+                    phases.append(label)
+            remap = np.array([phases.index(label) for label in labels] + [-1], dtype=np.int16)
+            part['phase'] = remap[part['phase']]  # -1 stays -1 (last entry)
+        parts.append(part)
+    return parts, resolved
+
+
+def _cache_root():
+    return os.path.join(settings.DATA_CACHE_DIR, 'blocks')
+
+
+def _source_stats(sources):
+    stats = {}
+    for material, path in sources.items():
+        if path and os.path.exists(path):
+            st = os.stat(path)
+            stats[material] = {'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    return stats
+
+
+def _sources_version(stats):
+    from dashboard.utils.geometry_cache import content_hash
+
+    h = hashlib.sha1(f'format:{STORE_FORMAT}\n'.encode('utf-8'))
+    for material in sorted(stats):
+        h.update(f"{material}:{content_hash(stats[material]['path'])}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def _write_store(version, parts, manifest):
+    folder = os.path.join(_cache_root(), version)
+    if os.path.isdir(folder):
+        return
+    tmp = tempfile.mkdtemp(dir=_cache_root(), prefix='.build-')
+    total = sum(len(p['x']) for p in parts)
+    for name, dtype in _COLUMNS.items():
+        # Stream each part into the final file instead of concatenating in memory
+        out = np.lib.format.open_memmap(os.path.join(tmp, f'{name}.npy'), mode='w+', dtype=dtype, shape=(total,))
+        pos = 0
+        for p in parts:
+            out[pos:pos + len(p[name])] = p[name]
+            pos += len(p[name])
+        out.flush()
+        del out
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    try:
+        os.rename(tmp, folder)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _set_current(version):
+    fd, tmp = tempfile.mkstemp(dir=_cache_root(), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'version': version}, f)
+    os.replace(tmp, os.path.join(_cache_root(), 'current.json'))
+
+
+class BlockModelError(ValueError):
+    """The current block model CSVs could not be converted (the message says why)."""
+
+
+def _failure_path():
+    return os.path.join(_cache_root(), 'failed.json')
+
+
+def _recorded_failure(stats):
+    """Error of the last failed ingest if it was of exactly these source files, else None."""
+    try:
+        with open(_failure_path()) as f:
+            failure = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return failure.get('error') if failure.get('sources') == stats else None
+
+
+def _record_failure(stats, error):
+    fd, tmp = tempfile.mkstemp(dir=_cache_root(), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'sources': stats, 'error': error}, f)
+    os.replace(tmp, _failure_path())
+
+
+def ingest_block_model(ore_path=None, waste_path=None, workers=None, make_current=True):
+    """
+    Converts the ore and waste CSVs into a new store version and makes it current
+    (unless make_current=False: the caller then does, see set_current_store()).
+    Column aliases are resolved here, once; big files are parsed in parallel
+    chunks. Returns the BlockStore; ValueError (recorded, see above) if the
+    CSVs cannot be converted.
+    """
+    os.makedirs(_cache_root(), exist_ok=True)
+    sources = {'ore': ore_path, 'waste': waste_path}
+    stats = _source_stats(sources)
+    try:
+        store = _ingest(stats, workers, make_current)
+    except ValueError as e:
+        _record_failure(stats, str(e))
+        raise
+    if os.path.exists(_failure_path()):
+        os.remove(_failure_path())
+    return store
+
+
+def _ingest(stats, workers, make_current=True):
+    version = _sources_version(stats)
+
+    if not os.path.isdir(os.path.join(_cache_root(), version)):
+        scratch = tempfile.mkdtemp(dir=_cache_root(), prefix='.chunks-')
+        try:
+            parts, resolved, phases = [], {}, []
+            for material, code in (('ore', ORE), ('waste', WASTE)):
+                if material not in stats:
+                    continue
+                chunk_parts, resolved[material] = parse_block_csv_chunked(
+                    stats[material]['path'], code, scratch, workers=workers, phases=phases
+                )
+                parts.extend(chunk_parts)
+
+            manifest = {
+                'version': version,
+                'format': STORE_FORMAT,
+                'sources': stats,
+                'columns': resolved,
+                'phases': phases,
+                'rows': int(sum(len(p['x']) for p in parts)),
+            }
+            _write_store(version, parts, manifest)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+    else:
+        _adopt_sources(version, stats)
+    if make_current:
+        _set_current(version)
+    return open_block_store(version)
+
+
+def _adopt_sources(version, stats):
+    """
+    An existing version converted from files with the same content at other paths
+    (another dataset version): records these as its sources, so it is not stale for them.
+    """
+    path = os.path.join(_cache_root(), version, 'manifest.json')
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return
+    if manifest.get('sources') == stats:
+        return
+    manifest['sources'] = stats
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+    with _lock:
+        _memo.pop(version, None)
+
+
+def set_current_store(store):
+    """Makes an ingested (make_current=False) store the current one."""
+    _set_current(store.version)
+
+
+def open_block_store(version):
+    """Memory-maps one stored version (None if it does not exist)."""
+    with _lock:
+        if version in _memo:
+            return _memo[version]
+    folder = os.path.join(_cache_root(), version)
+    try:
+        with open(os.path.join(folder, 'manifest.json')) as f:
+            manifest = json.load(f)
+        columns = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r') for name in _COLUMNS}
+    except (OSError, ValueError):
+        return None
+    store = BlockStore(columns, version, manifest)
+    with _lock:
+        _memo[version] = store
+    return store
+
+
+def _current_version():
+    try:
+        with open(os.path.join(_cache_root(), 'current.json')) as f:
+            return json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_block_store(ore_path=None, waste_path=None):
+    """
+    The current BlockStore, never converting anything (see ingest_block_model).
+    If ore / waste paths are given, the store is checked against them: None
+    when neither file exists, the last good store with .stale set when they
+    changed since it was built, and BlockModelError when there is no usable
+    store for them at all.
+    """
+    version = _current_version()
+    store = open_block_store(version) if version else None
+
+    if ore_path or waste_path:
+        stats = _source_stats({'ore': ore_path, 'waste': waste_path})
+        if not stats:
+            return None
+        if store is not None and store.manifest.get('format') != STORE_FORMAT:
+            store = None  # older layout, cannot be served
+        if store is None or store.manifest.get('sources') != stats:
+            error = _recorded_failure(stats)
+            reason = (f"Block model ingest failed: {error}" if error is not None
+                      else "Block model files have not been converted yet (upload them or run "
+                           "'manage.py dataset_versions --activate')")
+            if store is None:
+                raise BlockModelError(reason)
+            return store.as_stale(reason)
+    return store
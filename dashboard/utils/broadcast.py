@@ -0,0 +1,27 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+# ==========================================
+# CHANNEL LAYER SENDS AFTER COMMIT
+# ==========================================
+# Signal handlers push WebSocket messages with send_to_group(). The send
+# runs in the transaction's on_commit callback, so a save inside a bulk
+# import or a rolled back transaction never broadcasts (and a batch of
+# saves waits on the channel layer once, at commit, not per record).
+# The send itself is the plain async_to_sync(group_send): it runs on the
+# server's event loop when called from a request, which is what lets the
+# in-memory layer wake the receiving consumers right away. A failed send
+# is logged and dropped; clients catch up through the REST endpoints.
+
+
+def _send(group, message):
+    try:
+        async_to_sync(get_channel_layer().group_send)(group, message)
+    except Exception as e:
+        print(f"WebSocket broadcast failed ({group}): {e}")
+
+
+def send_to_group(group, message):
+    """Sends a channel layer group message once the current transaction commits (at once in autocommit)."""
+    transaction.on_commit(lambda: _send(group, message))
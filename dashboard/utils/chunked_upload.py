@@ -0,0 +1,184 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from dashboard.utils.datasets import activate_dataset, publish_dataset
+
+# ==========================================
+# RESUMABLE CHUNKED UPLOADS
+# ==========================================
+# Large dataset files (300 MB block models) are sent as numbered chunks of
+# UploadSession.chunk_size bytes, each in its own short request with its
+# SHA-256. Layout under PIT_DATA_DIR/uploads/<session id>/:
+#
+#   data          staging file, pre-sized to the full length; chunk i is
+#                 written at offset i * chunk_size (any order, any number of
+#                 parallel requests)
+#   chunks/<i>    SHA-256 of chunk i, written only after the chunk was
+#                 received complete and matched its checksum
+#
+# A client resumes by asking which chunks are missing. Once every chunk is
+# in, the staging file goes to a background thread that checks the optional
+# whole-file SHA-256, publishes it as a new dataset version (see datasets.py)
+# and rebuilds the caches, so no web request waits for the ingestion. A block
+# CSV that cannot be converted fails the session and never becomes current.
+# If the process dies meanwhile, the session would stay queued / ingesting:
+# expire_interrupted() marks it failed once UPLOAD_INGEST_TIMEOUT has passed
+# without this process working on it, and completing it again retries.
+
+READ_BLOCK = 1 << 20
+
+_ingest_lock = threading.Lock()  # one ingestion at a time per process
+_active = set()  # ids of the sessions this process has queued or is ingesting
+
+
+def staging_dir(session):
+    return os.path.join(settings.PIT_DATA_DIR, 'uploads', str(session.pk))
+
+
+def staging_file(session):
+    return os.path.join(staging_dir(session), 'data')
+
+
+def create_staging(session):
+    """Creates the staging folder and the pre-sized staging file for a new session."""
+    os.makedirs(os.path.join(staging_dir(session), 'chunks'), exist_ok=True)
+    with open(staging_file(session), 'wb') as f:
+        f.truncate(session.total_size)
+
+
+def received_chunks(session):
+    """Sorted indices of the chunks received and verified so far."""
+    try:
+        names = os.listdir(os.path.join(staging_dir(session), 'chunks'))
+    except OSError:
+        return []
+    return sorted(int(n) for n in names if n.isdigit())
+
+
+def missing_chunks(session):
+    received = set(received_chunks(session))
+    return [i for i in range(session.chunk_count) if i not in received]
+
+
+def write_chunk(session, index, stream, expected_sha256):
+    """
+    Streams chunk 'index' from 'stream' (file-like, e.g. the request) into the
+    staging file while hashing it. ValueError if the index, length or SHA-256
+    is wrong; the chunk then stays missing and can simply be sent again.
+    """
+    if not 0 <= index < session.chunk_count:
+        raise ValueError(f"Chunk index {index} out of range (0-{session.chunk_count - 1})")
+    length = session.chunk_length(index)
+    marker = os.path.join(staging_dir(session), 'chunks', str(index))
+    if os.path.exists(marker):
+        os.remove(marker)  # being re-sent: only trusted again once it verifies
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(staging_file(session), 'r+b') as f:
+        f.seek(index * session.chunk_size)
+        while written < length:
+            block = stream.read(min(READ_BLOCK, length - written))
+            if not block:
+                break
+            f.write(block)
+            digest.update(block)
+            written += len(block)
+    if written != length or stream.read(1):
+        raise ValueError(f"Chunk {index} must be exactly {length} bytes")
+    if digest.hexdigest() != (expected_sha256 or '').lower():
+        raise ValueError(f"Chunk {index} checksum mismatch")
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(marker), prefix='.')
+    with os.fdopen(fd, 'w') as f:
+        f.write(digest.hexdigest())
+    os.replace(tmp, marker)
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def ingest_upload(session_id):
+    """
+    Publishes a completed upload as a new dataset version and rebuilds the
+    caches. Records the outcome on the session (done / failed).
+    """
+    from dashboard.models import UploadSession
+
+    try:
+        with _ingest_lock:
+            session = UploadSession.objects.get(pk=session_id)
+            session.status = 'ingesting'
+            session.save(update_fields=['status', 'updated_at'])
+            try:
+                path = staging_file(session)
+                if session.sha256 and _file_sha256(path) != session.sha256.lower():
+                    raise ValueError("File checksum does not match the SHA-256 given when the upload started")
+                # Block CSVs are converted before the version becomes current: a bad one fails here
+                manifest = publish_dataset({session.target: path}, note=session.file_name)
+                if session.target == 'pit_design.str':
+                    activate_dataset(pit_design=True, blocks=False)
+                session.status = 'done'
+                session.dataset_version = manifest['version']
+                session.error = ''
+                shutil.rmtree(staging_dir(session), ignore_errors=True)
+            except Exception as e:
+                print(f"Upload Ingest Error ({session.file_name}): {e}")
+                session.status = 'failed'
+                session.error = str(e)
+            session.save(update_fields=['status', 'dataset_version', 'error', 'updated_at'])
+    finally:
+        _active.discard(session_id)
+    return session
+
+
+def expire_interrupted(session):
+    """
+    Marks a queued / ingesting session failed when no ingestion in this process
+    has it and it has not moved for UPLOAD_INGEST_TIMEOUT (its process restarted
+    or died). Returns the session as it is now.
+    """
+    from dashboard.models import UploadSession
+
+    if session.status not in ('queued', 'ingesting') or session.pk in _active:
+        return session
+    if timezone.now() - session.updated_at < timedelta(seconds=settings.UPLOAD_INGEST_TIMEOUT):
+        return session
+    expired = UploadSession.objects.filter(pk=session.pk, status=session.status, updated_at=session.updated_at).update(
+        status='failed', error='Ingestion was interrupted; complete the upload again to retry', updated_at=timezone.now(),
+    )
+    if expired:
+        session.refresh_from_db()
+    return session
+
+
+def _ingest_in_thread(session_id):
+    close_old_connections()
+    try:
+        ingest_upload(session_id)
+    finally:
+        connection.close()
+
+
+def start_ingestion(session, background=True):
+    """Queues a completed upload for ingestion, in a background thread unless background=False."""
+    session.status = 'queued'
+    session.save(update_fields=['status', 'updated_at'])
+    _active.add(session.pk)
+    if not background:
+        return ingest_upload(session.pk)
+    threading.Thread(target=_ingest_in_thread, args=(session.pk,), name=f'ingest-{session.pk}', daemon=True).start()
+    return session
@@ -0,0 +1,261 @@
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: publishing is then only serialised within the process
+    fcntl = None
+
+from django.conf import settings
+
+from dashboard.utils.block_store import ingest_block_model, set_current_store
+from dashboard.utils.geometry_cache import build_geometry_cache, content_hash
+from dashboard.utils.plan_tiles import prerender_tiles
+
+# ==========================================
+# VERSIONED DATASET STORAGE
+# ==========================================
+# The uploaded pit design and block model CSVs are never overwritten in
+# place. Every upload becomes a new, complete, read-only version folder and
+# a one-line pointer says which version is current. Layout under PIT_DATA_DIR:
+#
+#   versions/<version>/pit_design.str, ore_blocks.csv, waste_blocks.csv
+#   versions/<version>/manifest.json   {version, hash, created, files: {name: {hash, size}}}
+#   versions/CURRENT.json              -> {"version": ...}
+#
+# A version is staged in a hidden folder, renamed into place in one step and
+# only then made current by replacing CURRENT.json (os.replace is atomic), so
+# readers see either the old dataset or the new one, never a half-written
+# file. Files not part of an upload are carried over from the current version
+# (hard links where the filesystem allows). The version hash covers every
+# file's content hash; uploading a dataset identical to an existing version
+# just points back at it. Rolling back is the same pointer swap.
+#
+# Uploaded block CSVs are converted into the columnar block store before the
+# pointer moves. A CSV that cannot be converted discards the new version and
+# leaves the current dataset (and block store) as they were.
+#
+# Publishing and rolling back hold an exclusive flock on versions/.lock as
+# well as the thread lock, so web workers and management commands in other
+# processes never interleave their pointer swaps.
+#
+# data_path() is how everything else finds the files. Before the first
+# upload it falls back to the files shipped directly in PIT_DATA_DIR.
+# DatasetVersionMiddleware resolves CURRENT.json once per request
+# (pinned_version), so every file a request opens comes from one version
+# even if another process publishes meanwhile.
+
+DATASET_FILES = ('pit_design.str', 'ore_blocks.csv', 'waste_blocks.csv')
+
+_lock = threading.Lock()
+_pinned = contextvars.ContextVar('dataset_version', default=None)
+
+
+def _root():
+    return os.path.join(settings.PIT_DATA_DIR, 'versions')
+
+
+def _pointer_path():
+    return os.path.join(_root(), 'CURRENT.json')
+
+
+def current_version():
+    """Id of the current dataset version (None before the first versioned upload)."""
+    try:
+        with open(_pointer_path()) as f:
+            return json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+@contextmanager
+def pinned_version():
+    """Reads the current version once; data_path() inside the block keeps using it."""
+    token = _pinned.set(current_version() or '')  # '' pins "no versioned upload yet"
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def _repin(version):
+    """After a publish / rollback, the pinned caller carries on with the version it made current."""
+    if _pinned.get() is not None:
+        _pinned.set(version)
+
+
+@contextmanager
+def _exclusive():
+    """Serialises publish / rollback across threads and, through versions/.lock, across processes."""
+    os.makedirs(_root(), exist_ok=True)
+    with _lock, open(os.path.join(_root(), '.lock'), 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+        yield
+
+
+def data_path(name, version=None):
+    """Path of a dataset file ('pit_design.str', ...) in the given, pinned or current version."""
+    if version is None:
+        version = _pinned.get()
+        if version is None:
+            version = current_version()
+    if version:
+        return os.path.join(_root(), version, name)
+    return os.path.join(settings.PIT_DATA_DIR, name)
+
+
+def read_manifest(version):
+    try:
+        with open(os.path.join(_root(), version, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _set_current(version):
+    fd, tmp = tempfile.mkstemp(dir=_root(), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'version': version}, f)
+    os.replace(tmp, _pointer_path())
+
+
+def _write_file(source, dest):
+    """Writes an uploaded file (anything with .chunks()) or copies a path into dest."""
+    if hasattr(source, 'chunks'):
+        with open(dest, 'wb') as f:
+            for chunk in source.chunks():
+                f.write(chunk)
+        return
+    try:
+        os.link(source, dest)  # versions are read-only, so sharing the inode is safe
+    except OSError:
+        shutil.copy2(source, dest)
+
+
+def list_versions():
+    """Manifests of every stored version, newest first, each with a 'current' flag."""
+    if not os.path.isdir(_root()):
+        return []
+    current = current_version()
+    manifests = []
+    for entry in os.listdir(_root()):
+        if entry.startswith('.') or not os.path.isdir(os.path.join(_root(), entry)):
+            continue
+        manifest = read_manifest(entry)
+        if manifest:
+            manifests.append({**manifest, 'current': manifest['version'] == current})
+    return sorted(manifests, key=lambda m: m['created'], reverse=True)
+
+
+def publish_dataset(uploads, note=''):
+    """
+    Stores a new dataset version from 'uploads' ({file name: uploaded file or path})
+    plus the current version's other files, and makes it current.
+    Uploaded block CSVs are converted into the block store first: if they cannot
+    be, the version is discarded, the current one stays and ValueError is raised.
+    Returns the version manifest (an identical existing version is reused).
+    """
+    unknown = set(uploads) - set(DATASET_FILES)
+    if unknown:
+        raise ValueError(f"Not dataset files: {', '.join(sorted(unknown))}")
+
+    with _exclusive():
+        parent = current_version()  # under the lock, not the request's pinned version
+        staging = tempfile.mkdtemp(dir=_root(), prefix='.staging-')
+        try:
+            files = {}
+            for name in DATASET_FILES:
+                source = uploads.get(name)
+                if source is None:
+                    source = data_path(name, parent or '')
+                    if not os.path.exists(source):
+                        continue
+                dest = os.path.join(staging, name)
+                _write_file(source, dest)
+                files[name] = {'hash': content_hash(dest), 'size': os.path.getsize(dest)}
+
+            h = hashlib.sha1()
+            for name in sorted(files):
+                h.update(f"{name}:{files[name]['hash']}\n".encode('utf-8'))
+            digest = h.hexdigest()
+
+            existing = next((m for m in list_versions() if m['hash'] == digest), None)
+            if existing:
+                shutil.rmtree(staging, ignore_errors=True)
+                manifest = existing
+                blocks = _ingest_uploaded_blocks(uploads, os.path.join(_root(), existing['version']))
+            else:
+                version = f"{time.strftime('%Y%m%d-%H%M%S')}-{digest[:12]}"
+                manifest = {
+                    'version': version,
+                    'hash': digest,
+                    'created': time.time(),
+                    'parent': parent,
+                    'note': note,
+                    'files': files,
+                }
+                # Renamed into place without a manifest, so list_versions() and
+                # rollback cannot see it until the block CSVs have converted
+                folder = os.path.join(_root(), version)
+                shutil.rmtree(folder, ignore_errors=True)  # left behind by an interrupted publish
+                os.rename(staging, folder)
+                staging = folder
+                blocks = _ingest_uploaded_blocks(uploads, folder)
+                if blocks is not None:
+                    manifest['blocks'] = len(blocks)
+                with open(os.path.join(folder, 'manifest.json'), 'w') as f:
+                    json.dump(manifest, f)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        _set_current(manifest['version'])
+        if blocks is not None:
+            set_current_store(blocks)
+    _repin(manifest['version'])
+    return {**manifest, 'current': True}
+
+
+def _ingest_uploaded_blocks(uploads, folder):
+    """BlockStore of the version in 'folder' when its block CSVs were uploaded (not yet current), else None."""
+    if 'ore_blocks.csv' not in uploads and 'waste_blocks.csv' not in uploads:
+        return None
+    ore, waste = (os.path.join(folder, name) for name in ('ore_blocks.csv', 'waste_blocks.csv'))
+    return ingest_block_model(ore if os.path.exists(ore) else None, waste if os.path.exists(waste) else None,
+                              make_current=False)
+
+
+def rollback_dataset(version):
+    """Makes an existing version current again. Returns its manifest; ValueError if unknown."""
+    manifest = read_manifest(version) if version and not version.startswith('.') and os.sep not in version else None
+    if not manifest:
+        raise ValueError(f"Unknown dataset version: {version}")
+    with _exclusive():
+        _set_current(version)
+    _repin(version)
+    return {**manifest, 'current': True}
+
+
+def activate_dataset(pit_design=True, blocks=True):
+    """
+    Builds the caches of the current version (parsed geometry, low plan tiles,
+    columnar block store) so no dashboard request has to. Returns the BlockStore
+    when 'blocks' was rebuilt; ValueError if the block CSVs cannot be converted.
+    """
+    str_path = data_path('pit_design.str')
+    if pit_design and os.path.exists(str_path):
+        build_geometry_cache(str_path)
+        prerender_tiles(str_path)  # low zooms of the plan view; deeper tiles render on request
+
+    ore, waste = data_path('ore_blocks.csv'), data_path('waste_blocks.csv')
+    if blocks and (os.path.exists(ore) or os.path.exists(waste)):
+        return ingest_block_model(ore, waste)
+    return None
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+
+from dashboard.utils.geometry_cache import (
+    build_geometry_cache,
+    geometry_version,
+    is_geometry_cached,
+    load_pit_geometry,
+)
+from dashboard.utils.simplify import build_lods, choose_lod
+from dashboard.utils.str_parser import StrGeometry
+
+# ==========================================
+# MULTI-PIT / MULTI-PHASE DESIGN STORE
+# ==========================================
+# Every PitDesignFile is parsed into the per-file geometry cache (in a process
+# pool when several files are new), then all files are concatenated into one
+# store. Each segment remembers which source it came from, so the map can
+# filter or colour by pit and phase. Layout under DATA_CACHE_DIR/designs/:
+#
+#   <store key>/xyz.npy, segment_offsets.npy, string_ids.npy, segment_source.npy
+#   <store key>/lod_masks.npy, sources.json, lod.json
+#
+# The store key hashes every file's content hash + tags, so any upload,
+# delete or re-tag produces a new store and the old one is never read again.
+#
+# Requests do not query PitDesignFile: the tagged file list is kept in
+# DATA_CACHE_DIR/designs/entries.json, rewritten (on commit) whenever a design
+# file or phase changes. load_design_store() returns the memoised store as
+# long as that list and the size / mtime of every file are unchanged.
+# Uploaded files are written to a temp file and renamed over the old one, so
+# a reader never sees a half-written .str file.
+
+_memo = {}
+_loaded = {}  # 'manifest': (entries.json stat, design file stats), 'entries', 'store'
+_lock = threading.Lock()
+
+
+class DesignStore:
+    """Merged geometry of all design files + per-segment source tags."""
+
+    def __init__(self, geometry, segment_source, sources, lod_masks=None, levels=None, key=None):
+        self.geometry = geometry
+        self.segment_source = segment_source  # int32 (S,) index into sources
+        self.sources = sources                # [{'pit', 'phase_id', 'phase_name', 'name'}, ...]
+        self.lod_masks = lod_masks
+        self.levels = levels or []
+        self.key = key
+
+    def __bool__(self):
+        return bool(self.geometry)
+
+    def source_mask(self, pit=None, phase_id=None):
+        """Bool mask over sources matching the given pit and/or phase."""
+        return np.array([
+            (pit is None or s['pit'] == pit) and (phase_id is None or s['phase_id'] == phase_id)
+            for s in self.sources
+        ], dtype=bool)
+
+    def at_budget(self, point_budget=None):
+        """
+        (geometry, segment_source, level) at the finest precomputed detail
+        level that fits point_budget (full detail when point_budget is None).
+        """
+        if point_budget is None or not self.levels:
+            return self.geometry, self.segment_source, None
+        level = self.levels[choose_lod(self.levels, point_budget)]
+        if level['tolerance'] <= 0:
+            return self.geometry, self.segment_source, level
+        mask = np.asarray(self.lod_masks[level['level']])
+        seg_of_vertex = np.repeat(np.arange(self.geometry.n_segments), self.geometry.segment_lengths())
+        alive = np.bincount(seg_of_vertex[mask], minlength=self.geometry.n_segments) > 0
+        return self.geometry.take_vertices(mask), np.asarray(self.segment_source)[alive], level
+
+    def select(self, pit=None, phase_id=None, point_budget=None):
+        """StrGeometry for one pit and/or phase, optionally simplified to point_budget."""
+        geometry, source, _ = self.at_budget(point_budget)
+        if pit is None and phase_id is None:
+            return geometry
+        mask = self.source_mask(pit, phase_id)
+        if not mask.any():
+            return StrGeometry()
+        return geometry.select(mask[source])
+
+    def groups(self):
+        """Yields (source dict, source index) for each source that has segments."""
+        present = set(np.unique(self.segment_source).tolist())
+        for i, source in enumerate(self.sources):
+            if i in present:
+                yield source, i
+
+
+def _cache_root():
+    return os.path.join(settings.DATA_CACHE_DIR, 'designs')
+
+
+def _parse_into_cache(path):
+    """Worker: parse one file into the per-file geometry cache, return its hash."""
+    build_geometry_cache(path)
+    return geometry_version(path)
+
+
+def _init_worker():
+    # Spawned workers (Windows / macOS) start without Django configured
+    if not apps.ready:
+        django.setup()
+
+
+def ingest_design_files(entries, max_workers=None):
+    """
+    Parses many design files and merges them into one DesignStore.
+    'entries' is a list of {'path', 'pit', 'phase_id', 'phase_name', 'name'} dicts.
+    Files not yet in the geometry cache are parsed in a process pool.
+    """
+    entries = [e for e in entries if os.path.exists(e['path'])]
+
+    # 1. Parse only the files whose cache is missing or stale (cheap stat check)
+    stale = [e['path'] for e in entries if not is_geometry_cached(e['path'])]
+    if len(stale) > 1:
+        workers = max_workers or min(len(stale), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            list(pool.map(_parse_into_cache, stale))
+    else:
+        for path in stale:
+            _parse_into_cache(path)
+
+    # 2. Merge the memory-mapped per-file arrays
+    digests = [geometry_version(e['path']) for e in entries]
+    key = _store_key(entries, digests)
+    return _open_store(key) or _write_store(key, entries)
+
+
+def _store_key(entries, digests):
+    h = hashlib.sha1()
+    for entry, digest in zip(entries, digests):
+        h.update(f"{digest}|{entry['pit']}|{entry['phase_id']}|{entry['phase_name']}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def _merge(entries):
+    xyz_parts, offset_parts, id_parts, source_parts = [], [], [], []
+    n_vertices = 0
+    for i, entry in enumerate(entries):
+        g = load_pit_geometry(entry['path'])
+        if not g:
+            continue
+        xyz_parts.append(np.asarray(g.xyz))
+        offset_parts.append(np.asarray(g.segment_offsets[:-1]) + n_vertices)
+        id_parts.append(np.asarray(g.string_ids))
+        source_parts.append(np.full(g.n_segments, i, dtype=np.int32))
+        n_vertices += g.n_vertices
+
+    if not xyz_parts:
+        return StrGeometry(), np.empty(0, dtype=np.int32)
+
+    offsets = np.append(np.concatenate(offset_parts), n_vertices).astype(np.int64)
+    geometry = StrGeometry(np.concatenate(xyz_parts), offsets, np.concatenate(id_parts))
+    return geometry, np.concatenate(source_parts)
+
+
+def _write_store(key, entries):
+    os.makedirs(_cache_root(), exist_ok=True)
+    geometry, segment_source = _merge(entries)
+    lod_masks, levels = build_lods(geometry)
+    sources = [{k: e.get(k) for k in ('pit', 'phase_id', 'phase_name', 'name')} for e in entries]
+
+    folder = os.path.join(_cache_root(), key)
+    tmp = tempfile.mkdtemp(dir=_cache_root(), prefix='.build-')
+    np.save(os.path.join(tmp, 'xyz.npy'), geometry.xyz)
+    np.save(os.path.join(tmp, 'segment_offsets.npy'), geometry.segment_offsets)
+    np.save(os.path.join(tmp, 'string_ids.npy'), geometry.string_ids)
+    np.save(os.path.join(tmp, 'segment_source.npy'), segment_source)
+    np.save(os.path.join(tmp, 'lod_masks.npy'), lod_masks)
+    with open(os.path.join(tmp, 'sources.json'), 'w') as f:
+        json.dump(sources, f)
+    with open(os.path.join(tmp, 'lod.json'), 'w') as f:
+        json.dump(levels, f)
+    try:
+        os.rename(tmp, folder)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return _open_store(key)
+
+
+def _open_store(key):
+    if key in _memo:
+        return _memo[key]
+    folder = os.path.join(_cache_root(), key)
+    if not os.path.isdir(folder):
+        return None
+
+    def load(name):
+        return np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r')
+
+    with open(os.path.join(folder, 'sources.json')) as f:
+        sources = json.load(f)
+    with open(os.path.join(folder, 'lod.json')) as f:
+        levels = json.load(f)
+
+    geometry = StrGeometry(load('xyz'), load('segment_offsets'), load('string_ids'))
+    store = DesignStore(geometry, load('segment_source'), sources, load('lod_masks'), levels, key)
+    _memo[key] = store
+    return store
+
+
+def design_file_entries():
+    """Ingestion entries for every PitDesignFile in the database."""
+    from dashboard.models import PitDesignFile
+
+    files = PitDesignFile.objects.select_related('mine_phase').order_by('pit', 'mine_phase__sequence_order', 'id')
+    return [{
+        'path': f.file_path,
+        'pit': f.pit,
+        'phase_id': f.mine_phase_id,
+        'phase_name': f.mine_phase.name if f.mine_phase else None,
+        'name': f.name,
+    } for f in files]
+
+
+def _entries_path():
+    return os.path.join(_cache_root(), 'entries.json')
+
+
+def write_design_entries():
+    """Stores the current design_file_entries() for load_design_store() (call after every change)."""
+    os.makedirs(_cache_root(), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=_cache_root(), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(design_file_entries(), f)
+    os.replace(tmp, _entries_path())
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def save_design_file(upload, path):
+    """Writes an uploaded design file (anything with .chunks()) to path, replacing any previous file at once."""
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.', suffix='.str')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in upload.chunks():
+                f.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load_design_store():
+    """The merged store for the current set of design files (None if there are none)."""
+    if _stat(_entries_path()) is None:
+        write_design_entries()  # first run: list the files once from the database
+    listed = _stat(_entries_path())
+    with _lock:
+        loaded = dict(_loaded)
+    if loaded and loaded['manifest'][0] == listed:
+        entries = loaded['entries']
+    else:
+        try:
+            with open(_entries_path()) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = design_file_entries()
+
+    manifest = (listed, tuple(_stat(e['path']) for e in entries))
+    if loaded and loaded['manifest'] == manifest:
+        return loaded['store']
+    store = ingest_design_files(entries) if entries else None
+    with _lock:
+        _loaded.update(manifest=manifest, entries=entries, store=store)
+    return store
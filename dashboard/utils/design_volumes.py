@@ -0,0 +1,190 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from dashboard.utils.spatial_index import StringIndex
+
+# ==========================================
+# DESIGN VOLUMES AND PLANNED TONNAGE
+# ==========================================
+# Planned tonnage straight from the pit design strings:
+#
+#   1. every closed contour's plan area with one vectorized shoelace sum
+#      (edge cross products, summed per contour from a running total)
+#   2. contours grouped per object (design file + string number) and per
+#      elevation; between two consecutive elevations of an object the volume
+#      is the prism (average end area) (A0 + A1) / 2 * dz
+#   3. those volumes split into fixed benches (area interpolated linearly
+#      inside each interval) and multiplied by the density
+#
+# Phases come from the design store tags (PitDesignFile.mine_phase); a
+# single pit_design.str is reported as the whole pit. With
+# DESIGN_PHASE_SHELLS_NESTED each phase file is a full shell, so per bench a
+# phase only counts what its shell adds to the previous phases of the same pit
+# (in phase sequence order); 'shell_volume' / 'shell_tonnes' keep the full shell.
+# Results are kept per design version + density + bench height (+ nesting)
+# under DATA_CACHE_DIR/design_volumes/.
+
+LEVEL_DECIMALS = 0  # contour elevations are grouped to the metre (ramps wobble a little)
+
+_memo = {}
+_lock = threading.Lock()
+
+
+def contour_areas(geometry, segments):
+    """Plan area (m2) of each given closed segment, by the shoelace formula, without a Python loop."""
+    if not len(segments):
+        return np.empty(0)
+    xy = np.asarray(geometry.xyz[:, :2], dtype=np.float64)
+    xy = xy - xy.mean(axis=0)  # keeps the cross products small for UTM coordinates
+    cross = xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1]  # edge i -> i + 1
+    running = np.concatenate([[0.0], np.cumsum(cross)])
+    offsets = np.asarray(geometry.segment_offsets)
+    # Edges first .. last - 1 of each contour (closed: the last vertex repeats the first)
+    twice = running[offsets[segments + 1] - 1] - running[offsets[segments]]
+    return np.abs(twice) / 2
+
+
+def _interval_volumes(group, levels, areas):
+    """
+    Prism volumes between consecutive elevations of each group.
+    Returns (group, z0, z1, a0, a1) arrays, one row per interval.
+    """
+    order = np.lexsort((levels, group))
+    group, levels, areas = group[order], levels[order], areas[order]
+    # Several contours of one object at one elevation (islands) -> add their areas
+    key_change = np.flatnonzero(np.diff(group) != 0) + 1
+    level_change = np.flatnonzero(np.diff(levels) != 0) + 1
+    starts = np.union1d(key_change, level_change)
+    starts = np.concatenate([[0], starts]).astype(np.int64) if len(group) else np.empty(0, dtype=np.int64)
+    g, z, a = group[starts], levels[starts], np.add.reduceat(areas, starts) if len(starts) else np.empty(0)
+
+    same = g[:-1] == g[1:]
+    return g[:-1][same], z[:-1][same], z[1:][same], a[:-1][same], a[1:][same]
+
+
+def _bench_split(z0, z1, a0, a1, edges):
+    """(intervals x benches) volumes: each interval's prism cut at the bench edges."""
+    lo = np.maximum(z0[:, None], edges[None, :-1])
+    hi = np.minimum(z1[:, None], edges[None, 1:])
+    height = np.clip(hi - lo, 0, None)
+    span = (z1 - z0)[:, None]
+    area_lo = a0[:, None] + (a1 - a0)[:, None] * (lo - z0[:, None]) / span
+    area_hi = a0[:, None] + (a1 - a0)[:, None] * (hi - z0[:, None]) / span
+    return (area_lo + area_hi) / 2 * height
+
+
+def compute_design_volumes(geometry, segment_source=None, sources=None, density=None, bench_height=None, nested=None):
+    """
+    Bench and phase volumes / tonnes of the closed contours in 'geometry'.
+    segment_source + sources are the design store tags (None = one whole-pit source);
+    nested defaults to DESIGN_PHASE_SHELLS_NESTED (see above).
+    Returns a JSON-ready dict with 'benches', 'phases' and 'total'.
+    """
+    density = float(density or settings.BLOCK_MODEL_DEFAULT_DENSITY)
+    bench_height = float(bench_height or settings.DESIGN_BENCH_HEIGHT)
+    nested = settings.DESIGN_PHASE_SHELLS_NESTED if nested is None else nested
+    sources = sources or [{'pit': None, 'phase_id': None, 'phase_name': None, 'name': 'pit_design.str'}]
+    result = {'density': density, 'bench_height': bench_height, 'benches': [], 'phases': [], 'total': {'volume': 0.0, 'tonnes': 0.0}}
+
+    contours = StringIndex(geometry)
+    if not len(contours):
+        return result
+    segments = contours.segments
+    source = (np.asarray(segment_source)[segments] if segment_source is not None
+              else np.zeros(len(segments), dtype=np.int64)).astype(np.int64)
+    areas = contour_areas(geometry, segments)
+    levels = np.round(contours.levels, LEVEL_DECIMALS)
+
+    # One object = one string number in one design file
+    objects, group = np.unique(np.column_stack([source, contours.string_ids]), axis=0, return_inverse=True)
+    group = np.asarray(group).ravel()
+    g, z0, z1, a0, a1 = _interval_volumes(group, levels, areas)
+    if not len(g):
+        return result
+
+    first = np.floor(z0.min() / bench_height) * bench_height
+    edges = np.arange(first, z1.max() + bench_height, bench_height)
+    volumes = _bench_split(z0, z1, a0, a1, edges)  # (intervals, benches)
+    source_of_interval = objects[g, 0]
+
+    def bench_rows(per_bench):
+        return [
+            {'z_from': round(float(edges[i]), 2), 'z_to': round(float(edges[i + 1]), 2),
+             'volume': round(float(v), 1), 'tonnes': round(float(v) * density, 1)}
+            for i, v in enumerate(per_bench) if v > 0
+        ]
+
+    # Per phase (sources sharing a phase id; files with no phase count per pit).
+    # Sources come in phase sequence order per pit (design_file_entries).
+    phase_keys = [('phase', s['phase_id']) if s.get('phase_id') else ('pit', s.get('pit')) for s in sources]
+    mined_before = {}  # pit -> per bench volume of the phase shells so far
+    total = np.zeros(len(edges) - 1)
+    for key in dict.fromkeys(phase_keys):
+        members = [i for i, k in enumerate(phase_keys) if k == key]
+        shell = volumes[np.isin(source_of_interval, members)].sum(axis=0)
+        if not shell.any():
+            continue
+        first_source = sources[members[0]]
+        per_bench = shell
+        if key[0] == 'phase' and nested:
+            pit = first_source.get('pit')
+            previous = mined_before.get(pit)
+            if previous is not None:
+                per_bench = np.clip(shell - previous, 0, None)
+                shell = np.maximum(shell, previous)
+            mined_before[pit] = shell
+        total += per_bench
+        volume = float(per_bench.sum())
+        result['phases'].append({
+            'phase_id': first_source.get('phase_id'),
+            'phase_name': first_source.get('phase_name') or 'Whole pit',
+            'pit': first_source.get('pit'),
+            'volume': round(volume, 1),
+            'tonnes': round(volume * density, 1),
+            'shell_volume': round(float(shell.sum()), 1),
+            'shell_tonnes': round(float(shell.sum()) * density, 1),
+            'benches': bench_rows(per_bench),
+        })
+
+    result['benches'] = bench_rows(total)
+    result['total'] = {'volume': round(float(total.sum()), 1), 'tonnes': round(float(total.sum()) * density, 1)}
+    return result
+
+
+def design_volumes(design_key, geometry, segment_source=None, sources=None, density=None, bench_height=None):
+    """compute_design_volumes(), cached per design version (design_key), density and bench height."""
+    density = float(density or settings.BLOCK_MODEL_DEFAULT_DENSITY)
+    bench_height = float(bench_height or settings.DESIGN_BENCH_HEIGHT)
+    nested = bool(settings.DESIGN_PHASE_SHELLS_NESTED)
+    key = f'{design_key}-{density:g}-{bench_height:g}-{"nested" if nested else "solid"}'
+    with _lock:
+        if key in _memo:
+            return _memo[key]
+
+    path = os.path.join(settings.DATA_CACHE_DIR, 'design_volumes', f'{key}.json') if design_key else None
+    result = None
+    if path and os.path.exists(path):
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            result = None
+
+    if result is None:
+        result = compute_design_volumes(geometry, segment_source, sources, density, bench_height, nested)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.json')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(result, f)
+            os.replace(tmp, path)
+
+    if design_key:
+        with _lock:
+            _memo[key] = result
+    return result
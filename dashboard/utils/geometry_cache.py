@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from dashboard.utils.simplify import build_lods, choose_lod
+from dashboard.utils.str_parser import StrGeometry, read_str_geometry
+
+# ==========================================
+# PARSED GEOMETRY CACHE
+# ==========================================
+# The pit design only changes when a new .str file is uploaded, so it is parsed
+# once and the arrays are kept on disk as .npy files that every request opens
+# with mmap. Layout under DATA_CACHE_DIR/geometry/:
+#
+#   <content sha1>/xyz.npy, segment_offsets.npy, string_ids.npy
+#   <content sha1>/lod_masks.npy, lod.json   -> simplified detail levels
+#   <sha1 of source path>.json   -> {size, mtime_ns, hash, ...} of the source file
+#
+# Array folders are named by content hash, so touching or re-uploading the same
+# file reuses the existing arrays.
+
+CACHE_STATS = {'hits': 0, 'misses': 0, 'builds': 0}
+
+_ARRAYS = ('xyz', 'segment_offsets', 'string_ids')
+_memo = {}
+_lod_memo = {}
+_lock = threading.Lock()
+
+
+def _cache_root():
+    return os.path.join(settings.DATA_CACHE_DIR, 'geometry')
+
+
+def _manifest_path(file_path):
+    key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+    return os.path.join(_cache_root(), f'{key}.json')
+
+
+def content_hash(file_path, block_size=1 << 20):
+    """SHA1 of the file contents, read in 1 MB blocks."""
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_manifest(file_path):
+    try:
+        with open(_manifest_path(file_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _open_arrays(digest):
+    folder = os.path.join(_cache_root(), digest)
+    arrays = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r') for name in _ARRAYS}
+    return StrGeometry(arrays['xyz'], arrays['segment_offsets'], arrays['string_ids'])
+
+
+def _write_arrays(digest, geometry):
+    folder = os.path.join(_cache_root(), digest)
+    if os.path.isdir(folder):
+        return
+    tmp = tempfile.mkdtemp(dir=_cache_root(), prefix='.build-')
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp, f'{name}.npy'), getattr(geometry, name))
+    _write_lods(tmp, geometry)
+    try:
+        os.rename(tmp, folder)
+    except OSError:
+        # Another worker finished the same hash first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _write_lods(folder, geometry):
+    masks, levels = build_lods(geometry)
+    np.save(os.path.join(folder, 'lod_masks.npy'), masks)
+    _write_json_atomic(os.path.join(folder, 'lod.json'), levels)
+    return masks, levels
+
+
+def _open_lods(digest, geometry):
+    if digest in _lod_memo:
+        return _lod_memo[digest]
+    folder = os.path.join(_cache_root(), digest)
+    try:
+        masks = np.load(os.path.join(folder, 'lod_masks.npy'), mmap_mode='r')
+        with open(os.path.join(folder, 'lod.json')) as f:
+            levels = json.load(f)
+    except (OSError, ValueError):
+        # Cache built before detail levels existed
+        masks, levels = _write_lods(folder, geometry)
+    _lod_memo[digest] = (masks, levels)
+    return masks, levels
+
+
+def build_geometry_cache(file_path):
+    """
+    Parses file_path and stores its arrays + manifest.
+    Called from upload_block_model so dashboard requests never parse text.
+    Returns the memory-mapped StrGeometry.
+    """
+    os.makedirs(_cache_root(), exist_ok=True)
+    stat = os.stat(file_path)
+    digest = content_hash(file_path)
+
+    if not os.path.isdir(os.path.join(_cache_root(), digest)):
+        _write_arrays(digest, read_str_geometry(file_path))
+        CACHE_STATS['builds'] += 1
+
+    manifest = {
+        'source': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': digest,
+    }
+    _write_json_atomic(_manifest_path(file_path), manifest)
+
+    geometry = _open_arrays(digest)
+    with _lock:
+        _memo[os.path.abspath(file_path)] = (stat.st_size, stat.st_mtime_ns, digest, geometry)
+    return geometry
+
+
+def invalidate_geometry_cache(file_path):
+    """Forgets the cached geometry for file_path (the arrays stay for reuse by hash)."""
+    with _lock:
+        _memo.pop(os.path.abspath(file_path), None)
+    try:
+        os.remove(_manifest_path(file_path))
+    except OSError:
+        pass
+
+
+def is_geometry_cached(file_path):
+    """True if the on-disk cache matches the file's current size and mtime."""
+    manifest = _read_manifest(file_path)
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return False
+    return bool(manifest) and manifest['size'] == stat.st_size and manifest['mtime_ns'] == stat.st_mtime_ns
+
+
+def _lookup(file_path):
+    """Returns (hash, geometry) for file_path, rebuilding the cache if the file changed."""
+    path = os.path.abspath(file_path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None, StrGeometry()
+
+    # 1. Already open in this process
+    memo = _memo.get(path)
+    if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+        CACHE_STATS['hits'] += 1
+        return memo[2], memo[3]
+
+    # 2. Built by another process (or before a restart)
+    manifest = _read_manifest(path)
+    if manifest and manifest['size'] == stat.st_size and manifest['mtime_ns'] == stat.st_mtime_ns:
+        try:
+            geometry = _open_arrays(manifest['hash'])
+        except OSError:
+            geometry = None
+        if geometry is not None:
+            CACHE_STATS['hits'] += 1
+            with _lock:
+                _memo[path] = (stat.st_size, stat.st_mtime_ns, manifest['hash'], geometry)
+            return manifest['hash'], geometry
+
+    # 3. Missing or stale -> parse once
+    CACHE_STATS['misses'] += 1
+    geometry = build_geometry_cache(path)
+    return _memo[path][2], geometry
+
+
+def load_pit_geometry(file_path):
+    """Cached replacement for read_str_geometry(): memory-mapped, parsed at most once per file version."""
+    return _lookup(file_path)[1]
+
+
+def load_pit_geometry_lod(file_path, point_budget):
+    """
+    Returns (geometry, level) for the finest precomputed detail level with at
+    most point_budget vertices. 'level' is the lod.json entry (tolerance, error).
+    """
+    digest, geometry = _lookup(file_path)
+    if not geometry:
+        return geometry, None
+    masks, levels = _open_lods(digest, geometry)
+    level = levels[choose_lod(levels, point_budget)]
+    if level['tolerance'] <= 0:
+        return geometry, level
+    return geometry.take_vertices(np.asarray(masks[level['level']])), level
+
+
+def pit_geometry_levels(file_path):
+    """Detail levels of the cached geometry with their point counts and deviation from the source."""
+    digest, geometry = _lookup(file_path)
+    if not geometry:
+        return []
+    return _open_lods(digest, geometry)[1]
+
+
+def geometry_version(file_path):
+    """Content hash of the cached geometry (None if the file is missing). Used as a cache key downstream."""
+    return _lookup(file_path)[0]
@@ -0,0 +1,233 @@
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from dashboard.utils.block_store import load_block_store, open_block_store
+from dashboard.utils.spatial_index import build_point_index, load_block_index
+
+# ==========================================
+# INVERSE-DISTANCE GRADE ESTIMATION
+# ==========================================
+# Grade-control samples (OreSample with x / y / z) are spread onto the block
+# model by inverse-distance weighting: every block within the search radius
+# of at least one sample gets
+#
+#   grade = sum(g_i / d_i^p) / sum(1 / d_i^p)
+#
+# Neighbours come from a PointIndex over the samples (pairs_within), so the
+# work is proportional to the block / sample pairs actually in range. Large
+# runs are split into row chunks handled by a process pool.
+#
+# The estimate lives next to the block store, one value per block (NaN = no
+# sample in range), under DATA_CACHE_DIR/estimates/<block version>/:
+#
+#   grade.npy      float32
+#   state.json     {radius, power, last_sample, revision}
+#
+# A new sample only changes blocks within one radius of it, so those blocks
+# are re-estimated (from all samples) and the rest of the file is kept.
+#
+# Sample saves do not wait for any of this: schedule_grade_estimate() runs
+# the update in a background thread, and requests made while one is running
+# are merged into a single follow-up run (full if any of them asked for it).
+
+CHUNK_BLOCKS = 250_000
+MIN_DISTANCE = 0.01  # m, caps the weight of a sample sitting on a block centre
+
+_lock = threading.Lock()
+
+_schedule_lock = threading.Lock()
+_scheduled = {'pending': False, 'full': False, 'running': False, 'last': None}
+_runner = None
+
+
+def _folder(version):
+    return os.path.join(settings.DATA_CACHE_DIR, 'estimates', version)
+
+
+def _params():
+    return {'radius': float(settings.GRADE_ESTIMATE_RADIUS), 'power': float(settings.GRADE_ESTIMATE_POWER)}
+
+
+def located_samples(since=None):
+    """(ids, xyz, grades) of the OreSamples that have coordinates, optionally only id > since."""
+    from dashboard.models import OreSample
+
+    samples = OreSample.objects.filter(x__isnull=False, y__isnull=False, z__isnull=False)
+    if since is not None:
+        samples = samples.filter(id__gt=since)
+    rows = np.array(list(samples.order_by('id').values_list('id', 'x', 'y', 'z', 'actual_grade_g_t')), dtype=np.float64)
+    if not len(rows):
+        return np.empty(0, dtype=np.int64), np.empty((0, 3)), np.empty(0)
+    return rows[:, 0].astype(np.int64), rows[:, 1:4], rows[:, 4]
+
+
+def idw_estimate(bx, by, bz, sample_xyz, sample_grades, radius, power):
+    """IDW grade for each block position (NaN where no sample is within radius)."""
+    estimate = np.full(len(bx), np.nan)
+    if not len(sample_xyz) or not len(bx):
+        return estimate
+    index = build_point_index(sample_xyz[:, 0], sample_xyz[:, 1], sample_xyz[:, 2], cell=radius)
+    query, rows, dist = index.pairs_within(bx, by, bz, radius)
+    weights = 1.0 / np.maximum(dist, MIN_DISTANCE) ** power
+    total = np.bincount(query, weights=weights, minlength=len(bx))
+    metal = np.bincount(query, weights=weights * sample_grades[rows], minlength=len(bx))
+    np.divide(metal, total, out=estimate, where=total > 0)
+    return estimate
+
+
+def _estimate_chunk(task):
+    """Worker: IDW for one chunk of block rows, read from the memory-mapped store."""
+    version, rows, sample_xyz, sample_grades, radius, power = task
+    blocks = open_block_store(version)
+    return idw_estimate(blocks.x[rows], blocks.y[rows], blocks.z[rows], sample_xyz, sample_grades, radius, power)
+
+
+def _init_worker():
+    # Spawned workers (Windows / macOS) start without Django configured
+    if not apps.ready:
+        django.setup()
+
+
+def estimate_rows(blocks, rows, sample_xyz, sample_grades, workers=None):
+    """IDW estimates for the given block rows, chunked over a process pool when large."""
+    params = _params()
+    chunks = [rows[i:i + CHUNK_BLOCKS] for i in range(0, len(rows), CHUNK_BLOCKS)]
+    tasks = [(blocks.version, chunk, sample_xyz, sample_grades, params['radius'], params['power']) for chunk in chunks]
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if len(tasks) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            parts = list(pool.map(_estimate_chunk, tasks))
+    else:
+        parts = [_estimate_chunk(task) for task in tasks]
+    return np.concatenate(parts) if parts else np.empty(0)
+
+
+def _read_state(version):
+    try:
+        with open(os.path.join(_folder(version), 'state.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_grade_estimate(blocks):
+    """The stored estimate (memory-mapped, NaN = not estimated) for this block version, or None."""
+    if not blocks or not blocks.version:
+        return None
+    try:
+        return np.load(os.path.join(_folder(blocks.version), 'grade.npy'), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+def _save(version, estimate, state):
+    folder = _folder(version)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, estimate.astype(np.float32))
+    os.replace(tmp, os.path.join(folder, 'grade.npy'))
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, os.path.join(folder, 'state.json'))
+
+
+def update_grade_estimate(blocks, full=False, workers=None):
+    """
+    Brings the estimate up to date with the located samples. Only blocks within
+    range of samples added since the last run are re-estimated, unless 'full'
+    (or there is no estimate yet / the radius or power changed).
+    Returns {'mode', 'blocks_updated', 'samples'}.
+    """
+    if not blocks or not blocks.version:
+        return {'mode': 'none', 'blocks_updated': 0, 'samples': 0}
+
+    with _lock:
+        params = _params()
+        state = _read_state(blocks.version)
+        current = load_grade_estimate(blocks)
+        ids, sample_xyz, sample_grades = located_samples()
+        last_sample = int(ids.max()) if len(ids) else 0
+        revision = (state or {}).get('revision', 0) + 1
+        if current is None or state is None or full or {k: state.get(k) for k in params} != params:
+            rows = np.arange(len(blocks))
+            estimate = estimate_rows(blocks, rows, sample_xyz, sample_grades, workers)
+            _save(blocks.version, estimate, {**params, 'last_sample': last_sample, 'revision': revision})
+            return {'mode': 'full', 'blocks_updated': int(np.isfinite(estimate).sum()), 'samples': len(ids)}
+
+        new_ids, new_xyz, _ = located_samples(since=state['last_sample'])
+        if not len(new_ids):
+            return {'mode': 'unchanged', 'blocks_updated': 0, 'samples': len(ids)}
+
+        # Blocks within one radius of a new sample: the only ones whose estimate can change
+        _, rows, _ = load_block_index(blocks).pairs_within(new_xyz[:, 0], new_xyz[:, 1], new_xyz[:, 2], params['radius'])
+        rows = np.unique(rows)
+        estimate = np.array(current, dtype=np.float32)
+        estimate[rows] = estimate_rows(blocks, rows, sample_xyz, sample_grades, workers)
+        _save(blocks.version, estimate, {**params, 'last_sample': last_sample, 'revision': revision})
+        return {'mode': 'incremental', 'blocks_updated': len(rows), 'samples': len(ids)}
+
+
+def _run_scheduled():
+    global _runner
+    close_old_connections()
+    try:
+        while True:
+            with _schedule_lock:
+                if not _scheduled['pending']:
+                    _scheduled['running'] = False
+                    _runner = None
+                    return
+                full = _scheduled['full']
+                _scheduled.update(pending=False, full=False, running=True)
+            try:
+                result = update_grade_estimate(load_block_store(), full=full)
+                print(f"Grade estimate {result['mode']}: {result['blocks_updated']} blocks")
+            except Exception as e:
+                print(f"Grade estimation failed: {e}")
+                result = {'mode': 'failed', 'error': str(e)}
+            with _schedule_lock:
+                _scheduled['last'] = result
+    finally:
+        connection.close()
+
+
+def schedule_grade_estimate(full=False):
+    """Queues update_grade_estimate() on the background thread (returns at once)."""
+    global _runner
+    with _schedule_lock:
+        _scheduled['pending'] = True
+        _scheduled['full'] = _scheduled['full'] or full
+        if _runner is None:
+            _runner = threading.Thread(target=_run_scheduled, name='grade-estimate', daemon=True)
+            _runner.start()
+
+
+def grade_estimate_status():
+    """{'running', 'pending', 'full', 'last'}: the background run and the result of the last one in this process."""
+    with _schedule_lock:
+        return dict(_scheduled)
+
+
+def estimate_key(blocks):
+    """Changes whenever the stored estimate does (for caches of things derived from it)."""
+    state = _read_state(blocks.version) if blocks and blocks.version else None
+    return state.get('revision') if state else None
+
+
+def estimated_grade(blocks):
+    """Block grades with the sample estimate applied where there is one (model grade elsewhere)."""
+    estimate = load_grade_estimate(blocks)
+    if estimate is None or len(estimate) != len(blocks):
+        return np.asarray(blocks.grade)
+    return np.where(np.isfinite(estimate), estimate, blocks.grade).astype(np.float32)
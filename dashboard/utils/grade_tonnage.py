@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+
+# ==========================================
+# GRADE-TONNAGE CURVES
+# ==========================================
+# Tonnes and mean grade above each cutoff, per phase and for the whole pit,
+# straight from the block store. Each block is dropped into a
+# (phase, cutoff interval) bin with one searchsorted + bincount, and a reversed
+# cumulative sum over the intervals gives "tonnes / metal above cutoff" for
+# every cutoff at once. The pit curve is the sum of the phase curves, so it
+# costs nothing extra. Results are kept per (block version, cutoffs), for
+# the MEMO_SIZE most recently used cutoff lists.
+
+DEFAULT_CUTOFFS = tuple(np.round(np.arange(0.0, 5.01, 0.25), 2))
+UNASSIGNED = 'Unassigned'
+MEMO_SIZE = 32
+
+_memo = {}  # insertion ordered: oldest first
+_lock = threading.Lock()
+
+
+def _curve(tonnes, metal):
+    grade = np.divide(metal, tonnes, out=np.zeros_like(metal), where=tonnes > 0)
+    return {
+        'tonnes': np.round(tonnes, 1).tolist(),
+        'metal': np.round(metal, 1).tolist(),
+        'grade': np.round(grade, 3).tolist(),
+    }
+
+
+def compute_grade_tonnage(blocks, cutoffs=DEFAULT_CUTOFFS, grade=None):
+    """
+    Grade-tonnage curves for every phase label in the block store plus the
+    whole pit ('grade' overrides the block grades, e.g. the sample estimate).
+    Returns a JSON-ready dict:
+    {'cutoffs': [...], 'pit': curve, 'phases': [{'label', **curve}, ...]}
+    where curve = {'tonnes': [...], 'metal': [...], 'grade': [...]} per cutoff.
+    """
+    cutoffs = np.unique(np.asarray(cutoffs, dtype=np.float64))
+    labels = list(blocks.phase_labels) + [UNASSIGNED]
+    n_bins = len(cutoffs) + 1
+
+    grade = np.asarray(blocks.grade if grade is None else grade, dtype=np.float64)
+    tonnes = np.asarray(blocks.tonnes, dtype=np.float64)
+    phase = np.asarray(blocks.phase, dtype=np.int64)
+    phase = np.where(phase < 0, len(labels) - 1, phase)
+
+    # Interval j holds blocks with cutoffs[j-1] <= grade < cutoffs[j]
+    key = phase * n_bins + np.searchsorted(cutoffs, grade, side='right')
+    size = len(labels) * n_bins
+    binned_tonnes = np.bincount(key, weights=tonnes, minlength=size).reshape(len(labels), n_bins)
+    binned_metal = np.bincount(key, weights=tonnes * grade, minlength=size).reshape(len(labels), n_bins)
+
+    # Above cutoff i = intervals i+1 .. end
+    above_tonnes = np.cumsum(binned_tonnes[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    above_metal = np.cumsum(binned_metal[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+    present = binned_tonnes.sum(axis=1) > 0
+    return {
+        'version': blocks.version,
+        'cutoffs': cutoffs.tolist(),
+        'pit': _curve(above_tonnes.sum(axis=0), above_metal.sum(axis=0)),
+        'phases': [
+            {'label': label, **_curve(above_tonnes[i], above_metal[i])}
+            for i, label in enumerate(labels) if present[i]
+        ],
+    }
+
+
+def grade_tonnage_curves(blocks, cutoffs=DEFAULT_CUTOFFS, grade=None, grade_key=None):
+    """
+    compute_grade_tonnage(), cached per block model version and cutoff list
+    (and grade_key, identifying the 'grade' override if one is given).
+    """
+    key = (blocks.version, tuple(float(c) for c in cutoffs), grade_key)
+    with _lock:
+        if key in _memo:
+            _memo[key] = _memo.pop(key)  # most recently used last
+            return _memo[key]
+    result = compute_grade_tonnage(blocks, cutoffs, grade)
+    if blocks.version:
+        with _lock:
+            _memo[key] = result
+            while len(_memo) > MEMO_SIZE:
+                del _memo[next(iter(_memo))]
+    return result
@@ -0,0 +1,74 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from dashboard.utils.broadcast import send_to_group
+
+# ==========================================
+# LIVE DASHBOARD TOPICS
+# ==========================================
+# Typed topics pushed to dashboards over ws/live/ (LiveUpdatesConsumer).
+# Each topic carries items in the same shape as its REST endpoint, so a
+# client loads a snapshot over REST once and then applies deltas by key:
+#
+#   production       /api/production/daily/ rows    key: timestamp (the day)
+#   demand           /api/plantdemand/ rows         key: id
+#   stockpile        /api/stockpiles/ rows          key: id
+#   phase_progress   /api/phaseschedule/ rows       key: id
+#
+# Items are always the full current state of the row, never increments, so
+# a client may miss or merge any number of them and still end up right.
+# publish() sends after the transaction commits (nothing rolled back is
+# pushed); the consumer throttles per client.
+
+TOPICS = {
+    'production': 'timestamp',
+    'demand': 'id',
+    'stockpile': 'id',
+    'phase_progress': 'id',
+}
+
+
+def topic_group(topic):
+    return f"live.{topic}"
+
+
+def publish(topic, items=(), deleted=()):
+    """Pushes changed items and deleted keys of a topic to its subscribers once the transaction commits."""
+    if topic not in TOPICS:
+        raise ValueError(f"Unknown live topic: {topic}")
+    if not items and not deleted:
+        return
+    # Plain JSON values (dates, decimals...), as any channel layer can carry them
+    message = json.loads(json.dumps({
+        "type": "topic.delta",
+        "topic": topic,
+        "items": list(items),
+        "deleted": list(deleted),
+    }, cls=DjangoJSONEncoder))
+    send_to_group(topic_group(topic), message)
+
+
+def publish_production_days(days):
+    """Current daily production rows of the given days (a day left without production is deleted)."""
+    from dashboard.models import DailyProductionRollup
+    from dashboard.utils.production_rollup import daily_production
+
+    rows = daily_production(DailyProductionRollup.objects.filter(day__in=days)) if days else []
+    found = {row['timestamp'] for row in rows}
+    publish('production', rows, deleted=[day for day in sorted(days) if day not in found])
+
+
+def publish_instance(topic, instance, deleted=False):
+    """Pushes one demand / stockpile / phase schedule row as its REST serializer renders it."""
+    from dashboard.serializers import PhaseScheduleSerializer, PlantDemandSerializer, StockpileSerializer
+
+    if deleted:
+        publish(topic, deleted=[instance.pk])
+        return
+    serializer = {
+        'demand': PlantDemandSerializer,
+        'stockpile': StockpileSerializer,
+        'phase_progress': PhaseScheduleSerializer,
+    }[topic]
+    publish(topic, [serializer(instance).data])
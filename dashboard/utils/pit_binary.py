@@ -0,0 +1,40 @@
+import struct
+
+import numpy as np
+
+# ==========================================
+# BINARY PIT GEOMETRY FORMAT (little-endian)
+# ==========================================
+#   offset  type          field
+#   0       4s            magic b'PITG'
+#   4       uint16        format version (1)
+#   6       uint16        reserved
+#   8       uint32        S = number of segments
+#   12      uint32        N = number of vertices
+#   16      float64 x 3   origin (x, y, z) subtracted from every vertex
+#   40      int32[S]      string id of each segment
+#   ..      uint32[S+1]   segment offsets into the vertex list
+#   ..      float32[N*3]  x, y, z per vertex, relative to origin
+#
+# UTM northings (~8,099,000) only keep ~0.5 m in float32, hence the origin:
+# relative coordinates stay at millimetre precision. Every block starts on a
+# 4-byte boundary, so a browser can wrap them in typed arrays without copying.
+
+MAGIC = b'PITG'
+VERSION = 1
+_HEADER = struct.Struct('<4sHHII3d')
+CONTENT_TYPE = 'application/octet-stream'
+
+
+def encode_geometry(geometry):
+    """Packs a StrGeometry into the PITG byte layout above."""
+    xyz = np.asarray(geometry.xyz, dtype=np.float64)
+    origin = np.floor(xyz.min(axis=0)) if len(xyz) else np.zeros(3)
+
+    header = _HEADER.pack(MAGIC, VERSION, 0, geometry.n_segments, geometry.n_vertices, *origin.tolist())
+    return b''.join([
+        header,
+        np.asarray(geometry.string_ids, dtype='<i4').tobytes(),
+        np.asarray(geometry.segment_offsets, dtype='<u4').tobytes(),
+        (xyz - origin).astype('<f4').tobytes(),
+    ])
@@ -0,0 +1,247 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from PIL import Image, ImageDraw
+
+from dashboard.utils.geometry_cache import geometry_version, load_pit_geometry, load_pit_geometry_lod, pit_geometry_levels
+
+# ==========================================
+# 2D PLAN VIEW TILE PYRAMID
+# ==========================================
+# Light-weight plan map for field tablets: pit strings (white) and PitBlock
+# status squares drawn into 256 px PNG tiles, z/x/y addressed like a web map
+# (zoom 0 = one tile for the whole pit, y counted from the north edge).
+# Layout under DATA_CACHE_DIR/tiles/:
+#
+#   <geometry version>/extent.json       square world extent of zoom 0
+#   <geometry version>/<z>/<x>/<y>.png
+#
+# A new pit design gives a new pyramid. A PitBlock change deletes only the
+# tiles under that block (every zoom); they are re-rendered on the next request.
+
+TILE_SIZE = 256
+BACKGROUND = (0, 0, 0, 255)
+STRING_COLOUR = (255, 255, 255, 255)
+STATUS_COLOURS = {
+    'planned': (133, 135, 150, 255),
+    'in_progress': (246, 194, 62, 255),
+    'mined': (28, 200, 138, 255),
+}
+
+_bbox_memo = {}
+_lock = threading.Lock()
+
+
+def _cache_root():
+    return os.path.join(settings.DATA_CACHE_DIR, 'tiles')
+
+
+def _pyramid_dir(key):
+    return os.path.join(_cache_root(), key)
+
+
+def tile_path(key, z, x, y):
+    return os.path.join(_pyramid_dir(key), str(z), str(x), f'{y}.png')
+
+
+def plan_extent(str_path):
+    """
+    (min_x, max_y, size): north-west corner and edge length (m) of the square
+    covered by zoom 0, the pit strings' bounds padded by 5 %. Stored per pyramid.
+    None if the design has no strings.
+    """
+    key = geometry_version(str_path)
+    path = os.path.join(_pyramid_dir(key), 'extent.json')
+    try:
+        with open(path) as f:
+            return tuple(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+    bounds = load_pit_geometry(str_path).bounds()
+    if bounds is None:
+        return None
+    (min_x, min_y, _), (max_x, max_y, _) = bounds
+    size = max(max_x - min_x, max_y - min_y, 1.0) * 1.05
+    cx, cy = (min_x + max_x) / 2, (min_y + max_y) / 2
+    extent = (float(cx - size / 2), float(cy + size / 2), float(size))
+
+    os.makedirs(_pyramid_dir(key), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=_pyramid_dir(key), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(extent, f)
+    os.replace(tmp, path)
+    return extent
+
+
+def tile_bounds(extent, z, x, y):
+    """World (x0, y_top, x1, y_bottom) of tile z/x/y."""
+    min_x, max_y, size = extent
+    step = size / (1 << z)
+    return min_x + x * step, max_y - y * step, min_x + (x + 1) * step, max_y - (y + 1) * step
+
+
+def tiles_covering(extent, z, x0, y0, x1, y1):
+    """(x, y) indices of the zoom z tiles touching the world box [x0, x1] x [y0, y1]."""
+    min_x, max_y, size = extent
+    n = 1 << z
+    step = size / n
+    tx0, tx1 = int((x0 - min_x) // step), int((x1 - min_x) // step)
+    ty0, ty1 = int((max_y - y1) // step), int((max_y - y0) // step)
+    return [
+        (tx, ty)
+        for tx in range(max(tx0, 0), min(tx1, n - 1) + 1)
+        for ty in range(max(ty0, 0), min(ty1, n - 1) + 1)
+    ]
+
+
+def _geometry_for_pixel(str_path, pixel_size):
+    """Coarsest cached detail level whose deviation stays under one pixel."""
+    levels = pit_geometry_levels(str_path)
+    fitting = [level for level in levels if level['tolerance'] <= pixel_size]
+    level = max(fitting, key=lambda l: l['tolerance']) if fitting else None
+    geometry, _ = load_pit_geometry_lod(str_path, level['points'] if level else None)
+    return geometry, level['level'] if level else 0
+
+
+def _segment_bboxes(geometry, memo_key):
+    """Per-segment (min_x, min_y, max_x, max_y), memoized per geometry + level."""
+    with _lock:
+        if memo_key in _bbox_memo:
+            return _bbox_memo[memo_key]
+    xy = np.asarray(geometry.xyz[:, :2])
+    starts = np.asarray(geometry.segment_offsets[:-1])
+    boxes = np.column_stack([np.minimum.reduceat(xy, starts), np.maximum.reduceat(xy, starts)])
+    with _lock:
+        _bbox_memo[memo_key] = boxes
+    return boxes
+
+
+def render_tile(str_path, z, x, y):
+    """Draws tile z/x/y (pit strings + PitBlock status squares) and returns a PIL image."""
+    from dashboard.models import PitBlock
+
+    extent = plan_extent(str_path)
+    x0, y_top, x1, y_bottom = tile_bounds(extent, z, x, y)
+    scale = TILE_SIZE / (x1 - x0)  # pixels per metre
+
+    image = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+
+    # 1. Blocks (under the strings), one square per PitBlock footprint
+    dx, dy, _ = settings.BLOCK_MODEL_DEFAULT_SIZE
+    nearby = PitBlock.objects.filter(
+        x_position__gte=x0 - dx, x_position__lte=x1 + dx,
+        y_position__gte=y_bottom - dy, y_position__lte=y_top + dy,
+    ).values_list('x_position', 'y_position', 'status')
+    for bx, by, status in nearby:
+        px0, py0 = (bx - dx / 2 - x0) * scale, (y_top - by - dy / 2) * scale
+        px1, py1 = (bx + dx / 2 - x0) * scale, (y_top - by + dy / 2) * scale
+        draw.rectangle([px0, py0, max(px1, px0 + 1), max(py1, py0 + 1)], fill=STATUS_COLOURS.get(status, STATUS_COLOURS['planned']))
+
+    # 2. Pit strings intersecting the tile, at a detail level matching the pixel size
+    geometry, level = _geometry_for_pixel(str_path, 1 / scale)
+    if geometry:
+        boxes = _segment_bboxes(geometry, (geometry_version(str_path), level))
+        hit = np.flatnonzero((boxes[:, 2] >= x0) & (boxes[:, 0] <= x1) & (boxes[:, 3] >= y_bottom) & (boxes[:, 1] <= y_top))
+        offsets = np.asarray(geometry.segment_offsets)
+        xy = np.asarray(geometry.xyz[:, :2])
+        for s in hit:
+            seg = xy[offsets[s]:offsets[s + 1]]
+            pixels = np.column_stack([(seg[:, 0] - x0) * scale, (y_top - seg[:, 1]) * scale])
+            if len(pixels) > 1:
+                draw.line(pixels.ravel().tolist(), fill=STRING_COLOUR, width=1)
+
+    return image
+
+
+def ensure_tile(str_path, z, x, y):
+    """Path of the cached PNG for tile z/x/y, rendering it first if missing."""
+    path = tile_path(geometry_version(str_path), z, x, y)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.png')
+        with os.fdopen(fd, 'wb') as f:
+            render_tile(str_path, z, x, y).save(f, format='PNG', optimize=True)
+        os.replace(tmp, path)
+    return path
+
+
+def _render_task(task):
+    """Worker: render one tile into the cache."""
+    str_path, z, x, y = task
+    ensure_tile(str_path, z, x, y)
+    return z
+
+
+def _init_worker():
+    # Spawned workers (Windows / macOS) start without Django configured
+    if not apps.ready:
+        django.setup()
+    # Forked workers inherit the parent's connection objects; never share a socket with it
+    connections.close_all()
+
+
+def prerender_tiles(str_path, max_zoom=None, workers=None):
+    """
+    Renders every missing tile from zoom 0 to max_zoom, in a process pool
+    when there is more than one. Returns the number of tiles rendered.
+    """
+    max_zoom = settings.PLAN_TILE_PRERENDER_ZOOM if max_zoom is None else max_zoom
+    key = geometry_version(str_path)
+    if key is None or plan_extent(str_path) is None:  # extent written once, before the workers read it
+        return 0
+
+    tasks = [
+        (str_path, z, x, y)
+        for z in range(max_zoom + 1)
+        for x in range(1 << z)
+        for y in range(1 << z)
+        if not os.path.exists(tile_path(key, z, x, y))
+    ]
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if len(tasks) > 1 and workers > 1:
+        connections.close_all()  # render_tile queries PitBlock: let each worker open its own connection
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            list(pool.map(_render_task, tasks, chunksize=8))
+    else:
+        for task in tasks:
+            _render_task(task)
+    return len(tasks)
+
+
+def invalidate_block_tiles(x, y):
+    """Deletes, in every pyramid and zoom, the cached tiles under a block at (x, y)."""
+    root = _cache_root()
+    if not os.path.isdir(root):
+        return 0
+    dx, dy, _ = settings.BLOCK_MODEL_DEFAULT_SIZE
+    removed = 0
+    for key in os.listdir(root):
+        try:
+            with open(os.path.join(root, key, 'extent.json')) as f:
+                extent = tuple(json.load(f))
+        except (OSError, ValueError):
+            continue
+        for z in range(settings.PLAN_TILE_MAX_ZOOM + 1):
+            for tx, ty in tiles_covering(extent, z, x - dx, y - dy, x + dx, y + dy):
+                try:
+                    os.remove(tile_path(key, z, tx, ty))
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+def clear_plan_tiles():
+    """Drops every cached pyramid (e.g. after bulk block imports)."""
+    shutil.rmtree(_cache_root(), ignore_errors=True)
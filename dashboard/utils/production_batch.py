@@ -0,0 +1,73 @@
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from dashboard.utils.live_topics import publish_production_days
+from dashboard.utils.production_rollup import refresh_rollup
+
+# ==========================================
+# PRODUCTION SIDE EFFECTS, ONE BATCH PER TRANSACTION
+# ==========================================
+# Saving or deleting a ProductionRecord has three side effects: the phase
+# totals (PhaseSchedule), the daily rollup rows and a WebSocket broadcast.
+# Instead of running them per record, the signal handlers add the record to
+# the batch of the current transaction, and the batch runs once on commit:
+#
+#   - each affected phase is recounted once (one aggregate + save)
+#   - each affected (day, phase, plant, material) rollup row is recomputed once
+#   - the changed days are pushed once to the live 'production' topic (the
+#     phase totals reach 'phase_progress' through the PhaseSchedule save)
+#
+# Outside a transaction (autocommit) on_commit runs at once, so a single save
+# behaves as before. A rolled back transaction drops its on_commit callback
+# and with it the batch; a later save starts a fresh one. Recounting from the
+# database on commit (rather than adding per-record deltas) keeps the totals
+# right even when only a savepoint inside the transaction was rolled back.
+
+_local = threading.local()
+
+
+class ProductionBatch:
+    """What one transaction changed; runs the side effects when called (on commit)."""
+
+    def __init__(self, using):
+        self.using = using
+        self.phase_ids = set()
+        self.rollup_keys = set()
+
+    def __call__(self):
+        pending = getattr(_local, 'batches', {})
+        if pending.get(self.using) is self:
+            del pending[self.using]
+        self.flush()
+
+    def flush(self):
+        from dashboard.models import PhaseSchedule
+
+        schedules = PhaseSchedule.objects.using(self.using).filter(mine_phase_id__in=self.phase_ids).select_related('mine_phase')
+        for schedule in schedules:
+            schedule.update_removed_tonnage()
+        refresh_rollup(self.rollup_keys)
+        publish_production_days({key[0] for key in self.rollup_keys})
+
+
+def current_batch(using=DEFAULT_DB_ALIAS):
+    """The batch of the open transaction on 'using', registering a new one with on_commit if needed."""
+    pending = _local.__dict__.setdefault('batches', {})
+    batch = pending.get(using)
+    connection = connections[using]
+    # Still pending only while its callback is queued: a rollback discards the queue
+    if batch is not None and connection.in_atomic_block and any(batch in entry for entry in connection.run_on_commit):
+        return batch, False
+    batch = ProductionBatch(using)
+    pending[using] = batch
+    return batch, True
+
+
+def record_production_change(instance, using=DEFAULT_DB_ALIAS):
+    """Adds a saved or deleted ProductionRecord to the current transaction's batch."""
+    batch, new = current_batch(using)
+    batch.phase_ids.update(pk for pk in (getattr(instance, '_stored_phase_id', None), instance.mine_phase_id) if pk)
+    batch.rollup_keys.update(key for key in (getattr(instance, '_stored_rollup_key', None), instance.rollup_key()) if key)
+    if new:
+        transaction.on_commit(batch, using=using)  # in autocommit this runs right away
@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+
+# ==========================================
+# DAILY PRODUCTION ROLLUP
+# ==========================================
+# DailyProductionRollup holds one row per (day, phase, plant, material) with
+# the sums every dashboard needs: tonnage, expected tonnage, metal (g),
+# graded tonnes, expected metal and processing loss (g). Dashboards read
+# these rows, so their cost follows the number of days, not records.
+#
+# Writes keep it current key by key: when a record is saved or deleted, only
+# the rollup rows for its old and new keys are recomputed from that key's
+# records (a handful of rows per day). Expected metal and loss depend on the
+# phase's expected grade, so a phase edit rebuilds that phase's rows.
+# rebuild_rollup() regenerates everything (manage.py backfill_production_rollup).
+
+FIELDS = ('record_count', 'tonnage', 'expected_tonnage', 'metal', 'graded_tonnage', 'expected_metal', 'loss_grams')
+BATCH_SIZE = 2000
+
+
+def aggregate_records(records):
+    """Rollup values per (day, phase, plant, material) for a ProductionRecord queryset."""
+    gap = Coalesce(F('mine_phase__expected_grade'), Value(0.0)) - Coalesce(F('grade'), Value(0.0))
+    return (
+        records.annotate(grade_gap=gap)
+        .values('mine_phase_id', 'plant_id', 'material_type', day=TruncDate('timestamp'))
+        .annotate(  # sum_<field>: the record fields share some of the names
+            sum_record_count=Count('id'),
+            sum_tonnage=Sum('tonnage'),
+            sum_expected_tonnage=Sum('expected_tonnage'),
+            sum_metal=Sum(F('tonnage') * F('grade'), output_field=FloatField()),
+            sum_graded_tonnage=Sum('tonnage', filter=Q(grade__isnull=False)),
+            sum_expected_metal=Sum(F('tonnage') * F('mine_phase__expected_grade'), output_field=FloatField()),
+            sum_loss_grams=Sum(Case(
+                When(material_type='ore', grade_gap__gt=0, tonnage__gt=0, then=F('grade_gap') * F('tonnage')),
+                default=Value(0.0), output_field=FloatField(),
+            )),
+        )
+        .order_by()
+    )
+
+
+def rollup_rows(groups):
+    """Unsaved rollup model instances for the groups of aggregate_records()."""
+    from dashboard.models import DailyProductionRollup
+
+    return [
+        DailyProductionRollup(
+            day=g['day'], mine_phase_id=g['mine_phase_id'], plant_id=g['plant_id'], material_type=g['material_type'],
+            **{name: g[f'sum_{name}'] or 0 for name in FIELDS},
+        )
+        for g in groups
+    ]
+
+
+def _key_filter(key):
+    day, phase_id, plant_id, material = key
+    lookups = {'mine_phase_id': phase_id, 'material_type': material}
+    if plant_id is None:
+        lookups['plant__isnull'] = True
+    else:
+        lookups['plant_id'] = plant_id
+    return lookups, day
+
+
+def refresh_rollup(keys):
+    """Recomputes the rollup rows for the given (day, phase id, plant id, material) keys."""
+    from dashboard.models import DailyProductionRollup, ProductionRecord
+
+    with transaction.atomic():
+        for key in {k for k in keys if k}:
+            lookups, day = _key_filter(key)
+            DailyProductionRollup.objects.filter(day=day, **lookups).delete()
+            groups = aggregate_records(ProductionRecord.objects.filter(timestamp__date=day, **lookups))
+            DailyProductionRollup.objects.bulk_create(rollup_rows(groups))
+
+
+def rebuild_rollup(mine_phase_id=None):
+    """Regenerates the rollup from the records (all phases, or one). Returns the number of rows."""
+    from dashboard.models import DailyProductionRollup, ProductionRecord
+
+    records = ProductionRecord.objects.all()
+    rollups = DailyProductionRollup.objects.all()
+    if mine_phase_id is not None:
+        records = records.filter(mine_phase_id=mine_phase_id)
+        rollups = rollups.filter(mine_phase_id=mine_phase_id)
+    with transaction.atomic():
+        rollups.delete()
+        rows = rollup_rows(aggregate_records(records))
+        DailyProductionRollup.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def rollup_totals(rollups, *columns, **expressions):
+    """
+    Sums of every rollup field grouped by the given columns and/or named
+    expressions (e.g. 'day', 'material_type', month=ExtractMonth('day')),
+    as dicts using the plain field names.
+    """
+    names = list(columns) + list(expressions)
+    groups = (
+        rollups.values(*columns, **expressions)
+        .annotate(**{f'sum_{name}': Sum(name) for name in FIELDS})
+        .order_by(*names)
+    )
+    return [{**{n: g[n] for n in names}, **{name: g[f'sum_{name}'] or 0 for name in FIELDS}} for g in groups]
+
+
+def daily_production(rollups):
+    """One row per day: {timestamp (the day), tonnage, ore, waste, grade (tonnage-weighted g/t)}."""
+    days = {}
+    for row in rollup_totals(rollups, 'day', 'material_type'):
+        day = days.setdefault(row['day'], {'timestamp': row['day'], 'tonnage': 0.0, 'ore': 0.0, 'waste': 0.0, 'metal': 0.0, 'graded_tonnage': 0.0})
+        day['tonnage'] += row['tonnage']
+        day[row['material_type']] += row['tonnage']
+        day['metal'] += row['metal']
+        day['graded_tonnage'] += row['graded_tonnage']
+
+    data = []
+    for day in days.values():
+        graded = day.pop('graded_tonnage')
+        metal = day.pop('metal')
+        day['grade'] = round(metal / graded, 3) if graded else None
+        data.append(day)
+    return data
@@ -0,0 +1,120 @@
+import numpy as np
+
+# ==========================================
+# POLYLINE SIMPLIFICATION (Level of Detail)
+# ==========================================
+# Douglas-Peucker run on every segment of a StrGeometry at once: each pass
+# handles all open sub-ranges with array operations instead of recursing per
+# segment in Python. Segment end points are always kept, so breaks survive.
+
+# Tolerances (metres) of the precomputed detail levels, finest first.
+LOD_TOLERANCES = (0.0, 0.25, 1.0, 4.0, 16.0)
+
+
+def _point_segment_distance(p, a, b):
+    """Row-wise 3D distance from points p to segments a-b (all (n, 3))."""
+    ab = b - a
+    denom = np.einsum('ij,ij->i', ab, ab)
+    t = np.einsum('ij,ij->i', p - a, ab) / np.where(denom > 0, denom, 1.0)
+    t = np.clip(np.where(denom > 0, t, 0.0), 0.0, 1.0)
+    closest = a + t[:, None] * ab
+    return np.sqrt(np.einsum('ij,ij->i', p - closest, p - closest))
+
+
+def _interior_rows(starts, ends):
+    """For ranges [start, end] returns (range index, vertex row) of every interior vertex."""
+    counts = ends - starts - 1
+    range_idx = np.repeat(np.arange(len(starts)), counts)
+    first = np.zeros(len(starts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=first[1:])
+    rows = np.arange(counts.sum()) - np.repeat(first, counts) + np.repeat(starts + 1, counts)
+    return range_idx, rows, first
+
+
+def simplify_mask(xyz, segment_offsets, tolerance):
+    """
+    Returns a bool mask over the vertices kept by Douglas-Peucker at 'tolerance'.
+    tolerance <= 0 keeps every vertex.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    n = len(xyz)
+    if tolerance <= 0 or n == 0:
+        return np.ones(n, dtype=bool)
+
+    starts = np.asarray(segment_offsets[:-1], dtype=np.int64)
+    ends = np.asarray(segment_offsets[1:], dtype=np.int64) - 1
+
+    keep = np.zeros(n, dtype=bool)
+    keep[starts] = True
+    keep[ends] = True
+
+    todo = ends - starts > 1
+    starts, ends = starts[todo], ends[todo]
+
+    while len(starts):
+        range_idx, rows, first = _interior_rows(starts, ends)
+        dist = _point_segment_distance(xyz[rows], xyz[starts][range_idx], xyz[ends][range_idx])
+
+        # Furthest interior vertex of each range (first one on ties)
+        dmax = np.maximum.reduceat(dist, first)
+        at_max = np.flatnonzero(dist == dmax[range_idx])
+        _, first_hit = np.unique(range_idx[at_max], return_index=True)
+        split = rows[at_max[first_hit]]
+
+        refine = dmax > tolerance
+        keep[split[refine]] = True
+
+        starts = np.concatenate([starts[refine], split[refine]])
+        ends = np.concatenate([split[refine], ends[refine]])
+        todo = ends - starts > 1
+        starts, ends = starts[todo], ends[todo]
+
+    return keep
+
+
+def simplification_error(xyz, segment_offsets, keep):
+    """
+    How far the simplified line strays from the source: distance of every source
+    vertex to the kept chord that replaces it. Returns (max, mean) in metres.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    n = len(xyz)
+    if n == 0 or keep.all():
+        return 0.0, 0.0
+
+    idx = np.arange(n)
+    prev_kept = np.maximum.accumulate(np.where(keep, idx, 0))
+    next_kept = np.minimum.accumulate(np.where(keep, idx, n - 1)[::-1])[::-1]
+
+    # Segment ends are always kept, so prev/next never cross a break
+    dist = _point_segment_distance(xyz, xyz[prev_kept], xyz[next_kept])
+    return float(dist.max()), float(dist.mean())
+
+
+def build_lods(geometry, tolerances=LOD_TOLERANCES):
+    """
+    Precomputes the detail levels of a StrGeometry.
+    Returns (masks, levels): masks is a bool (L, N) array, levels a list of
+    {'level', 'tolerance', 'points', 'max_error', 'mean_error'} dicts.
+    """
+    masks = np.zeros((len(tolerances), geometry.n_vertices), dtype=bool)
+    levels = []
+    for i, tol in enumerate(tolerances):
+        masks[i] = simplify_mask(geometry.xyz, geometry.segment_offsets, tol)
+        max_err, mean_err = simplification_error(geometry.xyz, geometry.segment_offsets, masks[i])
+        levels.append({
+            'level': i,
+            'tolerance': float(tol),
+            'points': int(masks[i].sum()),
+            'max_error': round(max_err, 4),
+            'mean_error': round(mean_err, 4),
+        })
+    return masks, levels
+
+
+def choose_lod(levels, point_budget):
+    """Finest level whose vertex count fits point_budget (coarsest level if none do)."""
+    for level in levels:
+        if level['points'] <= point_budget:
+            return level['level']
+    return levels[-1]['level'] if levels else 0
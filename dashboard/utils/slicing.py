@@ -0,0 +1,122 @@
+import numpy as np
+from django.conf import settings
+
+from dashboard.utils.spatial_index import load_block_index
+
+# ==========================================
+# SECTIONS AND BENCH PLANS
+# ==========================================
+# Vertical cross-sections along a plan line a-b, and bench plans at an
+# elevation, cut through the pit strings and the block store:
+#
+#   - blocks: spatial-index corridor / z-slab query, then exact numpy filters
+#   - strings: every string edge is tested against the cutting plane at once
+#     (sign change of the signed distance), crossings found by interpolation
+#
+# Results are columnar and rounded so they can go straight to JSON for
+# plotting; nothing loops over blocks or vertices in Python.
+
+
+def _edges(geometry):
+    """Start-vertex indices of every edge that stays inside one segment."""
+    starts = np.arange(max(geometry.n_vertices - 1, 0))
+    segment_ends = np.asarray(geometry.segment_offsets[1:-1]) - 1
+    return np.setdiff1d(starts, segment_ends, assume_unique=True)
+
+
+def _string_id_of_vertex(geometry, vertices):
+    segment = np.searchsorted(np.asarray(geometry.segment_offsets), vertices, side='right') - 1
+    return np.asarray(geometry.string_ids)[segment]
+
+
+def section_strings(geometry, a, b):
+    """
+    Where the pit strings cross the vertical plane through a-b, as arrays
+    (t along the line in m, z, string_id). Crossings beyond the ends are dropped.
+    """
+    if not geometry:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int32)
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = float(np.hypot(dx, dy))
+    ux, uy = dx / length, dy / length
+
+    xyz = np.asarray(geometry.xyz)
+    edges = _edges(geometry)
+    # Signed distance of every vertex from the plane, then edges whose ends straddle it
+    side = (xyz[:, 0] - a[0]) * uy - (xyz[:, 1] - a[1]) * ux
+    s0, s1 = side[edges], side[edges + 1]
+    crossing = ((s0 <= 0) & (s1 > 0)) | ((s0 > 0) & (s1 <= 0))
+    edges, s0, s1 = edges[crossing], s0[crossing], s1[crossing]
+
+    f = (s0 / (s0 - s1))[:, None]
+    points = xyz[edges] + f * (xyz[edges + 1] - xyz[edges])
+    t = (points[:, 0] - a[0]) * ux + (points[:, 1] - a[1]) * uy
+    keep = (t >= 0) & (t <= length)
+    return t[keep], points[keep, 2], _string_id_of_vertex(geometry, edges[keep])
+
+
+def vertical_section(blocks, geometry, a, b, half_width, max_blocks=None):
+    """
+    Cross-section along a-b: blocks within half_width (m) of the line and the
+    pit string crossings. Returns a JSON-ready dict of columns.
+    """
+    length = float(np.hypot(b[0] - a[0], b[1] - a[1]))
+    result = {'length': round(length, 2), 'half_width': half_width}
+
+    t, z, ids = section_strings(geometry, a, b)
+    result['strings'] = {'t': np.round(t, 2).tolist(), 'z': np.round(z, 2).tolist(), 'string_id': ids.tolist()}
+
+    rows, along = (load_block_index(blocks).query_corridor(a, b, half_width)
+                   if blocks else (np.empty(0, dtype=np.int64), np.empty(0)))
+    result['blocks_total'] = int(len(rows))
+    if max_blocks is not None and len(rows) > max_blocks:
+        pick = np.linspace(0, len(rows) - 1, max_blocks).astype(np.int64)  # even spread along the line
+        rows, along = rows[pick], along[pick]
+    result['blocks'] = _block_columns(blocks, rows, {'t': along})
+    return result
+
+
+def bench_plan(blocks, geometry, z, bench_height=None, max_blocks=None, strings=None):
+    """
+    Plan at elevation z: blocks in the bench slab [z - h/2, z + h/2) and the
+    pit string segments passing through it, as flat xy arrays + offsets.
+    With 'strings' (StringIndex) each block also gets an in_pit flag.
+    """
+    h = float(bench_height or settings.BLOCK_MODEL_DEFAULT_SIZE[2])
+    z0, z1 = z - h / 2, z + h / 2
+    result = {'z': z, 'bench_height': h}
+
+    if geometry:
+        seg_zmin, seg_zmax = geometry.segment_z_range()
+        cut = geometry.select((seg_zmax >= z0) & (seg_zmin < z1))
+        xy = np.asarray(cut.xyz[:, :2])
+        result['strings'] = {
+            'x': np.round(xy[:, 0], 2).tolist(), 'y': np.round(xy[:, 1], 2).tolist(),
+            'offsets': np.asarray(cut.segment_offsets).tolist(), 'string_id': np.asarray(cut.string_ids).tolist(),
+        }
+    else:
+        result['strings'] = {'x': [], 'y': [], 'offsets': [0], 'string_id': []}
+
+    rows = load_block_index(blocks).query_slab(z0, z1) if blocks else np.empty(0, dtype=np.int64)
+    result['blocks_total'] = int(len(rows))
+    if max_blocks is not None and len(rows) > max_blocks:
+        rows = np.sort(np.random.default_rng(0).choice(rows, max_blocks, replace=False))
+    result['blocks'] = _block_columns(blocks, rows, {'x': None, 'y': None})
+    if strings is not None and blocks:
+        result['blocks']['in_pit'] = strings.contains(blocks.x[rows], blocks.y[rows], blocks.z[rows]).tolist()
+    return result
+
+
+def _block_columns(blocks, rows, extra):
+    """Columns for the selected rows: the 'extra' ones (None = read from the store) + z, grade, material, tonnes."""
+    if not len(rows):
+        return {name: [] for name in list(extra) + ['z', 'grade', 'material', 'tonnes']}
+    columns = {}
+    for name, values in extra.items():
+        values = blocks.columns[name][rows] if values is None else values
+        columns[name] = np.round(np.asarray(values, dtype=np.float64), 2).tolist()
+    columns['z'] = np.round(np.asarray(blocks.z[rows], dtype=np.float64), 2).tolist()
+    columns['grade'] = np.round(np.asarray(blocks.grade[rows], dtype=np.float64), 3).tolist()
+    columns['material'] = np.asarray(blocks.material[rows]).tolist()
+    columns['tonnes'] = np.round(np.asarray(blocks.tonnes[rows], dtype=np.float64), 1).tolist()
+    return columns
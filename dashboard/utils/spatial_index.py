@@ -0,0 +1,365 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+# ==========================================
+# SPATIAL INDEX (GRID HASH)
+# ==========================================
+# Two indexes, both built once per data version and shared by the pit map,
+# the slicing API, reconciliation and grade estimation:
+#
+# PointIndex - points (block centres, samples) bucketed into square XY cells.
+#   Row numbers are stored sorted by cell ('order'), with 'starts' giving each
+#   cell's slice, so a region query only reads the cells it touches:
+#
+#       order[starts[c]:starts[c + 1]]   -> rows in cell c
+#
+#   A second permutation sorted by z answers bench (elevation slab) queries
+#   with two searchsorted calls. The block store's index is saved under
+#   DATA_CACHE_DIR/spatial/<block version>.npz; coordinates are read from the
+#   (memory-mapped) columns themselves, so the index only holds integers.
+#
+# StringIndex - the closed pit strings as bench outlines (one polygon per
+#   contour: string id, elevation, bbox), for "outline at this bench" and
+#   point-in-pit tests. Kept in memory per geometry version.
+
+MAX_CELLS = 4_000_000
+
+_memo = {}
+_string_memo = {}
+_lock = threading.Lock()
+
+
+def _gather(order, starts, cells):
+    """Concatenation of order[starts[c]:starts[c + 1]] for every cell c, without a Python loop."""
+    begin, end = starts[cells], starts[cells + 1]
+    lengths = end - begin
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64), lengths
+    offsets = np.repeat(begin - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return order[offsets + np.arange(total)].astype(np.int64), lengths
+
+
+def _segment_distance(px, py, a, b):
+    """Distance from points (px, py) to the segment a-b, plus the position t (m) along it."""
+    ax, ay = a
+    dx, dy = b[0] - ax, b[1] - ay
+    length = float(np.hypot(dx, dy))
+    if length == 0:
+        return np.hypot(px - ax, py - ay), np.zeros_like(px)
+    ux, uy = dx / length, dy / length
+    t = (px - ax) * ux + (py - ay) * uy
+    closest = np.clip(t, 0, length)
+    return np.hypot(px - (ax + closest * ux), py - (ay + closest * uy)), t
+
+
+class PointIndex:
+    """Grid hash + z order over a set of points (see module docstring)."""
+
+    def __init__(self, x, y, z, origin, cell, shape, order, starts, z_order):
+        self.x, self.y, self.z = x, y, z
+        self.origin = origin      # (x, y) of the grid's lower-left corner
+        self.cell = cell          # cell edge, metres
+        self.shape = shape        # (nx, ny)
+        self.order = order        # rows sorted by cell (cell = ix * ny + iy)
+        self.starts = starts      # (nx * ny + 1,) slice of each cell in 'order'
+        self.z_order = z_order    # rows sorted by z
+        self._z_sorted = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def arrays(self):
+        return {
+            'origin': np.asarray(self.origin, dtype=np.float64), 'cell': np.float64(self.cell),
+            'shape': np.asarray(self.shape, dtype=np.int64), 'order': self.order,
+            'starts': self.starts, 'z_order': self.z_order,
+        }
+
+    def _cell_of(self, values, axis):
+        return np.floor((np.asarray(values, dtype=np.float64) - self.origin[axis]) / self.cell).astype(np.int64)
+
+    def box_cells(self, x0, y0, x1, y1):
+        """Cell numbers overlapping the box (empty if it misses the grid)."""
+        nx, ny = self.shape
+        ix0, ix1 = max(int(self._cell_of(x0, 0)), 0), min(int(self._cell_of(x1, 0)), nx - 1)
+        iy0, iy1 = max(int(self._cell_of(y0, 1)), 0), min(int(self._cell_of(y1, 1)), ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.empty(0, dtype=np.int64)
+        ix, iy = np.meshgrid(np.arange(ix0, ix1 + 1), np.arange(iy0, iy1 + 1), indexing='ij')
+        return (ix * ny + iy).ravel()
+
+    def query_box(self, x0, y0, x1, y1):
+        """Rows with x0 <= x <= x1 and y0 <= y <= y1."""
+        rows, _ = _gather(self.order, self.starts, self.box_cells(x0, y0, x1, y1))
+        x, y = self.x[rows], self.y[rows]
+        return rows[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+
+    def query_radius(self, x, y, radius, z=None):
+        """Rows within radius of (x, y) in plan, or of (x, y, z) in 3D when z is given."""
+        rows = self.query_box(x - radius, y - radius, x + radius, y + radius)
+        d2 = (self.x[rows] - x) ** 2 + (self.y[rows] - y) ** 2
+        if z is not None:
+            d2 = d2 + (self.z[rows] - z) ** 2
+        return rows[d2 <= radius * radius]
+
+    def pairs_within(self, qx, qy, qz, radius):
+        """
+        Every (query, row) pair closer than radius in 3D, for many query points
+        at once: (query index, row, distance) arrays, grouped by query.
+        """
+        qx, qy, qz = (np.asarray(v, dtype=np.float64) for v in (qx, qy, qz))
+        nx, ny = self.shape
+        reach = int(np.ceil(radius / self.cell))
+        di, dj = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1), indexing='ij')
+        ix = self._cell_of(qx, 0)[:, None] + di.ravel()
+        iy = self._cell_of(qy, 1)[:, None] + dj.ravel()
+        valid = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        query, slot = np.nonzero(valid)
+        rows, lengths = _gather(self.order, self.starts, ix[query, slot] * ny + iy[query, slot])
+        query = np.repeat(query, lengths)
+
+        dist = np.sqrt((self.x[rows] - qx[query]) ** 2 + (self.y[rows] - qy[query]) ** 2 + (self.z[rows] - qz[query]) ** 2)
+        keep = dist <= radius
+        return query[keep], rows[keep], dist[keep]
+
+    def nearest(self, x, y, k=1, z=None):
+        """
+        The k rows closest to (x, y[, z]) and their distances, nearest first.
+        Searches a growing box until k points are found inside the search radius.
+        """
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        radius = self.cell
+        span = self.cell * max(self.shape) * 2
+        while True:
+            rows = self.query_box(x - radius, y - radius, x + radius, y + radius)
+            if len(rows) >= k or radius > span:
+                d2 = (self.x[rows] - x) ** 2 + (self.y[rows] - y) ** 2
+                if z is not None:
+                    d2 = d2 + (self.z[rows] - z) ** 2
+                first = np.argsort(d2, kind='stable')[:k]
+                # Only trust the answer if the k-th point lies inside the searched circle
+                if len(first) == k and (d2[first[-1]] <= radius * radius or radius > span):
+                    return rows[first], np.sqrt(d2[first])
+            radius *= 2
+
+    def query_corridor(self, a, b, half_width):
+        """
+        Rows within half_width (m) of the segment a-b in plan, sorted by their
+        position t along it (0 at a). Only cells near the line are visited.
+        """
+        x0, x1 = sorted((a[0], b[0]))
+        y0, y1 = sorted((a[1], b[1]))
+        cells = self.box_cells(x0 - half_width, y0 - half_width, x1 + half_width, y1 + half_width)
+        # Keep cells whose centre is close enough for any of their points to qualify
+        ny = self.shape[1]
+        cx = self.origin[0] + (cells // ny + 0.5) * self.cell
+        cy = self.origin[1] + (cells % ny + 0.5) * self.cell
+        near, _ = _segment_distance(cx, cy, a, b)
+        cells = cells[near <= half_width + self.cell * 0.7072]
+
+        rows, _ = _gather(self.order, self.starts, cells)
+        dist, t = _segment_distance(np.asarray(self.x[rows], dtype=np.float64),
+                                    np.asarray(self.y[rows], dtype=np.float64), a, b)
+        length = float(np.hypot(b[0] - a[0], b[1] - a[1]))
+        keep = (dist <= half_width) & (t >= 0) & (t <= length)
+        order = np.argsort(t[keep], kind='stable')
+        return rows[keep][order], t[keep][order]
+
+    def query_slab(self, z0, z1):
+        """Rows with z0 <= z < z1 (a bench), in z order."""
+        if self._z_sorted is None:
+            self._z_sorted = np.asarray(self.z)[self.z_order]
+        lo, hi = np.searchsorted(self._z_sorted, [z0, z1], side='left')
+        return np.asarray(self.z_order[lo:hi], dtype=np.int64)
+
+
+def build_point_index(x, y, z, cell):
+    """Buckets the points into XY cells of 'cell' metres (grown if the grid would be huge) and sorts rows by z."""
+    xf = np.asarray(x, dtype=np.float64)
+    yf = np.asarray(y, dtype=np.float64)
+    origin = (float(xf.min()), float(yf.min())) if len(xf) else (0.0, 0.0)
+    span_x = float(xf.max()) - origin[0] if len(xf) else 0.0
+    span_y = float(yf.max()) - origin[1] if len(yf) else 0.0
+    while (span_x / cell + 1) * (span_y / cell + 1) > MAX_CELLS:
+        cell *= 2
+    shape = (int(span_x // cell) + 1, int(span_y // cell) + 1)
+
+    index_type = np.int32 if len(xf) < 2 ** 31 else np.int64
+    ix = np.minimum(((xf - origin[0]) // cell).astype(np.int64), shape[0] - 1)
+    iy = np.minimum(((yf - origin[1]) // cell).astype(np.int64), shape[1] - 1)
+    key = ix * shape[1] + iy
+    order = np.argsort(key, kind='stable').astype(index_type)
+    starts = np.searchsorted(key[order], np.arange(shape[0] * shape[1] + 1)).astype(np.int64)
+    z_order = np.argsort(np.asarray(z), kind='stable').astype(index_type)
+    return PointIndex(x, y, z, origin, float(cell), shape, order, starts, z_order)
+
+
+def _block_cell():
+    """Default cell for block indexes: five blocks across."""
+    return 5 * max(settings.BLOCK_MODEL_DEFAULT_SIZE[0], settings.BLOCK_MODEL_DEFAULT_SIZE[1])
+
+
+def build_block_index(blocks, cell=None):
+    return build_point_index(blocks.x, blocks.y, blocks.z, cell or _block_cell())
+
+
+def _cache_path(version):
+    return os.path.join(settings.DATA_CACHE_DIR, 'spatial', f'{version}.npz')
+
+
+def load_block_index(blocks):
+    """PointIndex over the block store, cached per block model version."""
+    with _lock:
+        if blocks.version in _memo:
+            return _memo[blocks.version]
+
+    path = _cache_path(blocks.version) if blocks.version else None
+    index = None
+    if path and os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                index = PointIndex(blocks.x, blocks.y, blocks.z, tuple(data['origin']), float(data['cell']),
+                                   tuple(int(n) for n in data['shape']), data['order'], data['starts'], data['z_order'])
+        except (OSError, ValueError, KeyError):
+            index = None
+
+    if index is None:
+        index = build_block_index(blocks)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **index.arrays())
+            os.replace(tmp, path)
+
+    if blocks.version:
+        with _lock:
+            _memo[blocks.version] = index
+    return index
+
+
+def points_in_polygon(px, py, polygon):
+    """Even-odd test of the points against one closed xy polygon, one numpy pass per edge."""
+    inside = np.zeros(len(px), dtype=bool)
+    x0, y0 = polygon[-1]
+    for x1, y1 in polygon:
+        crosses = (y1 > py) != (y0 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            at = (x0 - x1) * (py - y1) / (y0 - y1) + x1
+        inside ^= crosses & (px < at)
+        x0, y0 = x1, y1
+    return inside
+
+
+class StringIndex:
+    """Closed pit strings as bench outlines (see module docstring)."""
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        xyz = np.asarray(geometry.xyz)
+        offsets = np.asarray(geometry.segment_offsets)
+        closed = np.zeros(geometry.n_segments, dtype=bool)
+        if geometry.n_segments:
+            first, last = xyz[offsets[:-1]], xyz[offsets[1:] - 1]
+            closed = np.all(np.abs(first - last) < 1e-6, axis=1) & (geometry.segment_lengths() >= 4)
+
+        self.segments = np.flatnonzero(closed)
+        starts = offsets[:-1][self.segments]
+        z_lo, z_hi = geometry.segment_z_range()
+        self.string_ids = np.asarray(geometry.string_ids)[self.segments]
+        self.levels = ((z_lo + z_hi) / 2)[self.segments] if len(self.segments) else np.empty(0)
+        xy = xyz[:, :2]
+        self.boxes = (np.column_stack([np.minimum.reduceat(xy, starts), np.maximum.reduceat(xy, starts)])
+                      if len(starts) else np.empty((0, 4)))
+
+    def __len__(self):
+        return len(self.segments)
+
+    def polygon(self, i):
+        """xy vertices of outline i (the closing vertex dropped)."""
+        offsets = self.geometry.segment_offsets
+        seg = self.segments[i]
+        return np.asarray(self.geometry.xyz[offsets[seg]:offsets[seg + 1] - 1, :2])
+
+    def outlines_at(self, z):
+        """
+        Outline numbers bounding the pit at elevation z: for every string id,
+        its lowest contour at or above z (none if z is above its top contour).
+        """
+        picked = []
+        for sid in np.unique(self.string_ids):
+            members = np.flatnonzero((self.string_ids == sid) & (self.levels >= z - 1e-6))
+            if len(members):
+                lowest = self.levels[members].min()
+                picked.extend(members[self.levels[members] <= lowest + 1e-6].tolist())
+        return np.asarray(picked, dtype=np.int64)
+
+    def bounds_at(self, z):
+        """(min_x, min_y, max_x, max_y) of the outlines at z, or None when there are none."""
+        outlines = self.outlines_at(z)
+        if not len(outlines):
+            return None
+        boxes = self.boxes[outlines]
+        return tuple(boxes[:, :2].min(axis=0)) + tuple(boxes[:, 2:].max(axis=0))
+
+    def contains(self, x, y, z):
+        """Boolean mask: which points lie inside the pit outline at their own elevation."""
+        x, y, z = (np.asarray(v, dtype=np.float64) for v in (x, y, z))
+        inside = np.zeros(len(x), dtype=bool)
+        if not len(self):
+            return inside
+        # Points between two contour elevations share their outlines: group by the next contour up
+        levels = np.unique(self.levels)
+        bench = np.searchsorted(levels, z - 1e-6)
+        by_bench = np.argsort(bench, kind='stable')
+        bounds = np.searchsorted(bench[by_bench], np.arange(len(levels) + 1))
+        for i, level in enumerate(levels):
+            members = by_bench[bounds[i]:bounds[i + 1]]
+            for outline in self.outlines_at(level):
+                x0, y0, x1, y1 = self.boxes[outline]
+                sel = members[(x[members] >= x0) & (x[members] <= x1) & (y[members] >= y0) & (y[members] <= y1) & ~inside[members]]
+                if len(sel):
+                    inside[sel] = points_in_polygon(x[sel], y[sel], self.polygon(outline))
+        return inside
+
+
+def load_string_index(geometry, version):
+    """StringIndex of the pit strings, kept per geometry version (see geometry_cache.geometry_version)."""
+    with _lock:
+        if version and version in _string_memo:
+            return _string_memo[version]
+    index = StringIndex(geometry)
+    if version:
+        with _lock:
+            _string_memo[version] = index
+    return index
+
+
+def blocks_in_pit(blocks, geometry, geometry_key):
+    """
+    Mask over the block store: blocks inside the pit outline at their bench.
+    Cached per (block version, geometry version) under DATA_CACHE_DIR/spatial/.
+    """
+    path = (os.path.join(settings.DATA_CACHE_DIR, 'spatial', f'in-pit-{blocks.version}-{geometry_key}.npy')
+            if blocks.version and geometry_key else None)
+    if path and os.path.exists(path):
+        try:
+            return np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            pass
+
+    mask = load_string_index(geometry, geometry_key).contains(blocks.x, blocks.y, blocks.z)
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, mask)
+        os.replace(tmp, path)
+    return mask
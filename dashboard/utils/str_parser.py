@@ -1,4 +1,7 @@
 import os
+import re
+
+import numpy as np
 
 def parse_str_file(file_path):
     """
@@ -54,4 +57,199 @@ def parse_str_file(file_path):
         print(f"Parser Error: {e}")
         return {}
 
-    return strings
\ No newline at end of file
+    return strings
+
+
+# ==========================================
+# COLUMNAR READER (NumPy)
+# ==========================================
+# The dict-of-tuples parser above is fine for small designs but builds one
+# Python tuple per vertex. Full pit designs run to hundreds of thousands of
+# vertices, so the reader below keeps everything in flat NumPy arrays instead.
+
+_NUM = rb'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?=[ \t,\r]|$)'
+_SEP = rb'(?:[ \t]*,[ \t]*|[ \t]+)'
+# String ID, then (optionally) the Y, X, Z columns. Header / axis lines that
+# start with text never match and are skipped, same as the old parser.
+_STR_ROW = re.compile(
+    rb'^[ \t]*(' + _NUM + rb')(?:' + _SEP + rb'(' + _NUM + rb')' + _SEP + rb'(' + _NUM + rb')' + _SEP + rb'(' + _NUM + rb'))?',
+    re.MULTILINE,
+)
+
+
+class StrGeometry:
+    """
+    Pit strings stored as columns instead of tuples.
+
+    - xyz:             float64 (N, 3) vertices, already swapped to X, Y, Z for Plotly
+    - segment_offsets: int64 (S + 1,) so segment i is xyz[offsets[i]:offsets[i + 1]]
+    - string_ids:      int32 (S,) Surpac string number of each segment
+    """
+
+    def __init__(self, xyz=None, segment_offsets=None, string_ids=None):
+        self.xyz = np.empty((0, 3), dtype=np.float64) if xyz is None else xyz
+        self.segment_offsets = np.zeros(1, dtype=np.int64) if segment_offsets is None else segment_offsets
+        self.string_ids = np.empty(0, dtype=np.int32) if string_ids is None else string_ids
+
+    @property
+    def n_vertices(self):
+        return len(self.xyz)
+
+    @property
+    def n_segments(self):
+        return len(self.string_ids)
+
+    def __bool__(self):
+        return self.n_vertices > 0
+
+    def __len__(self):
+        return self.n_segments
+
+    def segments(self):
+        """Yields (string_id, xyz view) for every segment, in file order."""
+        offsets = self.segment_offsets
+        for i, sid in enumerate(self.string_ids):
+            yield int(sid), self.xyz[offsets[i]:offsets[i + 1]]
+
+    def bounds(self):
+        """Returns ((min_x, min_y, min_z), (max_x, max_y, max_z)) or None if empty."""
+        if not self:
+            return None
+        return tuple(self.xyz.min(axis=0)), tuple(self.xyz.max(axis=0))
+
+    def segment_lengths(self):
+        return np.diff(self.segment_offsets)
+
+    def segment_z_range(self):
+        """Returns (z_min, z_max) arrays with one entry per segment."""
+        if not self.n_segments:
+            return np.empty(0), np.empty(0)
+        z = np.asarray(self.xyz[:, 2])
+        starts = self.segment_offsets[:-1]
+        return np.minimum.reduceat(z, starts), np.maximum.reduceat(z, starts)
+
+    def select(self, segment_mask):
+        """Returns a new StrGeometry holding only the segments where segment_mask is True."""
+        seg_idx = np.flatnonzero(segment_mask)
+        lengths = self.segment_lengths()[seg_idx]
+        new_offsets = np.zeros(len(seg_idx) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        rows = np.repeat(self.segment_offsets[seg_idx] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+        return StrGeometry(self.xyz[rows], new_offsets, self.string_ids[seg_idx])
+
+    def take_vertices(self, vertex_mask):
+        """
+        Returns a new StrGeometry keeping only the masked vertices (e.g. a
+        simplification level). Segments left with no vertices are dropped.
+        """
+        seg_of_vertex = np.repeat(np.arange(self.n_segments), self.segment_lengths())
+        counts = np.bincount(seg_of_vertex[vertex_mask], minlength=self.n_segments)
+        alive = counts > 0
+        new_offsets = np.zeros(int(alive.sum()) + 1, dtype=np.int64)
+        np.cumsum(counts[alive], out=new_offsets[1:])
+        return StrGeometry(self.xyz[vertex_mask], new_offsets, self.string_ids[alive])
+
+    def plot_xyz(self):
+        """
+        Flattens the segments into x, y, z lists for a single Plotly line trace,
+        with None between segments so connectgaps=False breaks the line.
+        """
+        lengths = self.segment_lengths()
+        out = np.full((self.n_vertices + self.n_segments, 3), np.nan)
+        # Each vertex shifts down by the number of breaks inserted before it
+        out[np.arange(self.n_vertices) + np.repeat(np.arange(self.n_segments), lengths)] = self.xyz
+        return tuple([None if v != v else v for v in col] for col in out.T.tolist())
+
+    def to_dict(self):
+        """
+        Compatibility adapter: the {string_id: [(x, y, z), ..., (None, None, None)]}
+        shape returned by parse_str_file(). Every segment is closed by a break.
+        """
+        strings = {}
+        for sid, coords in self.segments():
+            points = strings.setdefault(sid, [])
+            points.extend(map(tuple, coords.tolist()))
+            points.append((None, None, None))
+        return strings
+
+
+def _load_str_table_fast(file_path):
+    """
+    Fast path: NumPy's C CSV reader on the first four columns.
+    Raises ValueError on anything irregular (e.g. bare '0' rows, text mid-file).
+    """
+    skip = 0
+    delimiter = None
+    with open(file_path, 'r') as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped and (stripped[0].isdigit() or stripped[0] in '+-.'):
+                delimiter = ',' if ',' in stripped else None
+                break
+            skip += 1
+
+    table = np.loadtxt(file_path, delimiter=delimiter, usecols=(0, 1, 2, 3), skiprows=skip, ndmin=2)
+    return table[:, 0], table[:, 1:4], np.ones(len(table), dtype=bool)
+
+
+def _load_str_table_tolerant(raw):
+    """Slow path: regex scan that skips unreadable lines like the old parser did."""
+    rows = _STR_ROW.findall(raw)
+    if not rows:
+        return np.empty(0), np.empty((0, 3)), np.empty(0, dtype=bool)
+
+    table = np.array(rows)
+    has_coords = table[:, 1] != b''
+    yxz = np.zeros((len(table), 3), dtype=np.float64)
+    yxz[has_coords] = table[has_coords, 1:4].astype(np.float64)
+    return table[:, 0].astype(np.float64), yxz, has_coords
+
+
+def read_str_geometry(file_path):
+    """
+    Columnar Parser for Surpac .STR files.
+    Accepts the same comma / space separated layouts as parse_str_file()
+    but returns a StrGeometry backed by NumPy arrays.
+    """
+    if not os.path.exists(file_path):
+        return StrGeometry()
+
+    try:
+        ids, yxz, has_coords = _load_str_table_fast(file_path)
+    except ValueError:
+        try:
+            with open(file_path, 'rb') as f:
+                ids, yxz, has_coords = _load_str_table_tolerant(f.read())
+        except OSError as e:
+            print(f"Parser Error: {e}")
+            return StrGeometry()
+    except OSError as e:
+        print(f"Parser Error: {e}")
+        return StrGeometry()
+
+    ids = ids.astype(np.int64)  # Handle "1.0" or "1"
+    is_break = ids == 0
+
+    # Rows with an ID but no coordinates are ignored entirely (old behaviour)
+    keep = is_break | has_coords
+    ids, is_break, yxz = ids[keep], is_break[keep], yxz[keep]
+
+    is_point = ~is_break
+    if not is_point.any():
+        return StrGeometry()
+
+    # A new segment starts on a point whose previous row was a break or another string
+    prev_ids = np.empty_like(ids)
+    prev_ids[0] = 0
+    prev_ids[1:] = ids[:-1]
+    starts = is_point & (prev_ids != ids)
+
+    point_rows = np.flatnonzero(is_point)
+    seg_starts = np.flatnonzero(starts[point_rows])
+
+    # Surpac standard is Y(North), X(East), Z(Level) -> store as X, Y, Z
+    xyz = np.ascontiguousarray(yxz[point_rows][:, [1, 0, 2]])
+    segment_offsets = np.append(seg_starts, len(point_rows)).astype(np.int64)
+    string_ids = ids[point_rows[seg_starts]].astype(np.int32)
+
+    return StrGeometry(xyz, segment_offsets, string_ids)
@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from dashboard.utils.geometry_cache import content_hash
+from dashboard.utils.str_parser import read_str_geometry
+
+# ==========================================
+# SURVEY SURFACES AND MINED VOLUMES
+# ==========================================
+# End-of-period survey pickups (.str strings / spot heights) are turned into
+# elevation grids on one fixed lattice: cell (i, j) covers
+# [i * cell, (i + 1) * cell) x [j * cell, (j + 1) * cell), whatever the survey,
+# so any two grids line up by integer offsets only.
+#
+#   1. string edges are densified to half a cell, then every point is binned
+#      with one bincount (mean z per cell)
+#   2. gaps between strings are filled outwards from the surveyed cells (up to
+#      SURVEY_FILL_DISTANCE) and relaxed towards a smooth surface
+#   3. mined depth per cell = previous - current surface, split into benches
+#      exactly (column overlap with each bench) and into phases by the design
+#      outline at the middle of the cut
+#
+# Grids are cached by file content under DATA_CACHE_DIR/surveys/grids/, so an
+# unchanged surface is rasterized once; period results are cached per pair of
+# surfaces + parameters under DATA_CACHE_DIR/surveys/volumes/. A file's content
+# hash is kept in a small manifest with its size and mtime (as in
+# geometry_cache.py), so it is only re-read when the file changes. At most
+# GRID_MEMO_SIZE grids (up to ~64 MB each) stay open per process.
+
+MAX_CELLS = 16_000_000
+RELAX_PASSES = 40
+MIN_DEPTH = 0.05  # m, survey noise below this is not counted as cut or fill
+GRID_MEMO_SIZE = 4
+
+_memo = {}  # grid path -> SurfaceGrid, least recently used first
+_digests = {}  # survey path -> (size, mtime_ns, content hash)
+_lock = threading.Lock()
+
+
+class SurfaceGrid:
+    """Elevations on the survey lattice: z[row, col] is cell (ix0 + col, iy0 + row); NaN = no surface."""
+
+    def __init__(self, ix0, iy0, z, cell):
+        self.ix0, self.iy0 = int(ix0), int(iy0)
+        self.z = z
+        self.cell = float(cell)
+
+    @property
+    def shape(self):
+        return self.z.shape
+
+    def window(self, ix0, iy0, nx, ny):
+        """Elevations over another window of the lattice (NaN outside this grid)."""
+        out = np.full((ny, nx), np.nan, dtype=np.float32)
+        r0, c0 = max(self.iy0, iy0), max(self.ix0, ix0)
+        r1 = min(self.iy0 + self.shape[0], iy0 + ny)
+        c1 = min(self.ix0 + self.shape[1], ix0 + nx)
+        if r1 > r0 and c1 > c0:
+            out[r0 - iy0:r1 - iy0, c0 - ix0:c1 - ix0] = self.z[r0 - self.iy0:r1 - self.iy0, c0 - self.ix0:c1 - self.ix0]
+        return out
+
+
+def _densify(geometry, spacing):
+    """Vertices plus extra points along every edge so that no gap exceeds 'spacing'."""
+    xyz = np.asarray(geometry.xyz, dtype=np.float64)
+    starts = np.arange(max(len(xyz) - 1, 0))
+    edges = np.setdiff1d(starts, np.asarray(geometry.segment_offsets[1:-1]) - 1, assume_unique=True)
+    if not len(edges):
+        return xyz
+    a, b = xyz[edges], xyz[edges + 1]
+    steps = np.ceil(np.hypot(*(b[:, :2] - a[:, :2]).T) / spacing).astype(np.int64)
+    inner = steps > 1
+    a, b, steps = a[inner], b[inner], steps[inner]
+    if not len(steps):
+        return xyz
+    # k = 1 .. steps - 1 for every edge, flattened
+    edge = np.repeat(np.arange(len(steps)), steps - 1)
+    k = np.arange(len(edge)) - np.repeat(np.cumsum(steps - 1) - (steps - 1), steps - 1) + 1
+    f = (k / steps[edge])[:, None]
+    return np.concatenate([xyz, a[edge] + f * (b[edge] - a[edge])])
+
+
+def _neighbour_sum(a):
+    p = np.pad(a, 1)
+    return p[:-2, 1:-1] + p[2:, 1:-1] + p[1:-1, :-2] + p[1:-1, 2:]
+
+
+def _fill_gaps(z, passes):
+    """Fills NaN cells within 'passes' cells of the surveyed ones, then smooths the filled part."""
+    surveyed = np.isfinite(z)
+    known = surveyed.copy()
+    value = np.where(surveyed, z, 0).astype(np.float32)
+    weight = surveyed.astype(np.float32)
+    for _ in range(passes):
+        total, count = _neighbour_sum(value * weight), _neighbour_sum(weight)
+        grow = ~known & (count > 0)
+        if not grow.any():
+            break
+        value[grow] = total[grow] / count[grow]
+        weight[grow] = 1
+        known |= grow
+
+    # Jacobi relaxation on the filled cells only (surveyed cells stay fixed)
+    filled = known & ~surveyed
+    if filled.any():
+        for _ in range(RELAX_PASSES):
+            total, count = _neighbour_sum(value * weight), _neighbour_sum(weight)
+            value[filled] = total[filled] / count[filled]
+    return np.where(known, value, np.nan).astype(np.float32)
+
+
+def rasterize_geometry(geometry, cell=None, fill_distance=None):
+    """SurfaceGrid of a survey StrGeometry on the fixed lattice (mean z per cell, gaps filled)."""
+    cell = float(cell or settings.SURVEY_GRID_CELL)
+    fill_distance = float(settings.SURVEY_FILL_DISTANCE if fill_distance is None else fill_distance)
+    if not geometry:
+        return SurfaceGrid(0, 0, np.empty((0, 0), dtype=np.float32), cell)
+
+    points = _densify(geometry, cell / 2)
+    ix = np.floor(points[:, 0] / cell).astype(np.int64)
+    iy = np.floor(points[:, 1] / cell).astype(np.int64)
+    ix0, iy0 = ix.min(), iy.min()
+    nx, ny = int(ix.max() - ix0 + 1), int(iy.max() - iy0 + 1)
+    if nx * ny > MAX_CELLS:
+        raise ValueError(f"Survey covers {nx} x {ny} cells of {cell:g} m; use a larger SURVEY_GRID_CELL")
+
+    flat = (iy - iy0) * nx + (ix - ix0)
+    count = np.bincount(flat, minlength=nx * ny)
+    total = np.bincount(flat, weights=points[:, 2], minlength=nx * ny)
+    z = np.full(nx * ny, np.nan, dtype=np.float32)
+    np.divide(total, count, out=z, where=count > 0, casting='unsafe')
+    z = _fill_gaps(z.reshape(ny, nx), int(np.ceil(fill_distance / cell)))
+    return SurfaceGrid(ix0, iy0, z, cell)
+
+
+def _digest_manifest_path(file_path):
+    key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+    return os.path.join(settings.DATA_CACHE_DIR, 'surveys', 'manifests', f'{key}.json')
+
+
+def survey_digest(file_path):
+    """Content hash of a survey file, recomputed only when its size or mtime changed."""
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    memo = _digests.get(path)
+    if memo and memo[:2] == (stat.st_size, stat.st_mtime_ns):
+        return memo[2]
+
+    manifest_path = _digest_manifest_path(path)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest and manifest.get('size') == stat.st_size and manifest.get('mtime_ns') == stat.st_mtime_ns:
+        digest = manifest['hash']
+    else:
+        digest = content_hash(path)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(manifest_path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest}, f)
+        os.replace(tmp, manifest_path)
+    with _lock:
+        _digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def _grid_path(digest, cell, fill_distance):
+    return os.path.join(settings.DATA_CACHE_DIR, 'surveys', 'grids', f'{digest}-{cell:g}-{fill_distance:g}.npz')
+
+
+def load_surface_grid(file_path, cell=None, fill_distance=None):
+    """
+    SurfaceGrid of a survey .str file. Rasterized once per file content, cell
+    and fill distance; later calls read the cached grid. Returns (digest, grid).
+    """
+    cell = float(cell or settings.SURVEY_GRID_CELL)
+    fill_distance = float(settings.SURVEY_FILL_DISTANCE if fill_distance is None else fill_distance)
+    digest = survey_digest(file_path)
+    path = _grid_path(digest, cell, fill_distance)
+    with _lock:
+        if path in _memo:
+            _memo[path] = _memo.pop(path)  # most recently used last
+            return digest, _memo[path]
+
+    grid = None
+    if os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                grid = SurfaceGrid(data['origin'][0], data['origin'][1], data['z'], cell)
+        except (OSError, ValueError, KeyError):
+            grid = None
+
+    if grid is None:
+        grid = rasterize_geometry(read_str_geometry(file_path), cell, fill_distance)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, origin=np.array([grid.ix0, grid.iy0]), z=grid.z)
+        os.replace(tmp, path)
+
+    with _lock:
+        _memo[path] = grid
+        while len(_memo) > GRID_MEMO_SIZE:
+            del _memo[next(iter(_memo))]
+    return digest, grid
+
+
+def _bench_volumes(top, bottom, edges, area):
+    """(benches,) volume between the two surfaces inside each bench [edges[i], edges[i + 1])."""
+    return np.array([
+        np.clip(np.minimum(top, hi) - np.maximum(bottom, lo), 0, None).sum() * area
+        for lo, hi in zip(edges[:-1], edges[1:])
+    ])
+
+
+def _phase_labels(x, y, z, phases):
+    """Index into 'phases' of the first phase whose outline contains each point (-1 = outside all)."""
+    labels = np.full(len(x), -1, dtype=np.int64)
+    for i, phase in enumerate(phases):
+        strings = phase['strings']
+        if not len(strings):
+            continue
+        free = np.flatnonzero(labels < 0)
+        # Cuts above the phase's top contour still belong to its footprint at the crest
+        inside = strings.contains(x[free], y[free], np.minimum(z[free], strings.levels.max()))
+        labels[free[inside]] = i
+    return labels
+
+
+def compute_survey_volumes(previous, current, phases=None, density=None, bench_height=None):
+    """
+    Mined (cut) and filled volume between two SurfaceGrids, per bench and per
+    phase. 'phases' is a list of {'phase_id', 'phase_name', 'strings': StringIndex}
+    checked in order. Returns (JSON-ready dict, cut depth grid over the common window).
+    """
+    density = float(density or settings.BLOCK_MODEL_DEFAULT_DENSITY)
+    bench_height = float(bench_height or settings.DESIGN_BENCH_HEIGHT)
+    cell = current.cell
+    area = cell * cell
+    result = {'cell': cell, 'density': density, 'bench_height': bench_height, 'cells_cut': 0,
+              'cut': {'volume': 0.0, 'tonnes': 0.0}, 'fill': {'volume': 0.0}, 'benches': [], 'phases': []}
+
+    # Common window of the two grids on the lattice
+    ix0, iy0 = max(previous.ix0, current.ix0), max(previous.iy0, current.iy0)
+    nx = min(previous.ix0 + previous.shape[1], current.ix0 + current.shape[1]) - ix0
+    ny = min(previous.iy0 + previous.shape[0], current.iy0 + current.shape[0]) - iy0
+    if nx <= 0 or ny <= 0:
+        return result, SurfaceGrid(ix0, iy0, np.empty((0, 0), dtype=np.float32), cell)
+    before = previous.window(ix0, iy0, nx, ny)
+    after = current.window(ix0, iy0, nx, ny)
+
+    with np.errstate(invalid='ignore'):
+        depth = before - after
+    depth[np.abs(depth) < MIN_DEPTH] = 0
+    cut_depth = np.where(np.isnan(depth), np.nan, np.clip(depth, 0, None)).astype(np.float32)
+    result['origin'] = [round(ix0 * cell, 3), round(iy0 * cell, 3)]
+    result['shape'] = [int(ny), int(nx)]
+    result['fill']['volume'] = round(float(np.nansum(np.clip(-depth, 0, None))) * area, 1)
+
+    rows, cols = np.nonzero(cut_depth > 0)
+    if not len(rows):
+        return result, SurfaceGrid(ix0, iy0, cut_depth, cell)
+    top, bottom = before[rows, cols].astype(np.float64), after[rows, cols].astype(np.float64)
+
+    first = np.floor(bottom.min() / bench_height) * bench_height
+    edges = np.arange(first, top.max() + bench_height, bench_height)
+
+    def bench_rows(per_bench):
+        return [
+            {'z_from': round(float(edges[i]), 2), 'z_to': round(float(edges[i + 1]), 2),
+             'volume': round(float(v), 1), 'tonnes': round(float(v) * density, 1)}
+            for i, v in enumerate(per_bench) if v > 0
+        ]
+
+    volume = float((top - bottom).sum()) * area
+    result['cells_cut'] = int(len(rows))
+    result['cut'] = {'volume': round(volume, 1), 'tonnes': round(volume * density, 1)}
+    result['benches'] = bench_rows(_bench_volumes(top, bottom, edges, area))
+
+    # Phase of each cut cell: design outline at the middle of the cut
+    phases = phases or []
+    x = (ix0 + cols + 0.5) * cell
+    y = (iy0 + rows + 0.5) * cell
+    labels = _phase_labels(x, y, (top + bottom) / 2, phases)
+    groups = [(phase, labels == i) for i, phase in enumerate(phases)]
+    groups.append(({'phase_id': None, 'phase_name': 'Outside design' if phases else 'Whole survey'}, labels < 0))
+    for phase, members in groups:
+        if not members.any():
+            continue
+        volume = float((top[members] - bottom[members]).sum()) * area
+        result['phases'].append({
+            'phase_id': phase['phase_id'],
+            'phase_name': phase['phase_name'],
+            'cells': int(members.sum()),
+            'volume': round(volume, 1),
+            'tonnes': round(volume * density, 1),
+            'benches': bench_rows(_bench_volumes(top[members], bottom[members], edges, area)),
+        })
+    return result, SurfaceGrid(ix0, iy0, cut_depth, cell)
+
+
+def _volumes_folder():
+    return os.path.join(settings.DATA_CACHE_DIR, 'surveys', 'volumes')
+
+
+def survey_volumes(previous_path, current_path, phases=None, phase_key=None, density=None, bench_height=None):
+    """
+    compute_survey_volumes() for two survey files, cached per surface contents,
+    grid, density, bench height and design version (phase_key).
+    Returns (result dict, path of the cut depth .npy).
+    """
+    density = float(density or settings.BLOCK_MODEL_DEFAULT_DENSITY)
+    bench_height = float(bench_height or settings.DESIGN_BENCH_HEIGHT)
+    prev_digest, curr_digest = survey_digest(previous_path), survey_digest(current_path)
+    key = (f'{prev_digest[:16]}-{curr_digest[:16]}-{float(settings.SURVEY_GRID_CELL):g}'
+           f'-{float(settings.SURVEY_FILL_DISTANCE):g}-{density:g}-{bench_height:g}-{phase_key or "none"}')
+    base = os.path.join(_volumes_folder(), key)
+    if os.path.exists(base + '.json') and os.path.exists(base + '.npy'):
+        try:
+            with open(base + '.json') as f:
+                return json.load(f), base + '.npy'
+        except (OSError, ValueError):
+            pass
+
+    _, previous = load_surface_grid(previous_path)
+    _, current = load_surface_grid(current_path)
+    result, cut = compute_survey_volumes(previous, current, phases, density, bench_height)
+    os.makedirs(_volumes_folder(), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=_volumes_folder(), suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, cut.z)
+    os.replace(tmp, base + '.npy')
+    fd, tmp = tempfile.mkstemp(dir=_volumes_folder(), suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(result, f)
+    os.replace(tmp, base + '.json')
+    return result, base + '.npy'
@@ -0,0 +1,142 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from dashboard.utils.block_store import ORE
+
+# ==========================================
+# VOXEL AGGREGATION
+# ==========================================
+# Bins the block model into a regular 3D grid so the map can draw a bounded
+# number of voxels instead of every block. Per voxel we keep total tonnes,
+# ore tonnes, contained metal (grade * tonnes of ore) and the block count;
+# the tonnage-weighted grade is metal / ore tonnes. Grids depend only on the
+# block model version and the cell size, so each one is built once and saved
+# under DATA_CACHE_DIR/voxels/<block version>/<cell size>.npz.
+
+_memo = {}
+_lock = threading.Lock()
+
+
+class VoxelGrid:
+    """Occupied voxels of one grid, as parallel arrays (one entry per voxel)."""
+
+    def __init__(self, origin, size, ijk, tonnes, ore_tonnes, metal, count):
+        self.origin = np.asarray(origin, dtype=np.float64)  # corner of voxel (0, 0, 0)
+        self.size = float(size)
+        self.ijk = ijk                # (V, 3) int32 voxel indices
+        self.tonnes = tonnes          # float64, ore + waste
+        self.ore_tonnes = ore_tonnes  # float64
+        self.metal = metal            # float64, grams (g/t * t)
+        self.count = count            # int64, blocks per voxel
+
+    def __len__(self):
+        return len(self.tonnes)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    @property
+    def centres(self):
+        """(V, 3) voxel centre coordinates."""
+        return self.origin + (self.ijk + 0.5) * self.size
+
+    @property
+    def grade(self):
+        """Tonnage-weighted ore grade per voxel (0 where a voxel holds no ore)."""
+        return np.divide(self.metal, self.ore_tonnes, out=np.zeros(len(self)), where=self.ore_tonnes > 0)
+
+    @property
+    def ore_fraction(self):
+        return np.divide(self.ore_tonnes, self.tonnes, out=np.zeros(len(self)), where=self.tonnes > 0)
+
+    def arrays(self):
+        return {
+            'origin': self.origin, 'size': np.float64(self.size), 'ijk': self.ijk,
+            'tonnes': self.tonnes, 'ore_tonnes': self.ore_tonnes, 'metal': self.metal, 'count': self.count,
+        }
+
+
+def voxelize(blocks, size, mask=None):
+    """
+    Aggregates blocks (a BlockStore) into cubes of edge 'size' metres.
+    Fully vectorized: one np.unique over the packed voxel keys, then bincounts.
+    """
+    rows = np.flatnonzero(mask) if mask is not None else None
+    xyz = blocks.xyz(rows)
+    if not len(xyz):
+        return VoxelGrid(np.zeros(3), size, np.empty((0, 3), np.int32),
+                         np.empty(0), np.empty(0), np.empty(0), np.empty(0, np.int64))
+
+    origin = np.floor(xyz.min(axis=0) / size) * size
+    ijk = np.floor((xyz - origin) / size).astype(np.int64)
+    dims = ijk.max(axis=0) + 1
+    keys, inverse = np.unique(np.ravel_multi_index(ijk.T, dims), return_inverse=True)
+
+    def column(name):
+        values = getattr(blocks, name)
+        return np.asarray(values if rows is None else values[rows], dtype=np.float64)
+
+    tonnes = column('tonnes')
+    ore_tonnes = np.where(column('material') == ORE, tonnes, 0.0)
+    metal = ore_tonnes * column('grade')
+
+    n = len(keys)
+    return VoxelGrid(
+        origin, size,
+        np.column_stack(np.unravel_index(keys, dims)).astype(np.int32),
+        np.bincount(inverse, weights=tonnes, minlength=n),
+        np.bincount(inverse, weights=ore_tonnes, minlength=n),
+        np.bincount(inverse, weights=metal, minlength=n),
+        np.bincount(inverse, minlength=n),
+    )
+
+
+def _cache_path(version, size):
+    return os.path.join(settings.DATA_CACHE_DIR, 'voxels', version, f'{size:g}.npz')
+
+
+def load_voxels(blocks, size):
+    """VoxelGrid of the whole block model at 'size', cached per block version and size."""
+    key = (blocks.version, float(size))
+    with _lock:
+        if key in _memo:
+            return _memo[key]
+
+    path = _cache_path(blocks.version, size) if blocks.version else None
+    grid = None
+    if path and os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                grid = VoxelGrid(data['origin'], float(data['size']), data['ijk'], data['tonnes'],
+                                 data['ore_tonnes'], data['metal'], data['count'])
+        except (OSError, ValueError, KeyError):
+            grid = None
+
+    if grid is None:
+        grid = voxelize(blocks, size)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **grid.arrays())
+            os.replace(tmp, path)
+
+    with _lock:
+        _memo[key] = grid
+    return grid
+
+
+def voxels_for_budget(blocks, size, max_voxels):
+    """
+    The cached grid at 'size', doubled in size until it has at most
+    max_voxels occupied voxels, so the map never draws more than that.
+    """
+    grid = load_voxels(blocks, size)
+    while len(grid) > max_voxels:
+        size *= 2
+        grid = load_voxels(blocks, size)
+    return grid
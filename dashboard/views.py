@@ -1,13 +1,17 @@
 import base64
+import hashlib
 import json
 import os
 import io
 import csv
+import math
 from datetime import date, timedelta, datetime
+from functools import wraps
 
 # Data Science / Plotting
+import numpy as np
 import plotly.graph_objects as go
-from plotly.offline import plot
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
 import matplotlib
 matplotlib.use('Agg')
 from matplotlib import pyplot as plt
@@ -16,11 +20,19 @@ from PIL import Image, ImageDraw
 
 # Django Core
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse, HttpResponseNotAllowed
-from django.db.models import Sum, Count, Avg, F, FloatField, ExpressionWrapper, Case, When
+from django.http import JsonResponse, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from django.db.models import Sum, Count, Avg, Max, F, FloatField, ExpressionWrapper, Case, When
+from django.db.models.functions import ExtractMonth
 from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from django.utils.timezone import make_aware
+from django.utils.text import get_valid_filename, slugify
 from django.db import models, transaction
 from django.contrib import messages
 from django.core.serializers.json import DjangoJSONEncoder
@@ -37,6 +49,31 @@ from rest_framework import generics
 
 # Local Imports
 from dashboard.utils.str_parser import parse_str_file
+from dashboard.utils.block_store import ORE, WASTE, BlockModelError, ingest_block_model, load_block_store
+from dashboard.utils.block_sampling import stratified_sample
+from dashboard.utils.voxels import voxels_for_budget
+from dashboard.utils.bench_index import load_bench_index
+from dashboard.utils.grade_tonnage import DEFAULT_CUTOFFS, grade_tonnage_curves
+from dashboard.utils.grade_estimation import estimate_key, estimated_grade, grade_estimate_status, load_grade_estimate, schedule_grade_estimate
+from dashboard.utils.slicing import bench_plan, vertical_section
+from dashboard.utils.spatial_index import blocks_in_pit, load_block_index, load_string_index
+from dashboard.utils.plan_tiles import ensure_tile, plan_extent, prerender_tiles
+from dashboard.utils.simplify import choose_lod
+from dashboard.utils.chunked_upload import create_staging, expire_interrupted, missing_chunks, received_chunks, start_ingestion, write_chunk
+from dashboard.utils.datasets import activate_dataset, data_path, list_versions, publish_dataset, rollback_dataset
+from dashboard.utils.design_store import load_design_store, save_design_file
+from dashboard.utils.design_volumes import design_volumes
+from dashboard.utils.production_rollup import daily_production, rollup_totals
+from dashboard.utils.survey_volumes import survey_volumes
+from dashboard.utils.pit_binary import CONTENT_TYPE as PIT_BINARY_CONTENT_TYPE, encode_geometry
+from dashboard.utils.geometry_cache import (
+    CACHE_STATS,
+    build_geometry_cache,
+    geometry_version,
+    load_pit_geometry,
+    load_pit_geometry_lod,
+    pit_geometry_levels,
+)
 
 # ==========================================
 # 1. MODELS IMPORT (Consolidated)
@@ -52,6 +89,11 @@ from .models import (
     MonthlyProductionPlan, 
     FinancialSettings, 
     PitBlock, 
+    PitBlockChange,
+    PitDesignFile,
+    SurveySurface,
+    DailyProductionRollup,
+    UploadSession,
     DailyProductionLog, 
     PeriodStockpileActual, 
     DailyPlantFeed,
@@ -74,6 +116,8 @@ from .forms import (
     PhaseScheduleForm, 
     ExpectedValuesForm, 
     BlockModelUploadForm, 
+    DesignFilesUploadForm,
+    SurveyUploadForm,
     PlantForm, 
     PitAliasForm, 
     DailyFeedForm, 
@@ -124,6 +168,11 @@ class PhaseScheduleList(generics.ListAPIView):
     serializer_class = PhaseScheduleSerializer
 
 
+def daily_production_api(request):
+    """Daily mined tonnage (total, ore, waste) and tonnage-weighted grade, from the production rollup."""
+    return JsonResponse(daily_production(DailyProductionRollup.objects.all()), safe=False)
+
+
 # ==========================================
 # Dashboard Views
 # ==========================================
@@ -186,11 +235,16 @@ def production_vs_demand_view(request):
     # 1. AJAX Handler for Chart & Table (Data Fetch)
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
         
-        # Fetch detailed data for JS processing
-        prod_data = list(ProductionRecord.objects.values(
-            'timestamp', 'tonnage', 'material_type', 'grade', 
-            'mine_phase__expected_grade'
-        ))
+        # Daily totals from the rollup, one row per day and material, in the shape the JS
+        # expects of a record (grades are the tonnage-weighted averages of that day; as before,
+        # records without a grade count as 0 g/t)
+        prod_data = [{
+            'timestamp': row['day'],
+            'tonnage': row['tonnage'],
+            'material_type': row['material_type'],
+            'grade': row['metal'] / row['tonnage'] if row['tonnage'] else None,
+            'mine_phase__expected_grade': row['expected_metal'] / row['tonnage'] if row['tonnage'] else None,
+        } for row in rollup_totals(DailyProductionRollup.objects.all(), 'day', 'material_type')]
         demand_data = list(PlantDemand.objects.values('timestamp', 'required_tonnage'))
         
         data = {
@@ -205,8 +259,9 @@ def production_vs_demand_view(request):
 
     # --- STRIPPING RATIO ANALYSIS ---
     # Calculate Total Ore vs Total Waste
-    total_ore = ProductionRecord.objects.filter(material_type='ore').aggregate(Sum('tonnage'))['tonnage__sum'] or 0
-    total_waste = ProductionRecord.objects.filter(material_type='waste').aggregate(Sum('tonnage'))['tonnage__sum'] or 0
+    totals = {row['material_type']: row['tonnage'] for row in rollup_totals(DailyProductionRollup.objects.all(), 'material_type')}
+    total_ore = totals.get('ore', 0)
+    total_waste = totals.get('waste', 0)
     total_demand = PlantDemand.objects.aggregate(Sum('required_tonnage'))['required_tonnage__sum'] or 0
 
     # Calculate Ratio (Waste / Ore)
@@ -409,61 +464,294 @@ def upload_block_model(request):
     if request.method == 'POST':
         form = BlockModelUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            # Directory to save files (inside static so they persist)
-            save_path = os.path.join(settings.BASE_DIR, 'dashboard', 'static', 'data')
-            os.makedirs(save_path, exist_ok=True)
-
-            # 1. Save Pit Design (.str)
-            if 'pit_design_file' in request.FILES:
-                with open(os.path.join(save_path, 'pit_design.str'), 'wb+') as dest:
-                    for chunk in request.FILES['pit_design_file'].chunks():
-                        dest.write(chunk)
-
-            # 2. Save Ore CSV
-            if 'ore_file' in request.FILES:
-                with open(os.path.join(save_path, 'ore_blocks.csv'), 'wb+') as dest:
-                    for chunk in request.FILES['ore_file'].chunks():
-                        dest.write(chunk)
-            
-            # 3. Save Waste CSV
-            if 'waste_file' in request.FILES:
-                with open(os.path.join(save_path, 'waste_blocks.csv'), 'wb+') as dest:
-                    for chunk in request.FILES['waste_file'].chunks():
-                        dest.write(chunk)
+            # 1. Write the upload as a new dataset version (files not uploaded carry over)
+            uploads = {
+                name: request.FILES[field]
+                for field, name in (('pit_design_file', 'pit_design.str'), ('ore_file', 'ore_blocks.csv'), ('waste_file', 'waste_blocks.csv'))
+                if field in request.FILES
+            }
+            if not uploads:
+                messages.warning(request, "No files selected.")
+                return redirect('upload_block_model')
+            try:
+                manifest = publish_dataset(uploads)  # block CSVs are converted before it becomes current
+            except ValueError as e:
+                messages.error(request, f"Upload rejected, the current dataset is unchanged: {e}")
+                return redirect('upload_block_model')
+            if 'blocks' in manifest and ('ore_blocks.csv' in uploads or 'waste_blocks.csv' in uploads):
+                messages.info(request, f"Block model stored: {manifest['blocks']:,} blocks.")
 
-            messages.success(request, "Files uploaded successfully! Map updated.")
+            # 2. Rebuild the parsed-geometry cache for the new version
+            _activate_dataset(request, pit_design='pit_design.str' in uploads, blocks=False)
+
+            messages.success(request, f"Files uploaded successfully! Map updated (dataset {manifest['version']}).")
             return redirect('pit_phase_dashboard')
     else:
         form = BlockModelUploadForm()
 
-    return render(request, 'dashboard/upload_block_model.html', {'form': form})
+    return render(request, 'dashboard/upload_block_model.html', {'form': form, 'versions': list_versions()})
 
-def generate_pit_map_base64(parsed_phases, ore_data=None, waste_data=None):
+def _activate_dataset(request, pit_design=True, blocks=True):
+    """Builds the caches of the current dataset version, reporting the block model conversion."""
+    try:
+        store = activate_dataset(pit_design, blocks)
+        if store:
+            messages.info(request, f"Block model stored: {len(store):,} blocks.")
+    except ValueError as e:
+        messages.error(request, f"Block model not converted: {e}")
+
+def rollback_dataset_view(request):
+    """POST: makes an earlier uploaded dataset version current again."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        manifest = rollback_dataset(request.POST.get('version'))
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('upload_block_model')
+    _activate_dataset(request)
+    messages.success(request, f"Rolled back to dataset {manifest['version']}.")
+    return redirect('upload_block_model')
+
+def upload_design_files(request):
+    """
+    Uploads several Surpac design files (pushbacks / pit shells) for one pit or phase.
+    All registered files are then merged into one design store for the pit map;
+    new files are parsed in parallel.
     """
-    Generates 3D Map with Pit Shell (Lines) + Block Model (Points).
+    if request.method == 'POST':
+        form = DesignFilesUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            pit = form.cleaned_data['pit'].strip()
+            phase = form.cleaned_data['mine_phase']
+
+            folder = os.path.join(settings.PIT_DATA_DIR, 'designs', slugify(pit) or 'pit', str(phase.id) if phase else 'pit')
+
+            for upload in form.cleaned_data['design_files']:
+                name = get_valid_filename(os.path.basename(upload.name))
+                path = os.path.join(folder, name)
+                save_design_file(upload, path)  # temp file + rename: readers never see it half-written
+                PitDesignFile.objects.update_or_create(
+                    file_path=path,
+                    defaults={'pit': pit, 'mine_phase': phase, 'name': name}
+                )
+
+            store = load_design_store()
+            messages.success(
+                request,
+                f"Uploaded {len(form.cleaned_data['design_files'])} design file(s). "
+                f"Design store: {store.geometry.n_vertices:,} points in {len(store.sources)} files."
+            )
+            updated = apply_design_tonnage(_current_design_volumes())
+            if updated:
+                messages.info(request, f"Planned tonnage derived from the design for {updated} phase(s) that had none.")
+            return redirect('pit_map')
+    else:
+        form = DesignFilesUploadForm()
+
+    return render(request, 'dashboard/upload_design_files.html', {
+        'form': form,
+        'design_files': PitDesignFile.objects.select_related('mine_phase'),
+    })
+
+# ==========================================
+# Chunked Uploads (resumable dataset upload API)
+# ==========================================
+
+def _upload_session_json(session):
+    missing = missing_chunks(session) if session.status == 'uploading' else []
+    return {
+        'id': str(session.pk),
+        'target': session.target,
+        'file_name': session.file_name,
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'chunks': session.chunk_count,
+        'received': session.chunk_count - len(missing),
+        'missing': missing,
+        'status': session.status,
+        'error': session.error,
+        'dataset_version': session.dataset_version,
+    }
+
+def upload_sessions_api(request):
+    """
+    API endpoint: POST {"target": "ore_blocks.csv", "file_name", "size", "chunk_size"?, "sha256"?}
+    starts a resumable upload and returns its id and chunk layout. GET lists recent uploads.
+    """
+    if request.method == 'GET':
+        return JsonResponse({'uploads': [_upload_session_json(expire_interrupted(s)) for s in UploadSession.objects.all()[:20]]})
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['GET', 'POST'])
+
+    try:
+        data = json.loads(request.body or b'{}')
+        size = int(data['size'])
+        chunk_size = int(data.get('chunk_size') or settings.UPLOAD_CHUNK_SIZE)
+        target = data['target']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'JSON body needs target, file_name and size'}, status=400)
+    if target not in dict(UploadSession.TARGET_CHOICES):
+        return JsonResponse({'error': f"target must be one of {', '.join(dict(UploadSession.TARGET_CHOICES))}"}, status=400)
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        return JsonResponse({'error': f'size must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes'}, status=400)
+
+    session = UploadSession.objects.create(
+        target=target,
+        file_name=get_valid_filename(os.path.basename(str(data.get('file_name') or target))),
+        total_size=size,
+        chunk_size=min(max(chunk_size, 256 * 1024), 64 * 1024 * 1024),
+        sha256=str(data.get('sha256') or '').lower()[:64],
+    )
+    create_staging(session)
+    return JsonResponse(_upload_session_json(session), status=201)
+
+def upload_session_api(request, session_id):
+    """API endpoint: state of one upload, including the chunk indices still missing (to resume)."""
+    session = expire_interrupted(get_object_or_404(UploadSession, pk=session_id))
+    return JsonResponse(_upload_session_json(session))
+
+def upload_chunk_api(request, session_id, index):
+    """
+    API endpoint: PUT (or POST) the raw bytes of chunk <index> with its SHA-256 in the
+    X-Chunk-SHA256 header. The body is streamed to the staging file, never held in memory.
+    """
+    if request.method not in ('PUT', 'POST'):
+        return HttpResponseNotAllowed(['PUT', 'POST'])
+    session = get_object_or_404(UploadSession, pk=session_id)
+    if session.status != 'uploading':
+        return JsonResponse({'error': f'Upload is {session.status}'}, status=409)
+    try:
+        write_chunk(session, index, request, request.headers.get('X-Chunk-SHA256'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    received = len(received_chunks(session))
+    return JsonResponse({'index': index, 'received': received, 'chunks': session.chunk_count})
+
+def upload_complete_api(request, session_id):
+    """API endpoint: POST once every chunk is in; the file is ingested in the background (202)."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    session = expire_interrupted(get_object_or_404(UploadSession, pk=session_id))
+    if session.status not in ('uploading', 'failed'):
+        return JsonResponse(_upload_session_json(session), status=409)
+    missing = missing_chunks(session)
+    if missing:
+        return JsonResponse({'error': f'{len(missing)} chunk(s) missing', 'missing': missing}, status=409)
+    start_ingestion(session)
+    return JsonResponse(_upload_session_json(session), status=202)
+
+def _point_budget(request):
+    """Reads ?points= (vertex budget for pit strings), falling back to settings."""
+    try:
+        return max(100, int(request.GET.get('points', settings.PIT_MAP_POINT_BUDGET)))
+    except (TypeError, ValueError):
+        return settings.PIT_MAP_POINT_BUDGET
+
+def _block_budget(request):
+    """Reads ?blocks= (max block markers on the 3D map), falling back to settings."""
+    try:
+        return max(100, int(request.GET.get('blocks', settings.PIT_MAP_BLOCK_BUDGET)))
+    except (TypeError, ValueError):
+        return settings.PIT_MAP_BLOCK_BUDGET
+
+def _current_block_store(request, api=False):
+    """
+    Block store for the current ore / waste CSVs (converted on upload, never here).
+    The last good store is served when the CSVs changed since: pages show a warning,
+    APIs flag it (see block_model_errors). With no usable store at all, pages get
+    None and show the reason; APIs raise BlockModelError.
+    """
+    try:
+        blocks = load_block_store(
+            data_path('ore_blocks.csv'),
+            data_path('waste_blocks.csv'),
+        )
+    except BlockModelError as e:
+        if api:
+            raise
+        messages.error(request, f"{e}. Upload corrected block model files.")
+        return None
+    if blocks is not None and blocks.stale:
+        if api:
+            request.block_model_stale = blocks.stale
+        else:
+            messages.warning(request, f"Showing the previous block model. {blocks.stale}.")
+    return blocks
+
+def block_model_errors(view):
+    """
+    API views: no usable block model is a 409 with the reason; a stale one (previous
+    model served) is flagged with an X-Block-Model-Stale header giving the reason.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        try:
+            response = view(request, *args, **kwargs)
+        except BlockModelError as e:
+            return JsonResponse({'error': str(e)}, status=409)
+        stale = getattr(request, 'block_model_stale', None)
+        if stale:
+            response['X-Block-Model-Stale'] = ' '.join(stale.split())
+        return response
+    return wrapped
+
+VOXEL_STEPS = 6  # voxel edges offered: the block edge times 1, 2, 4 ... 64
+
+def _voxel_size(request):
+    """
+    Reads ?voxel= (voxel edge in metres), falling back to settings. Snapped to the
+    block edge times a power of two, so only a handful of grids are ever built and cached.
+    """
+    try:
+        size = float(request.GET.get('voxel', settings.PIT_MAP_VOXEL_SIZE))
+    except (TypeError, ValueError):
+        size = settings.PIT_MAP_VOXEL_SIZE
+    if not math.isfinite(size) or size <= 0:
+        size = settings.PIT_MAP_VOXEL_SIZE
+    block = float(min(settings.BLOCK_MODEL_DEFAULT_SIZE))
+    return block * 2 ** min(max(round(math.log2(size / block)), 0), VOXEL_STEPS)
+
+# Line colours for design groups (one per pit / phase) on the pit map
+PHASE_COLOURS = ['#ffffff', '#00bfff', '#ffa500', '#7fff00', '#ff69b4', '#ffd700', '#9370db', '#40e0d0']
+
+def build_pit_map_figure(geometry, ore_data=None, waste_data=None, groups=None):
+    """
+    Generates 3D Map Figure with Pit Shell (Lines) + Block Model (Points).
     FIXED: Corrected 'titlefont' error by using title=dict(font=...).
+    'geometry' is a StrGeometry (see dashboard.utils.geometry_cache).
+    'groups' (optional) is a list of (label, StrGeometry), drawn one colour per pit / phase.
     """
-    if not parsed_phases and not ore_data and not waste_data:
+    if not geometry and not groups and not ore_data and not waste_data:
         return None
 
     fig = go.Figure()
 
-    # 1. Plot Pit Strings (White Lines)
-    if parsed_phases:
-        for name, coords in parsed_phases.items():
-            if coords:
-                # Unpack coordinates, keeping None values for line breaks
-                xs = [c[0] if c[0] is not None else None for c in coords]
-                ys = [c[1] if c[1] is not None else None for c in coords]
-                zs = [c[2] if c[2] is not None else None for c in coords]
-
-                fig.add_trace(go.Scatter3d(
-                    x=xs, y=ys, z=zs,
-                    mode='lines',
-                    name=f'String {name}',
-                    line=dict(width=2, color='white'), 
-                    connectgaps=False 
-                ))
+    # 1a. Design Store (one trace per pit / phase)
+    if groups:
+        for i, (label, group_geometry) in enumerate(groups):
+            xs, ys, zs = group_geometry.plot_xyz()
+            fig.add_trace(go.Scatter3d(
+                x=xs, y=ys, z=zs,
+                mode='lines',
+                name=label,
+                line=dict(width=2, color=PHASE_COLOURS[i % len(PHASE_COLOURS)]),
+                connectgaps=False
+            ))
+
+    # 1b. Plot Pit Strings (White Lines)
+    elif geometry:
+        for name in dict.fromkeys(geometry.string_ids.tolist()):
+            # Flatten segments, keeping None values for line breaks
+            xs, ys, zs = geometry.select(geometry.string_ids == name).plot_xyz()
+
+            fig.add_trace(go.Scatter3d(
+                x=xs, y=ys, z=zs,
+                mode='lines',
+                name=f'String {name}',
+                line=dict(width=2, color='white'),
+                connectgaps=False
+            ))
 
     # 2. Plot WASTE Blocks (Grey Dots)
     if waste_data and len(waste_data[0]) > 0:
@@ -524,15 +812,18 @@ def generate_pit_map_base64(parsed_phases, ore_data=None, waste_data=None):
         plot_bgcolor="black",
     )
 
-    return plot(fig, output_type='div', include_plotlyjs=True)
+    return fig
 
 def phase_progress_view(request):
     """
     FINAL VERSION: Fixed 'NameError' by restoring total_variance calculation.
     """
-    # 1. Standard Production Stats
-    phases = PhaseSchedule.objects.select_related('mine_phase').all().order_by('mine_phase__sequence_order')
-    for p in phases: p.update_removed_tonnage()
+    # 1. Standard Production Stats (totals are kept current when production is written)
+    phases = list(
+        PhaseSchedule.objects.select_related('mine_phase')
+        .prefetch_related('mine_phase__production_records')
+        .order_by('mine_phase__sequence_order')
+    )
 
     total_planned = sum(p.planned_tonnage for p in phases)
     total_actual = sum(p.removed_tonnage for p in phases)
@@ -553,114 +844,106 @@ def phase_progress_view(request):
     progress_percentages = [p.current_progress for p in phases]
     variance_list = [p.removed_tonnage - p.planned_tonnage for p in phases]
     
-    ore_movement = []
-    waste_movement = []
-    for p in phases:
-        records = p.mine_phase.production_records.all()
-        ore = records.filter(material_type='ore').aggregate(Sum('tonnage'))['tonnage__sum'] or 0
-        waste = records.filter(material_type='waste').aggregate(Sum('tonnage'))['tonnage__sum'] or 0
-        ore_movement.append(round(ore, 2))
-        waste_movement.append(round(waste, 2))
+    ore_movement = [round(p.ore_tonnage, 2) for p in phases]
+    waste_movement = [round(p.waste_tonnage, 2) for p in phases]
 
     # =========================================================
-    # LOAD DATA
+    # MINING CUT (bench index, no block scan)
     # =========================================================
-    data_path = os.path.join(settings.BASE_DIR, 'dashboard', 'static', 'data')
-
-    def load_csv_with_grade(filename, step=50):
-        xs, ys, zs, grades = [], [], [], []
-        fpath = os.path.join(data_path, filename)
-        if os.path.exists(fpath):
-            try:
-                with open(fpath, 'r') as f:
-                    reader = csv.DictReader(f)
-                    count = 0
-                    for row in reader:
-                        if count % step != 0:
-                            count += 1
-                            continue
-                        try:
-                            # Auto-detect column names (case-insensitive)
-                            row_lower = {k.lower().strip(): v for k, v in row.items()}
-                            
-                            x = float(row_lower.get('x', 0))
-                            y = float(row_lower.get('y', 0))
-                            z = float(row_lower.get('z', 0))
-                            
-                            # Try finding grade in various common column names
-                            g_val = row_lower.get('au_ok', row_lower.get('au', row_lower.get('grade', 0)))
-                            g = float(g_val)
-
-                            xs.append(x); ys.append(y); zs.append(z); grades.append(g)
-                        except ValueError:
-                            continue
-                        count += 1
-            except Exception: pass
-        return xs, ys, zs, grades
-
-    # Load Data
-    ore_x, ore_y, ore_z, ore_grade = load_csv_with_grade('ore_blocks.csv', step=50)
-    waste_x, waste_y, waste_z, _ = load_csv_with_grade('waste_blocks.csv', step=100) 
+    # Progress is bucketed to whole percent so the map figure can be cached per step
+    progress_bucket = int(round(progress_ratio * 100))
+    blocks = _current_block_store(request)
+    cut_level, mined, blocks_total = _cut_at_progress(blocks, progress_bucket / 100)
 
-    # =========================================================
-    # MINING CUT LOGIC
-    # =========================================================
-    all_z = ore_z + waste_z
-    cut_level = 9999 # Default high
-    
-    final_ore_x, final_ore_y, final_ore_z, final_ore_c = [], [], [], []
-    final_waste_x, final_waste_y, final_waste_z = [], [], []
+    # The 3D map itself is fetched by the page as cached figure JSON (pit_progress_figure_api)
+    map_params = {key: request.GET[key] for key in ('view', 'points', 'blocks', 'voxel') if request.GET.get(key)}
+    figure_url = f"{reverse('pit-progress-figure')}?{urlencode({'progress': progress_bucket, **map_params})}"
+    lod = _lod_for_budget(pit_geometry_levels(data_path('pit_design.str')), _point_budget(request))
 
-    if all_z:
-        max_z = max(all_z)
-        min_z = min(all_z)
-        # Calculate level: Mine from Top (Max) down to Bottom (Min)
-        cut_level = max_z - ((max_z - min_z) * progress_ratio)
+    context = {
+        "phases": phases,
+        "active_phases_count": sum(p.status == 'active' for p in phases),
+        "completed_phases_count": sum(p.status == 'completed' for p in phases),
+        "total_planned": total_planned,
+        "total_actual": total_actual,
+        "total_variance": total_variance,
+        "phase_names": phase_names,
+        "planned_tonnage": planned_tonnage,
+        "removed_tonnage": removed_tonnage,
+        "progress_percentages": progress_percentages,
+        "ore_movement": ore_movement,
+        "waste_movement": waste_movement,
+        "variance": variance_list,
+        "figure_url": figure_url if (lod or blocks) else None,
+        "lod": lod,
+        "blocks_shown": min(blocks_total, _block_budget(request)),
+        "blocks_total": blocks_total,
+        "show_voxels": request.GET.get('view') == 'voxels',
+        "cut_level": cut_level,
+        "mined": mined,
+    }
 
-        # Filter Ore
-        for x, y, z, g in zip(ore_x, ore_y, ore_z, ore_grade):
-            if z < cut_level:
-                final_ore_x.append(x); final_ore_y.append(y); final_ore_z.append(z); final_ore_c.append(g)
+    return render(request, 'dashboard/phase_progress.html', context)
 
-        # Filter Waste
-        for x, y, z in zip(waste_x, waste_y, waste_z):
-            if z < cut_level:
-                final_waste_x.append(x); final_waste_y.append(y); final_waste_z.append(z)
+def _cut_at_progress(blocks, progress_ratio):
+    """(cut level, totals mined above it, blocks left below it) from the bench index."""
+    if not blocks:
+        return 9999, None, 0 # Default high
+    # Mine from Top down to the bench where progress_ratio of the tonnes is reached
+    benches = load_bench_index(blocks)
+    cut_level = benches.level_for_fraction(progress_ratio)
+    mined = benches.mined_above(cut_level)
+    return cut_level, mined, len(blocks) - mined['blocks']
+
+def _lod_for_budget(levels, point_budget):
+    """The detail level (lod.json entry) the map will use for point_budget, for captions."""
+    return levels[choose_lod(levels, point_budget)] if levels else None
+
+def build_progress_figure(blocks, geometry, progress_ratio, show_voxels=False, block_budget=None, voxel_size=None, strings=None):
+    """
+    Phase progress 3D map: pit shell, mining plane at the cut level and the
+    blocks (grade-sampled) or voxels still below it.
+    'strings' (StringIndex of the full design) sizes the mining plane to the pit outline at the cut.
+    """
+    block_budget = block_budget or settings.PIT_MAP_BLOCK_BUDGET
+    voxel_size = voxel_size or settings.PIT_MAP_VOXEL_SIZE
+    cut_level, _, _ = _cut_at_progress(blocks, progress_ratio)
+    ore_rows = waste_rows = np.empty(0, dtype=np.int64)
+    voxels = None
+
+    if blocks:
+        if show_voxels:
+            # Cached voxel grid (coarsened until it fits the budget)
+            voxels = voxels_for_budget(blocks, voxel_size, block_budget)
+        else:
+            # Thin to the marker budget by grade class + spatial cell (high grade kept first)
+            below = load_block_index(blocks).query_slab(-np.inf, cut_level)
+            rows = stratified_sample(blocks, budget=block_budget, rows=below)
+            is_ore = blocks.material[rows] == ORE
+            ore_rows, waste_rows = rows[is_ore], rows[~is_ore]
 
     # -------------------------------------------------------
     # GENERATE MAP
     # -------------------------------------------------------
     fig = go.Figure()
 
-    # 1. Pit Shell
-    parsed_phases = parse_str_file(os.path.join(data_path, 'pit_design.str'))
-    
-    # Calculate Pit Bounds for the Mining Plane
-    pit_xs, pit_ys = [], []
-    
-    if parsed_phases:
-        for name, coords in parsed_phases.items():
-            if coords:
-                px = [c[0] if c[0] is not None else None for c in coords]
-                py = [c[1] if c[1] is not None else None for c in coords]
-                pz = [c[2] if c[2] is not None else None for c in coords]
-                
-                # Collect coords for bounds calculation
-                for p in coords:
-                    if p[0] is not None: 
-                        pit_xs.append(p[0])
-                        pit_ys.append(p[1])
-
-                fig.add_trace(go.Scatter3d(
-                    x=px, y=py, z=pz, mode='lines', 
-                    line=dict(color='white', width=2), connectgaps=False, showlegend=False
-                ))
+    # 1. Pit Shell (cached arrays, simplified to the point budget, all strings in one trace)
+    if geometry:
+        px, py, pz = geometry.plot_xyz()
+        fig.add_trace(go.Scatter3d(
+            x=px, y=py, z=pz, mode='lines', 
+            line=dict(color='white', width=2), connectgaps=False, showlegend=False
+        ))
 
     # 2. Add "Mining Plane" (The Visual Update Indicator)
-    if pit_xs and pit_ys:
-        min_x, max_x = min(pit_xs), max(pit_xs)
-        min_y, max_y = min(pit_ys), max(pit_ys)
-        
+    if geometry:
+        # Pit outline at the cut level if the design has one there, else the whole design
+        outline = strings.bounds_at(cut_level) if strings else None
+        if outline:
+            min_x, min_y, max_x, max_y = outline
+        else:
+            (min_x, min_y, _), (max_x, max_y, _) = geometry.bounds()
+
         fig.add_trace(go.Mesh3d(
             x=[min_x, max_x, max_x, min_x],
             y=[min_y, min_y, max_y, max_y],
@@ -671,21 +954,21 @@ def phase_progress_view(request):
         ))
 
     # 3. Waste Blocks
-    if final_waste_x:
+    if len(waste_rows):
         fig.add_trace(go.Scatter3d(
-            x=final_waste_x, y=final_waste_y, z=final_waste_z,
+            x=blocks.x[waste_rows], y=blocks.y[waste_rows], z=blocks.z[waste_rows],
             mode='markers', name='Waste',
             marker=dict(size=2, color='grey', opacity=0.3)
         ))
 
     # 4. Ore Blocks (Heatmap)
-    if final_ore_x:
+    if len(ore_rows):
         fig.add_trace(go.Scatter3d(
-            x=final_ore_x, y=final_ore_y, z=final_ore_z,
+            x=blocks.x[ore_rows], y=blocks.y[ore_rows], z=blocks.z[ore_rows],
             mode='markers', name='Ore Block',
             marker=dict(
                 size=4,
-                color=final_ore_c,
+                color=blocks.grade[ore_rows],
                 colorscale='Jet',
                 cmin=0.0, cmax=3.0,
                 showscale=True,
@@ -694,10 +977,33 @@ def phase_progress_view(request):
                     tickfont=dict(color='white')
                 )
             ),
-            text=[f"Grade: {g:.2f} g/t" for g in final_ore_c],
-            hoverinfo='text'
+            hovertemplate='Grade: %{marker.color:.2f} g/t<extra></extra>'
         ))
 
+    # 5. Voxels below the cut (aggregated view): colour = tonnage-weighted grade, waste-only voxels grey
+    if voxels:
+        centres = voxels.centres
+        remaining = centres[:, 2] < cut_level
+        grade = voxels.grade
+        has_ore = voxels.ore_tonnes > 0
+        hover = np.column_stack([voxels.tonnes, grade, voxels.count])
+        for name, sel, colour in (('Waste Voxel', remaining & ~has_ore, 'grey'), ('Ore Voxel', remaining & has_ore, None)):
+            if not sel.any():
+                continue
+            marker = dict(size=6, symbol='square', color='grey', opacity=0.3)
+            if colour is None:
+                marker = dict(
+                    size=6, symbol='square', color=grade[sel], colorscale='Jet', cmin=0.0, cmax=3.0,
+                    showscale=True,
+                    colorbar=dict(title=dict(text="Au (g/t)", font=dict(color='white')), tickfont=dict(color='white'))
+                )
+            fig.add_trace(go.Scatter3d(
+                x=centres[sel, 0], y=centres[sel, 1], z=centres[sel, 2],
+                mode='markers', name=f'{name} ({voxels.size:g} m)', marker=marker,
+                customdata=hover[sel],
+                hovertemplate='%{customdata[0]:,.0f} t @ %{customdata[1]:.2f} g/t (%{customdata[2]} blocks)<extra></extra>'
+            ))
+
     # Styling
     fig.update_layout(
         title=dict(
@@ -715,71 +1021,663 @@ def phase_progress_view(request):
         paper_bgcolor="black", plot_bgcolor="black"
     )
     
-    pit_map_img = plot(fig, output_type='div', include_plotlyjs=True)
-
-    context = {
-        "phases": phases,
-        "active_phases_count": phases.filter(status='active').count(),
-        "completed_phases_count": phases.filter(status='completed').count(),
-        "total_planned": total_planned,
-        "total_actual": total_actual,
-        "total_variance": total_variance,
-        "phase_names": phase_names,
-        "planned_tonnage": planned_tonnage,
-        "removed_tonnage": removed_tonnage,
-        "progress_percentages": progress_percentages,
-        "ore_movement": ore_movement,
-        "waste_movement": waste_movement,
-        "variance": variance_list,
-        "pit_map_img": pit_map_img,
-    }
-
-    return render(request, 'dashboard/phase_progress.html', context)
+    return fig
 
 def pit_map_view(request):
     """
     Standalone view to preview the Pit STR file.
+    If multi-file designs were uploaded, every pit / phase is drawn from the design store instead.
+    The map is fetched as figure JSON from pit_design_figure_api.
     """
-    str_file = os.path.join(os.path.dirname(__file__), 'static', 'data', 'pit_design.str')
+    figure_url = f"{reverse('pit-design-figure')}?{urlencode({'points': _point_budget(request)})}"
+
+    store = load_design_store()
+    if store:
+        return render(request, 'dashboard/pit_preview.html', {
+            'figure_url': figure_url,
+            'phase_names': [f"{source['pit']} - {source['phase_name'] or 'Pit shell'}" for source, _ in store.groups()],
+            'lod': _lod_for_budget(store.levels, _point_budget(request)),
+        })
+
+    str_file = data_path('pit_design.str')
 
     if not os.path.exists(str_file):
         return render(request, 'dashboard/pit_preview.html', {
             'error': f'STR file not found at {str_file}'
         })
 
-    phases = parse_str_file(str_file)
-    if not phases:
+    geometry = load_pit_geometry(str_file)
+    if not geometry:
         return render(request, 'dashboard/pit_preview.html', {
             'error': 'Failed to read coordinates from STR file.'
         })
 
-    pit_map_img = generate_pit_map_base64(phases)
-
     # Mock Data for preview visualization
-    phase_names = list(phases.keys())
+    phase_names = list(dict.fromkeys(geometry.string_ids.tolist()))
     progress_percent = [50] * len(phase_names)
     planned_tonnage = [1000] * len(phase_names)
     removed_tonnage = [800] * len(phase_names)
 
     context = {
-        'pit_map_img': pit_map_img,
+        'figure_url': figure_url,
         'phase_names': phase_names,
         'progress_percent': progress_percent,
         'planned_tonnage': planned_tonnage,
-        'removed_tonnage': removed_tonnage
+        'removed_tonnage': removed_tonnage,
+        'lod': _lod_for_budget(pit_geometry_levels(str_file), _point_budget(request)),
     }
 
     return render(request, 'dashboard/pit_preview.html', context)
 
 def pit_data(request):
-    """API endpoint to return raw Pit Data JSON."""
-    file_path = os.path.join(os.path.dirname(__file__), "static", "data", "pit.str")
+    """API endpoint to return raw Pit Data JSON (legacy shape; see pit_geometry_api for the binary one)."""
+    file_path = data_path('pit_design.str')
     if os.path.exists(file_path):
-        phases = parse_str_file(file_path)
+        phases = load_pit_geometry(file_path).to_dict()
         return JsonResponse(phases)
     return JsonResponse({"error": "File not found"}, status=404)
 
 
+def _pit_geometry_etag(request):
+    """ETag = geometry content hash + the selection in the query string."""
+    version = geometry_version(data_path('pit_design.str'))
+    if version is None:
+        return None
+    query = '&'.join(sorted(f'{k}={v}' for k, v in request.GET.items()))
+    return f"{version[:16]}-{hashlib.sha1(query.encode('utf-8')).hexdigest()[:12]}"
+
+@gzip_page
+@condition(etag_func=_pit_geometry_etag)
+def pit_geometry_api(request):
+    """
+    Binary API: pit strings as little-endian float32 (PITG format, see dashboard/utils/pit_binary.py).
+    Optional filters:
+      ?ids=1,2,5           only these string IDs
+      ?zmin=900&zmax=960   only segments touching this elevation (bench) range
+      ?points=5000         use the simplified detail level that fits this vertex budget
+    """
+    file_path = data_path('pit_design.str')
+    if not os.path.exists(file_path):
+        return JsonResponse({"error": "File not found"}, status=404)
+
+    try:
+        ids = [int(v) for v in request.GET['ids'].split(',') if v.strip()] if request.GET.get('ids') else None
+        zmin = float(request.GET['zmin']) if request.GET.get('zmin') else None
+        zmax = float(request.GET['zmax']) if request.GET.get('zmax') else None
+    except ValueError:
+        return JsonResponse({"error": "ids must be integers, zmin/zmax numbers"}, status=400)
+
+    if 'points' in request.GET:
+        geometry, _ = load_pit_geometry_lod(file_path, _point_budget(request))
+    else:
+        geometry = load_pit_geometry(file_path)
+
+    # Segment selection (string IDs and/or bench range)
+    if ids is not None or zmin is not None or zmax is not None:
+        keep = np.ones(geometry.n_segments, dtype=bool)
+        if ids is not None:
+            keep &= np.isin(geometry.string_ids, ids)
+        seg_zmin, seg_zmax = geometry.segment_z_range()
+        if zmin is not None:
+            keep &= seg_zmax >= zmin
+        if zmax is not None:
+            keep &= seg_zmin <= zmax
+        geometry = geometry.select(keep)
+
+    response = HttpResponse(encode_geometry(geometry), content_type=PIT_BINARY_CONTENT_TYPE)
+    response['Cache-Control'] = 'no-cache'  # always revalidate via ETag
+    return response
+
+def pit_geometry_lod_view(request):
+    """API endpoint: precomputed detail levels (points, tolerance, max/mean deviation in metres)."""
+    levels = pit_geometry_levels(data_path('pit_design.str'))
+    return JsonResponse({'levels': levels})
+
+
+def geometry_cache_stats(request):
+    """API endpoint: hit / miss / build counters of the parsed-geometry cache (this process)."""
+    return JsonResponse(CACHE_STATS)
+
+
+# ==========================================
+# Pit Map Figures (Plotly JSON, cached)
+# ==========================================
+
+def _cached_figure_response(request, key_parts, build):
+    """
+    Figure JSON for key_parts, built once per key and kept in the Django cache.
+    key_parts holds every input of the figure (data versions, progress bucket, budgets),
+    so a new upload simply produces a new key.
+    """
+    digest = hashlib.sha1(':'.join(str(p) for p in key_parts).encode('utf-8')).hexdigest()
+    etag = f'"{digest}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    key = f'pit-figure:{digest}'
+    body = cache.get(key)
+    if body is None:
+        body = build().to_json()
+        cache.set(key, body, settings.PIT_FIGURE_CACHE_TIMEOUT)
+
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@gzip_page
+@block_model_errors
+def pit_progress_figure_api(request):
+    """
+    API endpoint: phase progress map as Plotly figure JSON.
+    ?progress=<0-100> (whole percent), plus the page's view / points / blocks / voxel options.
+    """
+    try:
+        progress = min(max(int(request.GET.get('progress', 0)), 0), 100)
+    except ValueError:
+        return JsonResponse({'error': 'progress must be an integer percentage'}, status=400)
+
+    str_file = data_path('pit_design.str')
+    blocks = _current_block_store(request, api=True)
+    show_voxels = request.GET.get('view') == 'voxels'
+    point_budget, block_budget, voxel_size = _point_budget(request), _block_budget(request), _voxel_size(request)
+
+    def build():
+        geometry, _ = load_pit_geometry_lod(str_file, point_budget)
+        strings = load_string_index(load_pit_geometry(str_file), geometry_version(str_file))
+        return build_progress_figure(blocks, geometry, progress / 100, show_voxels, block_budget, voxel_size, strings)
+
+    key_parts = (
+        'progress', geometry_version(str_file), blocks.version if blocks else None, progress,
+        'voxels' if show_voxels else 'blocks', point_budget, block_budget, voxel_size if show_voxels else '',
+    )
+    return _cached_figure_response(request, key_parts, build)
+
+
+@gzip_page
+def pit_design_figure_api(request):
+    """API endpoint: pit design preview (design store or pit_design.str) as Plotly figure JSON."""
+    point_budget = _point_budget(request)
+
+    store = load_design_store()
+    if store:
+        def build():
+            geometry, segment_source, _ = store.at_budget(point_budget)
+            groups = [
+                (f"{source['pit']} - {source['phase_name'] or 'Pit shell'}", geometry.select(segment_source == i))
+                for source, i in store.groups()
+            ]
+            return build_pit_map_figure(None, groups=groups)
+        return _cached_figure_response(request, ('design-store', store.key, point_budget), build)
+
+    str_file = data_path('pit_design.str')
+    if not os.path.exists(str_file):
+        return JsonResponse({'error': 'File not found'}, status=404)
+
+    def build():
+        geometry, _ = load_pit_geometry_lod(str_file, point_budget)
+        return build_pit_map_figure(geometry)
+    return _cached_figure_response(request, ('design', geometry_version(str_file), point_budget), build)
+
+
+@gzip_page
+@cache_control(public=True, max_age=31536000, immutable=True)
+def plotly_js(request, version):
+    """
+    plotly.min.js from the installed plotly package, served under a versioned URL
+    (see the plotly_js_url tag) so browsers download it once per release.
+    """
+    if version != get_plotlyjs_version():
+        return redirect('plotly-js', version=get_plotlyjs_version())
+    return HttpResponse(get_plotlyjs(), content_type='application/javascript')
+
+
+# ==========================================
+# Plan View Tiles (PNG pyramid, cached on disk)
+# ==========================================
+
+def plan_view(request):
+    """2D plan map of the pit strings and block status, served as PNG tiles for field tablets."""
+    str_path = data_path('pit_design.str')
+    extent = plan_extent(str_path) if os.path.exists(str_path) else None
+    return render(request, 'dashboard/plan_view.html', {
+        'extent': json.dumps(extent) if extent else None,
+        'max_zoom': settings.PLAN_TILE_MAX_ZOOM,
+        'error': None if extent else 'Upload a pit design (.str) to see the plan view.',
+    })
+
+
+def plan_tile(request, z, x, y):
+    """
+    One 256 px tile of the plan view. Rendered on first request (or after a block
+    under it changed) and then served from DATA_CACHE_DIR/tiles/.
+    """
+    str_path = data_path('pit_design.str')
+    if z > settings.PLAN_TILE_MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        return JsonResponse({'error': 'Tile out of range'}, status=404)
+    if not os.path.exists(str_path) or plan_extent(str_path) is None:
+        return JsonResponse({'error': 'File not found'}, status=404)
+
+    path = ensure_tile(str_path, z, x, y)
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        with open(path, 'rb') as f:
+            response = HttpResponse(f.read(), content_type='image/png')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'  # revalidate: a block change replaces the tile
+    return response
+
+
+# Max block changes returned per catch-up request (clients page with 'more')
+PIT_BLOCK_CHANGES_PAGE = 5000
+
+def pit_block_changes_api(request):
+    """
+    API endpoint: PitBlock delta feed for map clients (live pushes come from ws/pit-blocks/).
+    ?since=N -> latest id / status / removed tonnage of each block changed after version N.
+    No 'since' (or 0) -> snapshot of every block at the current version.
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return JsonResponse({'error': 'since must be an integer version'}, status=400)
+
+    if since <= 0:
+        # Read the version first: anything saved meanwhile is simply sent again next time
+        latest = PitBlockChange.objects.aggregate(version=Max('id'))['version'] or 0
+        blocks = list(PitBlock.objects.values('id', 'block_id', 'status', 'removed_tonnage'))
+        return JsonResponse({'version': latest, 'snapshot': True, 'more': False, 'blocks': blocks})
+
+    changes = list(PitBlockChange.objects.filter(id__gt=since).select_related('block')[:PIT_BLOCK_CHANGES_PAGE])
+    deltas = {}
+    for change in changes:
+        deltas[change.block_id] = change.as_delta()  # later changes win
+
+    return JsonResponse({
+        'version': changes[-1].id if changes else since,
+        'snapshot': False,
+        'more': len(changes) == PIT_BLOCK_CHANGES_PAGE,
+        'blocks': list(deltas.values()),
+    })
+
+
+MAX_CUTOFFS = 100
+
+def _cutoffs(request):
+    """
+    ?cutoffs= as a sorted tuple rounded to 0.01 g/t (DEFAULT_CUTOFFS if not given).
+    Raises ValueError unless it is at most MAX_CUTOFFS finite numbers from 0 to 1000.
+    """
+    if not request.GET.get('cutoffs'):
+        return DEFAULT_CUTOFFS
+    try:
+        values = [float(v) for v in request.GET['cutoffs'].split(',') if v.strip()]
+    except ValueError:
+        raise ValueError('cutoffs must be a comma separated list of numbers')
+    if not values or len(values) > MAX_CUTOFFS:
+        raise ValueError(f'cutoffs must list 1 to {MAX_CUTOFFS} values')
+    if not all(math.isfinite(v) and 0 <= v <= 1000 for v in values):
+        raise ValueError('cutoffs must be between 0 and 1000')
+    return tuple(sorted({round(v, 2) for v in values}))
+
+@block_model_errors
+def grade_tonnage_api(request):
+    """
+    API endpoint: grade-tonnage curves from the block model, whole pit and per phase.
+    ?cutoffs=0,0.5,1.0 overrides the default cutoff list (g/t).
+    ?grade=estimate uses the IDW sample estimate where there is one (see grade_estimation.py).
+    Phases are matched to MinePhase by csv_match_name (or name) to add the expected values.
+    """
+    try:
+        cutoffs = _cutoffs(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    blocks = _current_block_store(request, api=True)
+    if not blocks:
+        return JsonResponse({'version': None, 'cutoffs': list(cutoffs), 'pit': None, 'phases': []})
+
+    if request.GET.get('grade') == 'estimate':
+        result = grade_tonnage_curves(blocks, cutoffs, estimated_grade(blocks), ('estimate', estimate_key(blocks)))
+    else:
+        result = grade_tonnage_curves(blocks, cutoffs)
+
+    by_label = {}
+    for phase in MinePhase.objects.all():
+        by_label.setdefault((phase.csv_match_name or phase.name).strip().lower(), phase)
+
+    phases = []
+    for curve in result['phases']:
+        phase = by_label.get(curve['label'].lower())
+        phases.append({
+            **curve,
+            'phase_id': phase.id if phase else None,
+            'name': phase.name if phase else curve['label'],
+            'expected_grade': phase.expected_grade if phase else None,
+            'expected_tonnage': phase.expected_tonnage if phase else None,
+        })
+    return JsonResponse({**result, 'phases': phases})
+
+
+@block_model_errors
+def grade_estimate_api(request):
+    """
+    API endpoint: state of the IDW grade estimate from located OreSamples.
+    POST queues a re-run in the background (?full=1 for every block, otherwise only blocks
+    near new samples) and answers 202; 'run' is the state of the background run.
+    """
+    blocks = _current_block_store(request, api=True)
+    if not blocks:
+        return JsonResponse({'error': 'No block model uploaded'}, status=404)
+
+    if request.method == 'POST':
+        schedule_grade_estimate(full=request.GET.get('full') == '1')
+    run = grade_estimate_status()
+
+    estimate = load_grade_estimate(blocks)
+    estimated = np.isfinite(estimate) if estimate is not None else np.zeros(len(blocks), dtype=bool)
+    return JsonResponse({
+        'version': blocks.version,
+        'revision': estimate_key(blocks),
+        'run': run,
+        'samples': OreSample.objects.filter(x__isnull=False, y__isnull=False, z__isnull=False).count(),
+        'blocks_estimated': int(estimated.sum()),
+        'blocks_total': len(blocks),
+        'model_grade': round(float(np.mean(blocks.grade[estimated])), 3) if estimated.any() else None,
+        'estimated_grade': round(float(np.mean(estimate[estimated])), 3) if estimated.any() else None,
+        'radius': settings.GRADE_ESTIMATE_RADIUS,
+        'power': settings.GRADE_ESTIMATE_POWER,
+    }, status=202 if request.method == 'POST' else 200)
+
+
+# ==========================================
+# Design Volumes (planned tonnage from the pit strings)
+# ==========================================
+
+def _current_design_volumes(density=None, bench_height=None):
+    """Bench / phase volumes of the design store (tagged files) or else pit_design.str, cached per design version."""
+    store = load_design_store()
+    if store:
+        return design_volumes(store.key, store.geometry, store.segment_source, store.sources, density, bench_height)
+    str_file = data_path('pit_design.str')
+    if not os.path.exists(str_file):
+        return None
+    return design_volumes(geometry_version(str_file), load_pit_geometry(str_file), density=density, bench_height=bench_height)
+
+def _design_tonnage_by_phase():
+    """{MinePhase id: planned tonnes from its design files}"""
+    volumes = _current_design_volumes()
+    if not volumes:
+        return {}
+    return {p['phase_id']: p['tonnes'] for p in volumes['phases'] if p['phase_id']}
+
+def apply_design_tonnage(volumes, overwrite=False):
+    """
+    Writes the design tonnes into PhaseSchedule.planned_tonnage for the phases with design files,
+    only where none is set yet unless 'overwrite' (never replaces figures entered by hand). Returns the count.
+    """
+    if not volumes:
+        return 0
+    tonnes = {p['phase_id']: p['tonnes'] for p in volumes['phases'] if p['phase_id']}
+    schedules = PhaseSchedule.objects.filter(mine_phase_id__in=tonnes)
+    if not overwrite:
+        schedules = schedules.filter(planned_tonnage__lte=0)
+    for schedule in schedules:
+        schedule.planned_tonnage = tonnes[schedule.mine_phase_id]
+        schedule.current_progress = schedule.progress_percent()
+        schedule.update_status()
+        schedule.save()
+    return len(schedules)
+
+VOLUME_PARAMS = {
+    # ?name=: (min, max, step) - bounded and snapped, so each design or survey
+    # is only ever computed and cached for a limited set of values
+    'density': (0.5, 10.0, 0.01),  # t/m3
+    'bench': (1.0, 50.0, 0.5),  # m
+}
+
+def _volume_param(request, name):
+    """?density= / ?bench= as a float snapped to its step, None if not given. Raises ValueError when out of range."""
+    if not request.GET.get(name):
+        return None
+    low, high, step = VOLUME_PARAMS[name]
+    try:
+        value = float(request.GET[name])
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+    if not math.isfinite(value) or not low <= value <= high:
+        raise ValueError(f'{name} must be between {low:g} and {high:g}')
+    return round(round(value / step) * step, 2)
+
+def design_tonnage_api(request):
+    """
+    API endpoint: design volume and planned tonnage per bench and per phase, from the closed pit contours.
+    ?density=2.7 and ?bench=10 override the defaults. POST also writes the phase tonnes
+    into PhaseSchedule.planned_tonnage, replacing any value already there.
+    """
+    try:
+        density = _volume_param(request, 'density')
+        bench_height = _volume_param(request, 'bench')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    volumes = _current_design_volumes(density, bench_height)
+    if volumes is None:
+        return JsonResponse({'error': 'No pit design uploaded'}, status=404)
+
+    updated = apply_design_tonnage(volumes, overwrite=True) if request.method == 'POST' else None
+    return JsonResponse({**volumes, 'schedules_updated': updated})
+
+
+# ==========================================
+# Survey Volumes (mined volume from survey surfaces)
+# ==========================================
+
+def _survey_phases():
+    """([{'phase_id', 'phase_name', 'strings'}], design key): phase outlines for splitting survey cuts."""
+    store = load_design_store()
+    if not store:
+        return [], None
+    phases = []
+    for source, _ in store.groups():
+        if not source['phase_id'] or any(p['phase_id'] == source['phase_id'] for p in phases):
+            continue
+        geometry = store.select(phase_id=source['phase_id'])
+        phases.append({
+            'phase_id': source['phase_id'],
+            'phase_name': source['phase_name'],
+            'strings': load_string_index(geometry, f"{store.key}-phase-{source['phase_id']}"),
+        })
+    return phases, store.key
+
+def _survey_periods(density=None, bench_height=None):
+    """Mined volumes between each pair of consecutive surveys (cached per pair of surfaces)."""
+    surveys = list(SurveySurface.objects.all())
+    if len(surveys) < 2:
+        return []
+    phases, design_key = _survey_phases()
+    periods = []
+    for previous, survey in zip(surveys, surveys[1:]):
+        try:
+            volumes, _ = survey_volumes(previous.file_path, survey.file_path, phases, design_key, density, bench_height)
+        except (OSError, ValueError) as e:
+            print(f"Survey Volume Error ({previous} -> {survey}): {e}")
+            continue
+        periods.append({'previous': previous, 'survey': survey, 'volumes': volumes})
+    return periods
+
+def apply_survey_tonnage(periods):
+    """Writes the surveyed tonnes (all periods) into PhaseSchedule.surveyed_tonnage per phase. Returns the count."""
+    tonnes, surveyed_at = {}, {}
+    for period in periods:
+        for phase in period['volumes']['phases']:
+            if phase['phase_id']:
+                tonnes[phase['phase_id']] = tonnes.get(phase['phase_id'], 0) + phase['tonnes']
+                surveyed_at[phase['phase_id']] = period['survey'].survey_date
+    schedules = PhaseSchedule.objects.filter(mine_phase_id__in=tonnes)
+    for schedule in schedules:
+        schedule.surveyed_tonnage = round(tonnes[schedule.mine_phase_id], 1)
+        schedule.surveyed_at = surveyed_at[schedule.mine_phase_id]
+        schedule.current_progress = schedule.progress_percent()
+        schedule.update_status()
+        schedule.save()
+    return len(schedules)
+
+def upload_survey(request):
+    """
+    Uploads an end-of-period survey pickup and reports the volume mined since the
+    previous survey, per bench and per phase. Surveyed tonnes feed PhaseSchedule.
+    """
+    if request.method == 'POST':
+        form = SurveyUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            survey_date = form.cleaned_data['survey_date']
+            upload = form.cleaned_data['survey_file']
+            name = get_valid_filename(os.path.basename(upload.name))
+
+            folder = os.path.join(settings.PIT_DATA_DIR, 'surveys')
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{survey_date.isoformat()}_{name}")
+            with open(path, 'wb+') as dest:
+                for chunk in upload.chunks():
+                    dest.write(chunk)
+            SurveySurface.objects.update_or_create(file_path=path, defaults={'name': name, 'survey_date': survey_date})
+
+            periods = _survey_periods()
+            latest = next((p for p in periods if p['survey'].file_path == path), None)
+            if latest:
+                cut = latest['volumes']['cut']
+                messages.success(
+                    request,
+                    f"Survey {survey_date}: {cut['volume']:,.0f} m³ ({cut['tonnes']:,.0f} t) mined since {latest['previous'].survey_date}."
+                )
+            else:
+                messages.success(request, f"Survey {survey_date} uploaded as the base surface.")
+            updated = apply_survey_tonnage(periods)
+            if updated:
+                messages.info(request, f"Surveyed tonnage updated for {updated} phase(s).")
+            return redirect('survey_volumes')
+    else:
+        form = SurveyUploadForm()
+
+    periods = _survey_periods()
+    return render(request, 'dashboard/survey_volumes.html', {
+        'form': form,
+        'surveys': SurveySurface.objects.all(),
+        'periods': periods[::-1],
+        'latest': periods[-1] if periods else None,
+    })
+
+def survey_volumes_api(request):
+    """
+    API endpoint: volume mined in the period ending at survey ?survey=<id> (default: the latest),
+    per bench and per phase. ?density= and ?bench= override the defaults; ?cells=1 adds the
+    cut depth grid (m per cell, strided to at most ~250k cells). POST also writes the surveyed
+    tonnes of all periods into PhaseSchedule.
+    """
+    try:
+        density = _volume_param(request, 'density')
+        bench_height = _volume_param(request, 'bench')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    surveys = list(SurveySurface.objects.all())
+    if request.GET.get('survey'):
+        index = next((i for i, s in enumerate(surveys) if str(s.id) == request.GET['survey']), None)
+        if index is None:
+            return JsonResponse({'error': 'Unknown survey'}, status=404)
+    else:
+        index = len(surveys) - 1
+    if index < 1:
+        return JsonResponse({'error': 'Needs a previous survey to compare against'}, status=404)
+
+    previous, survey = surveys[index - 1], surveys[index]
+    phases, design_key = _survey_phases()
+    try:
+        volumes, cut_path = survey_volumes(previous.file_path, survey.file_path, phases, design_key, density, bench_height)
+    except (OSError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = {
+        'previous': {'id': previous.id, 'date': previous.survey_date, 'name': previous.name},
+        'survey': {'id': survey.id, 'date': survey.survey_date, 'name': survey.name},
+        **volumes,
+    }
+    if request.GET.get('cells'):
+        depth = np.load(cut_path, mmap_mode='r')
+        step = max(1, int(np.ceil(np.sqrt(depth.size / 250_000))))
+        cells = np.round(np.asarray(depth[::step, ::step], dtype=np.float64), 2)
+        response['cells'] = {
+            'step': step,
+            'depth': np.where(np.isnan(cells), None, cells).tolist(),
+        }
+    if request.method == 'POST':
+        response['schedules_updated'] = apply_survey_tonnage(_survey_periods())
+    return JsonResponse(response)
+
+
+# ==========================================
+# Sections & Bench Plans (slicing API)
+# ==========================================
+
+SECTION_MAX_WIDTH = 500.0  # m, corridor half-width
+
+@block_model_errors
+def section_api(request):
+    """
+    API endpoint: vertical cross-section along the plan line (x0, y0) -> (x1, y1).
+    ?width=10 corridor half-width in metres (default: one block), ?blocks= max blocks returned.
+    Returns string crossings (t, z) and corridor blocks (t, z, grade, ...), t = metres along the line.
+    """
+    try:
+        a = (float(request.GET['x0']), float(request.GET['y0']))
+        b = (float(request.GET['x1']), float(request.GET['y1']))
+        half_width = float(request.GET.get('width', settings.BLOCK_MODEL_DEFAULT_SIZE[0]))
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'x0, y0, x1, y1 (and optional width) must be numbers'}, status=400)
+    if not all(math.isfinite(v) for v in (*a, *b, half_width)):
+        return JsonResponse({'error': 'x0, y0, x1, y1 and width must be finite'}, status=400)
+    if a == b or not 0 < half_width <= SECTION_MAX_WIDTH:
+        return JsonResponse({'error': f'The section line needs two distinct points and a width from 0 to {SECTION_MAX_WIDTH:g} m'}, status=400)
+
+    blocks = _current_block_store(request, api=True)
+    geometry = load_pit_geometry(data_path('pit_design.str'))
+    result = vertical_section(blocks, geometry, a, b, half_width, max_blocks=_block_budget(request))
+    return JsonResponse({'version': blocks.version if blocks else None, **result})
+
+
+@block_model_errors
+def bench_plan_api(request):
+    """
+    API endpoint: bench plan at elevation ?z= (block centre level).
+    ?height= bench height in metres (default: from the bench index), ?blocks= max blocks returned.
+    Returns the pit string segments through the bench (x, y + offsets) and the bench blocks
+    (with in_pit: inside the pit outline at that bench).
+    """
+    try:
+        z = float(request.GET['z'])
+        height = float(request.GET['height']) if request.GET.get('height') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'z (and optional height) must be numbers'}, status=400)
+    if not math.isfinite(z) or (height is not None and not (math.isfinite(height) and height > 0)):
+        return JsonResponse({'error': 'z must be finite and height a positive number'}, status=400)
+
+    blocks = _current_block_store(request, api=True)
+    if height is None and blocks:
+        height = load_bench_index(blocks).bench_height
+    str_file = data_path('pit_design.str')
+    geometry = load_pit_geometry(str_file)
+    strings = load_string_index(geometry, geometry_version(str_file))
+    result = bench_plan(blocks, geometry, z, height, max_blocks=_block_budget(request), strings=strings)
+    return JsonResponse({'version': blocks.version if blocks else None, **result})
+
+
 # ==========================================
 # Processing & Loss Views
 # ==========================================
@@ -808,47 +1706,34 @@ def processing_loss_data(request):
             settings, _ = FinancialSettings.objects.get_or_create(scenario=scenario)
             price_per_gram = settings.gold_price
 
-        # 2. Get Ore Records
-        qs = ProductionRecord.objects.filter(material_type='ore').select_related('mine_phase')
+        # 2. Daily ore loss from the rollup: grams short of the phase's expected grade,
+        #    counted per record when written (blank grades count as 0.0, only Actual < Target is a loss)
+        qs = DailyProductionRollup.objects.filter(material_type='ore')
 
         # 3. Date Filtering
         if start:
-            qs = qs.filter(timestamp__date__gte=date.fromisoformat(start))
+            qs = qs.filter(day__gte=date.fromisoformat(start))
         if end:
-            qs = qs.filter(timestamp__date__lte=date.fromisoformat(end))
+            qs = qs.filter(day__lte=date.fromisoformat(end))
 
         buckets = {}
 
-        for r in qs:
-            # --- SAFETY CHECK (The Fix) ---
-            # Treat None (Blank) as 0.0 to prevent crashes
-            target = r.mine_phase.expected_grade if (r.mine_phase and r.mine_phase.expected_grade) else 0.0
-            actual = r.grade if r.grade is not None else 0.0
-            tonnage = r.tonnage if r.tonnage is not None else 0.0
-            
-            # Calculate Difference
-            grade_diff = target - actual
-            
-            # Only count it as a LOSS if Actual < Target (Underbreak/Dilution)
-            if grade_diff > 0 and tonnage > 0:
-                loss_grams = grade_diff * tonnage 
-                loss_kg = loss_grams / 1000.0
-                
-                # Revenue Loss = Grams Lost * Current Gold Price
-                loss_usd = loss_grams * price_per_gram
-            else:
-                loss_kg = 0
-                loss_usd = 0
+        for r in rollup_totals(qs, 'day'):
+            loss_grams = r['loss_grams']
+            loss_kg = loss_grams / 1000.0
+
+            # Revenue Loss = Grams Lost * Current Gold Price
+            loss_usd = loss_grams * price_per_gram
 
             # --- Aggregation Logic ---
             if period == 'weekly':
                 # Returns (Year, WeekNum, Day) -> slice to (Year, Week)
-                iso = r.timestamp.date().isocalendar()
+                iso = r['day'].isocalendar()
                 key = (iso[0], iso[1]) 
             elif period == 'monthly':
-                key = (r.timestamp.year, r.timestamp.month)
+                key = (r['day'].year, r['day'].month)
             else:
-                key = r.timestamp.date()
+                key = r['day']
 
             if key not in buckets:
                 buckets[key] = {'gold_lost_kg': 0.0, 'revenue_lost_usd': 0.0}
@@ -1031,14 +1916,18 @@ def add_phaseschedule(request):
                 defaults={'pit': pit_name, 'phase_number': 1, 'sequence_order': 1}
             )
 
-            # 2. Handle Tonnage (Manual vs Auto)
+            # 2. Handle Tonnage (Manual vs Design vs Auto)
+            design_tonnage = _design_tonnage_by_phase().get(phase.id)
             if manual_tonnage and manual_tonnage > 0:
                 # OPTION A: User typed a number manually
                 phase.expected_tonnage = manual_tonnage
                 phase.save()
                 final_tonnage = manual_tonnage
+            elif design_tonnage:
+                # OPTION B: Volume of the phase's design strings x density
+                final_tonnage = design_tonnage
             else:
-                # OPTION B: Auto-sync from CSV
+                # OPTION C: Auto-sync from CSV
                 auto_update_phase_targets() # Run the sync
                 phase.refresh_from_db()     # Reload to get the synced number
                 final_tonnage = phase.expected_tonnage or 0
@@ -1579,6 +2468,28 @@ def schedule_dashboard_view(request):
     }
     return render(request, 'dashboard/schedule_view.html', context)
 
+def _design_inventory(request):
+    """Ore / waste tonnes and ore grade of the blocks inside the pit outline at their bench (None without data)."""
+    str_file = data_path('pit_design.str')
+    blocks = _current_block_store(request)
+    geometry = load_pit_geometry(str_file) if os.path.exists(str_file) else None
+    if not blocks or not geometry:
+        return None
+
+    inside = np.asarray(blocks_in_pit(blocks, geometry, geometry_version(str_file)))
+    tonnes = np.asarray(blocks.tonnes, dtype=np.float64)
+    ore = inside & (np.asarray(blocks.material) == ORE)
+    ore_tonnes = float(tonnes[ore].sum())
+    waste_tonnes = float(tonnes[inside & ~ore].sum())
+    return {
+        'ore_tonnes': ore_tonnes,
+        'waste_tonnes': waste_tonnes,
+        'grade': float((tonnes[ore] * blocks.grade[ore]).sum() / ore_tonnes) if ore_tonnes else 0.0,
+        'strip_ratio': waste_tonnes / ore_tonnes if ore_tonnes else None,
+        'blocks': int(inside.sum()),
+        'blocks_total': len(blocks),
+    }
+
 def reconciliation_view(request):
     """
     Reconciliation: Plan vs Actual.
@@ -1615,16 +2526,16 @@ def reconciliation_view(request):
         else:
             report[p]['plan_ore'] += mass
 
-    # 3. LOAD ACTUALS
-    act_rows = ProductionRecord.objects.all()
-    
+    # 3. LOAD ACTUALS (monthly totals from the daily rollup)
+    act_rows = rollup_totals(DailyProductionRollup.objects.all(), 'material_type', month=ExtractMonth('day'))
+
     for row in act_rows:
-        p = row.timestamp.month
+        p = row['month']
         if p not in report: 
             report[p] = {'plan_ore': 0, 'plan_waste': 0, 'act_ore': 0, 'act_waste': 0}
 
-        name = row.material_type.lower()
-        tonnage = row.tonnage if row.tonnage else 0.0
+        name = row['material_type'].lower()
+        tonnage = row['tonnage']
 
         if 'waste' in name:
             report[p]['act_waste'] += tonnage
@@ -1663,10 +2574,14 @@ def reconciliation_view(request):
                 'status': 'Behind Schedule' if var < 0 else 'On Track'
             })
 
-    # 5. SEND CONTEXT (Keys match the template logic)
+    # 5. DESIGN INVENTORY (block model inside the pit strings, cached per block + design version)
+    design_inventory = _design_inventory(request)
+
+    # 6. SEND CONTEXT (Keys match the template logic)
     return render(request, 'dashboard/reconciliation.html', {
         'table': reconciliation_table,   # Matches {% for row in table %}
-        'scenario': scenario
+        'scenario': scenario,
+        'design_inventory': design_inventory,
     })
     """
 from django.http import HttpResponse
@@ -2026,13 +2941,19 @@ def daily_financials_view(request):
     # 3. Calculate Daily Financials
     daily_data = []
     feeds = DailyPlantFeed.objects.all().order_by('-date')
-    
+
+    # Mined ore per feed day from the rollup (one query for all days)
+    mined = {
+        row['day']: row
+        for row in rollup_totals(DailyProductionRollup.objects.filter(material_type='ore', day__in=[f.date for f in feeds]), 'day')
+    }
+
     for feed in feeds:
-        # Find mining data for this specific date
-        mining_rec = ProductionRecord.objects.filter(timestamp__date=feed.date).first()
+        # Mining data for this specific date
+        mining_rec = mined.get(feed.date)
         
-        # If we mined that day, use the mined grade. If not, assume average 1.5g/t
-        grade = mining_rec.grade if (mining_rec and mining_rec.grade) else 1.5
+        # If we mined that day, use the mined (tonnage-weighted) grade. If not, assume average 1.5g/t
+        grade = mining_rec['metal'] / mining_rec['graded_tonnage'] if (mining_rec and mining_rec['graded_tonnage'] and mining_rec['metal']) else 1.5
         
         # Calculations using DYNAMIC settings
         gold_produced = feed.tonnes_fed * grade * RECOVERY
@@ -2046,7 +2967,7 @@ def daily_financials_view(request):
             'grade': grade,
             'revenue': revenue,
             'profit': profit,
-            'source': mining_rec.source if mining_rec else "Stockpile/Unknown"
+            'source': "Mining" if mining_rec else "Stockpile/Unknown"
         })
 
     context = {
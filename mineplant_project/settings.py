@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'dashboard.middleware.DatasetVersionMiddleware',
 ]
 
 ROOT_URLCONF = 'mineplant_project.urls'
@@ -82,6 +83,9 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Live dashboard topics (ws/live/): each client gets at most one merged update per interval (seconds)
+LIVE_UPDATE_INTERVAL = 1.0
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -146,3 +150,47 @@ DEFAULT_GRADE_GPT = 1.2 # g/t
 DEFAULT_RECOVERY = 0.92 # 92%
 DEFAULT_GOLD_PRICE_PER_KG = 60000.0 # example USD/kg
 
+
+# Uploaded pit design / block model files, and the binary caches built from them
+PIT_DATA_DIR = BASE_DIR / 'dashboard' / 'static' / 'data'
+DATA_CACHE_DIR = BASE_DIR / 'data_cache'
+
+# Max pit-string vertices sent to the 3D map (overridable with ?points=)
+PIT_MAP_POINT_BUDGET = 20000
+
+# Max block markers on the 3D map, sampled by grade class (overridable with ?blocks=)
+PIT_MAP_BLOCK_BUDGET = 30000
+
+# Voxel edge (m) for the aggregated map view, ?view=voxels (overridable with ?voxel=)
+PIT_MAP_VOXEL_SIZE = 20.0
+
+# Seconds a built pit map figure (JSON) stays in the cache; keys include the data versions
+PIT_FIGURE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Plan view PNG tile pyramid: deepest zoom served, and zooms rendered up front after an upload
+PLAN_TILE_MAX_ZOOM = 6
+PLAN_TILE_PRERENDER_ZOOM = 2
+
+# Inverse-distance grade estimation from located OreSamples: search radius (m) and distance power
+GRADE_ESTIMATE_RADIUS = 50.0
+GRADE_ESTIMATE_POWER = 2.0
+
+# Bench height (m) used to report design volumes / planned tonnage per bench
+DESIGN_BENCH_HEIGHT = 10.0
+# Phase design files are full pit shells, each containing the earlier phases of its pit:
+# a phase's tonnage is its shell minus the previous one (False = files are separate solids)
+DESIGN_PHASE_SHELLS_NESTED = True
+
+# Survey surfaces: grid cell (m) the pickups are rasterized on, and the widest gap (m) filled between survey strings
+SURVEY_GRID_CELL = 2.0
+SURVEY_FILL_DISTANCE = 30.0
+
+# Resumable chunked uploads of dataset files: default chunk size and largest file accepted (bytes)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+# Seconds after which a queued / ingesting upload no process is working on counts as interrupted
+UPLOAD_INGEST_TIMEOUT = 60 * 60
+
+# Block model defaults when the CSV has no density / block size columns
+BLOCK_MODEL_DEFAULT_DENSITY = 2.7  # t/m3
+BLOCK_MODEL_DEFAULT_SIZE = (5.0, 5.0, 5.0)  # dx, dy, dz in metres